@@ -1,18 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from sqlalchemy import func, tuple_, cast, Integer
+from app.db.session import SessionLocal, pool_status
 from app.db import models
-from app.db.crud import get_conversation_by_id, get_messages_by_conversation_id, close_inactive_conversations
-import pandas as pd
-import io
-from datetime import datetime
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-import html
+from app.db.crud import get_conversation_by_id, get_conversation_with_effective_state, effective_conversation_columns
+from app.core import metrics, csv_export, pdf_reports, report_format, bulk_export, analytics, conversation_cache, user_queue, inbound_queue
+from datetime import datetime, timedelta
+import base64
+import json
 from typing import Optional
 from uuid import UUID
 
@@ -27,11 +24,62 @@ def get_db():
         db.close()
 
 
+MESSAGES_BATCH_MAX = 500
+
+
+def serialize_message(msg, conversation_business_type):
+    return {
+        "id": str(msg.id),
+        "conversation_id": str(msg.conversation_id),
+        "user_number": msg.user_number,
+        "content": msg.content,
+        "from_user": msg.from_user,
+        "business_type": msg.business_type,
+        "conversation_business_type": conversation_business_type,
+        "timestamp": msg.timestamp.isoformat() if msg.timestamp else None
+    }
+
+
+def parse_conversation_ids(conversation_ids: str):
+    try:
+        ids = [UUID(value.strip())
+               for value in conversation_ids.split(',') if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="conversation_ids inválido")
+    if len(ids) > MESSAGES_BATCH_MAX:
+        raise HTTPException(
+            status_code=400, detail=f"Máximo de {MESSAGES_BATCH_MAX} conversas por chamada")
+    return ids
+
+
 @router.get("/admin/messages")
 def list_messages(
-    conversation_id: UUID,
+    conversation_id: Optional[UUID] = None,
+    conversation_ids: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
+    """
+    Mensagens de uma conversa (conversation_id) ou de várias de uma vez
+    (conversation_ids=id1,id2,...), agrupadas por conversa em uma consulta
+    """
+    if conversation_ids:
+        ids = parse_conversation_ids(conversation_ids)
+        rows = db.query(models.Message, models.Conversation.business_type).join(
+            models.Conversation, models.Message.conversation_id == models.Conversation.id
+        ).filter(
+            models.Message.conversation_id.in_(ids)
+        ).order_by(models.Message.conversation_id, models.Message.timestamp.asc()).all()
+
+        grouped = {str(conversation): [] for conversation in ids}
+        for msg, conversation_business_type in rows:
+            grouped[str(msg.conversation_id)].append(
+                serialize_message(msg, conversation_business_type or 'unknown'))
+        return {"messages": grouped}
+
+    if conversation_id is None:
+        raise HTTPException(
+            status_code=400, detail="Informe conversation_id ou conversation_ids")
+
     messages = db.query(models.Message).filter(
         models.Message.conversation_id == conversation_id
     ).order_by(models.Message.timestamp.asc()).all()
@@ -44,221 +92,465 @@ def list_messages(
     # Pega o business_type/status da conversa
     conversation_business_type = conversation.business_type if conversation else 'unknown'
 
-    result = []
-    for msg in messages:
-        result.append({
-            "id": str(msg.id),
-            "conversation_id": str(msg.conversation_id),
-            "user_number": msg.user_number,
-            "content": msg.content,
-            "from_user": msg.from_user,
-            "business_type": msg.business_type,
-            "conversation_business_type": conversation_business_type,
-            "timestamp": msg.timestamp.isoformat() if msg.timestamp else None
-        })
-    return result
+    return [serialize_message(msg, conversation_business_type) for msg in messages]
 
 
-@router.get("/admin/conversations")
-def list_conversations(
-    user_number: Optional[str] = None,
-    status: Optional[str] = None,
-    needs_human: Optional[bool] = None,
-    sentiment: Optional[str] = None,
+MESSAGES_PAGE_LIMIT = 5000
+MESSAGES_PAGE_MAX = 50000
+
+
+def encode_cursor(timestamp, row_id):
+    """Cursor opaco com a chave (timestamp, id) do último item da página"""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(
+            cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), UUID(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+@router.get("/admin/messages/all")
+def list_all_messages(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    business_type: Optional[str] = None,
+    from_user: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    limit: int = MESSAGES_PAGE_LIMIT,
+    include_content: bool = True,
+    format: str = "rows",
     db: Session = Depends(get_db)
 ):
-    close_inactive_conversations(db)
-    query = db.query(models.Conversation)
+    """
+    Mensagens de todas as conversas com o business_type da conversa, em uma
+    consulta por página (ordem timestamp, id). Use next_cursor para a próxima
+    página; format=columns devolve uma lista por campo em vez de objetos.
+    """
+    limit = max(1, min(limit, MESSAGES_PAGE_MAX))
+    columns = [
+        models.Message.id,
+        models.Message.conversation_id,
+        models.Message.user_number,
+        models.Message.from_user,
+        models.Message.business_type,
+        models.Conversation.business_type.label('conversation_business_type'),
+        models.Message.timestamp
+    ]
+    if include_content:
+        columns.append(models.Message.content)
+
+    query = db.query(*columns).join(
+        models.Conversation, models.Message.conversation_id == models.Conversation.id
+    )
+
+    if start_date:
+        query = query.filter(models.Message.timestamp >= start_date)
+    if end_date:
+        query = query.filter(models.Message.timestamp <= end_date)
+    if business_type:
+        query = query.filter(models.Conversation.business_type == business_type)
+    if from_user is not None:
+        query = query.filter(models.Message.from_user == from_user)
+    if cursor:
+        query = query.filter(tuple_(models.Message.timestamp, models.Message.id) >
+                             tuple_(*decode_cursor(cursor)))
+
+    rows = query.order_by(
+        models.Message.timestamp.asc(), models.Message.id.asc()
+    ).limit(limit).all()
+
+    next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id) \
+        if len(rows) == limit else None
+
+    fields = [column.key for column in columns]
+    serialized = [{
+        "id": str(row.id),
+        "conversation_id": str(row.conversation_id),
+        "user_number": row.user_number,
+        "from_user": row.from_user,
+        "business_type": row.business_type,
+        "conversation_business_type": row.conversation_business_type or 'unknown',
+        "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+        **({"content": row.content} if include_content else {})
+    } for row in rows]
+
+    if format == "columns":
+        return {
+            "columns": {field: [item[field] for item in serialized] for field in fields},
+            "count": len(serialized),
+            "next_cursor": next_cursor
+        }
+
+    return {"messages": serialized, "count": len(serialized), "next_cursor": next_cursor}
+
+
+def iso(value):
+    return value.isoformat() if value else None
+
+
+# Campos disponíveis em fields= (coluna, serialização)
+CONVERSATION_FIELDS = {
+    "id": (models.Conversation.id, str),
+    "user_number": (models.Conversation.user_number, None),
+    "start_time": (models.Conversation.start_time, iso),
+    "end_time": (models.Conversation.end_time, iso),
+    "business_type": (models.Conversation.business_type, None),
+    "status": (models.Conversation.status, None),
+    "needs_human": (models.Conversation.needs_human, None),
+    "sentiment": (models.Conversation.sentiment, None),
+    "sentiment_score": (models.Conversation.sentiment_score, None),
+    "last_sentiment_update": (models.Conversation.last_sentiment_update, iso),
+    "last_message_at": (models.Conversation.last_message_at, iso),
+    "llm_calls": (models.Conversation.llm_calls, lambda v: v or 0),
+    "llm_seconds": (models.Conversation.llm_seconds, lambda v: v or 0.0),
+    "prompt_tokens": (models.Conversation.prompt_tokens, lambda v: v or 0),
+    "completion_tokens": (models.Conversation.completion_tokens, lambda v: v or 0),
+    "cached_tokens": (models.Conversation.cached_tokens, lambda v: v or 0),
+}
+
+CONVERSATIONS_PAGE_LIMIT = 100
+CONVERSATIONS_PAGE_MAX = 1000
+
+
+def estimate_count(db: Session, query):
+    """Linhas estimadas pelo planejador do Postgres (sem percorrer a tabela)"""
+    statement = query.statement.compile(dialect=db.get_bind().dialect)
+    plan = db.connection().exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {statement}", statement.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def message_stats_by_conversation(db: Session, conversation_ids):
+    """Contagens de mensagens de várias conversas em uma consulta agrupada"""
+    if not conversation_ids:
+        return {}
+    rows = db.query(
+        models.Message.conversation_id,
+        func.count(models.Message.id).label('total'),
+        func.count(models.Message.id).filter(
+            models.Message.from_user == True).label('from_user'),  # noqa: E712
+        func.max(models.Message.timestamp).label('last_message_at')
+    ).filter(
+        models.Message.conversation_id.in_(conversation_ids)
+    ).group_by(models.Message.conversation_id).all()
+
+    return {
+        row.conversation_id: {
+            "total": row.total,
+            "from_user": row.from_user,
+            "from_bot": row.total - row.from_user,
+            "last_message_at": iso(row.last_message_at)
+        }
+        for row in rows
+    }
 
+
+def filter_conversations(query, status_column, user_number=None, status=None, needs_human=None,
+                         sentiment=None, business_type=None, start_date=None, end_date=None):
+    """Filtros da listagem de conversas (também usados na exportação em lote)"""
     if user_number:
         query = query.filter(models.Conversation.user_number == user_number)
     if status:
-        query = query.filter(models.Conversation.status == status)
+        query = query.filter(status_column == status)
     if needs_human is not None:
         query = query.filter(models.Conversation.needs_human == needs_human)
     if sentiment:
         query = query.filter(models.Conversation.sentiment == sentiment)
+    if business_type:
+        query = query.filter(models.Conversation.business_type == business_type)
+    if start_date:
+        query = query.filter(models.Conversation.start_time >= start_date)
+    if end_date:
+        query = query.filter(models.Conversation.start_time <= end_date)
+    return query
 
-    conversations = query.order_by(models.Conversation.start_time.desc()).all()
 
-    result = []
-    for conv in conversations:
-        result.append({
-            "id": str(conv.id),
-            "user_number": conv.user_number,
-            "start_time": conv.start_time.isoformat() if conv.start_time else None,
-            "end_time": conv.end_time.isoformat() if conv.end_time else None,
-            "business_type": conv.business_type,
-            "status": conv.status,
-            "needs_human": conv.needs_human,
-            "sentiment": conv.sentiment,
-            "sentiment_score": conv.sentiment_score,
-            "last_sentiment_update": conv.last_sentiment_update.isoformat() if conv.last_sentiment_update else None
-        })
+@router.get("/admin/conversations")
+def list_conversations(
+    user_number: Optional[str] = None,
+    status: Optional[str] = None,
+    needs_human: Optional[bool] = None,
+    sentiment: Optional[str] = None,
+    business_type: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = CONVERSATIONS_PAGE_LIMIT,
+    count: str = "none",
+    include_stats: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Conversas mais recentes primeiro, paginadas por cursor em (start_time, id).
+    fields= limita as colunas lidas (ex.: fields=id,user_number,status);
+    count=estimate devolve o total estimado pelo planejador e count=exact o
+    total exato (percorre as linhas filtradas). include_stats=true acrescenta
+    message_stats (total, do cliente, do bot, última mensagem) de cada conversa
+    da página. Somente leitura: conversas inativas aparecem como 'closed'
+    mesmo antes do job de expiração gravar.
+    """
+    status_column, end_time_column = effective_conversation_columns()
+    field_columns = {
+        **CONVERSATION_FIELDS,
+        "status": (status_column, None),
+        "end_time": (end_time_column, iso),
+    }
 
-    return result
+    selected = [f.strip() for f in fields.split(',') if f.strip()] if fields \
+        else list(field_columns)
+    unknown_fields = [f for f in selected if f not in field_columns]
+    if unknown_fields:
+        raise HTTPException(
+            status_code=400, detail=f"Campos inválidos: {', '.join(unknown_fields)}")
+    if count not in ("none", "estimate", "exact"):
+        raise HTTPException(status_code=400, detail="count inválido")
+    limit = max(1, min(limit, CONVERSATIONS_PAGE_MAX))
+
+    # id e start_time sempre vêm para montar o cursor
+    columns = [field_columns[f][0].label(f) for f in selected]
+    columns += [models.Conversation.id.label('_id'),
+                models.Conversation.start_time.label('_start_time')]
+    query = filter_conversations(
+        db.query(*columns), status_column, user_number, status, needs_human,
+        sentiment, business_type, start_date, end_date)
+
+    total = None
+    if count == "estimate":
+        total = estimate_count(db, query.with_entities(models.Conversation.id))
+    elif count == "exact":
+        total = query.with_entities(func.count(models.Conversation.id)).scalar()
+
+    if cursor:
+        query = query.filter(tuple_(models.Conversation.start_time, models.Conversation.id) <
+                             tuple_(*decode_cursor(cursor)))
+
+    rows = query.order_by(
+        models.Conversation.start_time.desc(), models.Conversation.id.desc()
+    ).limit(limit).all()
+
+    next_cursor = encode_cursor(rows[-1]._start_time, rows[-1]._id) \
+        if len(rows) == limit else None
+
+    conversations = []
+    for row in rows:
+        item = {}
+        for field in selected:
+            value = getattr(row, field)
+            serializer = field_columns[field][1]
+            item[field] = serializer(value) if serializer else value
+        conversations.append(item)
+
+    if include_stats:
+        stats = message_stats_by_conversation(db, [row._id for row in rows])
+        for row, item in zip(rows, conversations):
+            item["message_stats"] = stats.get(row._id, {
+                "total": 0, "from_user": 0, "from_bot": 0, "last_message_at": None})
+
+    return {
+        "conversations": conversations,
+        "count": len(conversations),
+        "next_cursor": next_cursor,
+        "total": total,
+        "total_is_estimate": count == "estimate"
+    }
 
 
-def format_timestamp_br(timestamp):
-    """Formata timestamp para padrão brasileiro"""
-    if timestamp:
-        try:
-            if hasattr(timestamp, 'strftime'):
-                return timestamp.strftime("%d/%m/%Y %H:%M:%S")
-            else:
-                dt = datetime.fromisoformat(
-                    str(timestamp).replace('Z', '+00:00'))
-                return dt.strftime("%d/%m/%Y %H:%M:%S")
-        except:
-            return str(timestamp)
-    return "Não informado"
-
-
-def translate_business_type(business_type):
-    """Traduz business_type para português"""
-    mapping = {
-        "delivery": "Delivery",
-        "mecanica": "Mecânica",
-        "farmacia": "Farmácia",
-        "unknown": "Indefinido"
-    }
-    return mapping.get(str(business_type).lower(), business_type)
+@router.get("/admin/analytics/summary")
+def analytics_summary(
+    user_number: Optional[str] = None,
+    status: Optional[str] = None,
+    needs_human: Optional[bool] = None,
+    sentiment: Optional[str] = None,
+    business_type: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Resumo do dashboard (totais por status, tipo de negócio e sentimento,
+    taxa de needs_human, mensagens, tempo médio de resposta e distribuição
+    de duração) com os mesmos filtros de /admin/conversations, em uma
+    consulta agrupada sobre os contadores de cada conversa.
+    """
+    status_column, end_time_column = effective_conversation_columns()
+    dimensions, aggregates = analytics.summary_columns(status_column, end_time_column)
+    rows = filter_conversations(
+        db.query(*dimensions, *aggregates), status_column, user_number, status,
+        needs_human, sentiment, business_type, start_date, end_date
+    ).group_by(*dimensions).all()
+    return analytics.summarize(rows)
 
 
-def translate_status(status):
-    """Traduz status para português"""
-    mapping = {
-        "open": "Aberta",
-        "closed": "Fechada"
-    }
-    return mapping.get(str(status).lower(), status)
+@router.get("/admin/conversations/export/zip")
+def export_conversations_zip(
+    user_number: Optional[str] = None,
+    status: Optional[str] = None,
+    needs_human: Optional[bool] = None,
+    sentiment: Optional[str] = None,
+    business_type: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    formats: str = "csv"
+):
+    """
+    ZIP com um arquivo por conversa (formats=csv, pdf ou csv,pdf), com os
+    mesmos filtros de /admin/conversations. Os arquivos são gerados em
+    paralelo no pool de processos e o ZIP sai em streaming.
+    """
+    kinds = [f.strip() for f in formats.split(',') if f.strip()]
+    if not kinds or any(kind not in bulk_export.FORMATS for kind in kinds):
+        raise HTTPException(status_code=400, detail="formats inválido (csv, pdf)")
+
+    status_column, end_time_column = effective_conversation_columns()
+
+    def build_query(db):
+        # Status e end_time efetivos, os mesmos do filtro e de /admin/conversations
+        return filter_conversations(
+            db.query(models.Conversation, status_column.label('status'),
+                     end_time_column.label('end_time')),
+            status_column, user_number, status, needs_human, sentiment,
+            business_type, start_date, end_date
+        ).order_by(models.Conversation.start_time.desc(), models.Conversation.id.desc())
+
+    filename = f"conversas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return StreamingResponse(
+        bulk_export.stream_zip(build_query, kinds),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
 
 
 @router.get("/admin/conversations/{conversation_id}/download/csv")
-async def download_conversation_csv(
+def download_conversation_csv(
     conversation_id: str,
     db: Session = Depends(get_db)
 ):
-    """Download da conversa em formato CSV"""
-    try:
-        # Buscar conversa
-        conversation = get_conversation_by_id(db, conversation_id)
-        if not conversation:
-            raise HTTPException(
-                status_code=404, detail="Conversa não encontrada")
-
-        # Buscar mensagens
-        messages = get_messages_by_conversation_id(db, conversation_id)
-
-        # Preparar dados para CSV
-        csv_data = []
+    """Download da conversa em formato CSV (streaming)"""
+    found = get_conversation_with_effective_state(db, conversation_id)
+    if not found:
+        raise HTTPException(
+            status_code=404, detail="Conversa não encontrada")
+    conversation, effective = found
+
+    # Nome do arquivo
+    filename = f"conversa_{conversation.user_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+
+    # Retornar como download
+    return StreamingResponse(
+        csv_export.stream_conversation_csv(conversation, effective),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+@router.get("/admin/messages/export/csv")
+def export_messages_csv(
+    conversation_ids: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    business_type: Optional[str] = None,
+    from_user: Optional[bool] = None
+):
+    """
+    Exporta em CSV as mensagens de várias conversas (conversation_ids) e/ou de
+    um período, em streaming direto do banco (memória constante)
+    """
+    ids = parse_conversation_ids(conversation_ids) if conversation_ids else None
+    if not ids and not (start_date or end_date):
+        raise HTTPException(
+            status_code=400, detail="Informe conversation_ids ou start_date/end_date")
 
-        # Adicionar informações da conversa
-        csv_data.append({
-            'Tipo': 'INFORMAÇÕES DA CONVERSA',
-            'Remetente': '',
-            'Conteúdo': '',
-            'Data/Hora': '',
-            'ID': ''
-        })
+    statement = csv_export.messages_export_statement(
+        ids, start_date, end_date, business_type, from_user)
+    filename = f"mensagens_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
 
-        csv_data.append({
-            'Tipo': 'Número do Cliente',
-            'Remetente': conversation.user_number,
-            'Conteúdo': '',
-            'Data/Hora': '',
-            'ID': ''
-        })
+    return StreamingResponse(
+        csv_export.stream_messages_csv(statement),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
 
-        csv_data.append({
-            'Tipo': 'Tipo de Negócio',
-            'Remetente': translate_business_type(conversation.business_type),
-            'Conteúdo': '',
-            'Data/Hora': '',
-            'ID': ''
-        })
 
-        csv_data.append({
-            'Tipo': 'Status',
-            'Remetente': translate_status(conversation.status),
-            'Conteúdo': '',
-            'Data/Hora': '',
-            'ID': ''
-        })
+def submit_conversation_pdf(db: Session, conversation_id: str):
+    """Enfileira o PDF da versão atual da conversa; retorna (conversa, job_id)"""
+    found = get_conversation_with_effective_state(db, conversation_id)
+    if not found:
+        raise HTTPException(
+            status_code=404, detail="Conversa não encontrada")
+    # Status e fim efetivos: mesmo cabeçalho e mesmo job_id da exportação em lote
+    conversation, effective = found
+
+    def load_messages():
+        return [tuple(row) for row in db.query(
+            models.Message.from_user, models.Message.content, models.Message.timestamp
+        ).filter(
+            models.Message.conversation_id == conversation.id
+        ).order_by(models.Message.timestamp.asc(), models.Message.id.asc())]
+
+    job_id = pdf_reports.submit(
+        report_format.conversation_snapshot(conversation, effective), load_messages)
+    return conversation, job_id
+
+
+def pdf_download_response(path, conversation):
+    user_number = conversation.user_number if conversation else 'desconhecido'
+    filename = f"conversa_{user_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    return FileResponse(
+        path,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+@router.post("/admin/conversations/{conversation_id}/pdf-jobs")
+def create_pdf_job(
+    conversation_id: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Enfileira a geração do PDF da conversa. Se a versão atual já estiver em
+    cache o job volta como done; senão acompanhe por GET /admin/pdf-jobs/{job_id}
+    """
+    _, job_id = submit_conversation_pdf(db, conversation_id)
+    return pdf_reports.job_status(job_id)
 
-        csv_data.append({
-            'Tipo': 'Precisa Humano',
-            'Remetente': 'Sim' if conversation.needs_human else 'Não',
-            'Conteúdo': '',
-            'Data/Hora': '',
-            'ID': ''
-        })
 
-        csv_data.append({
-            'Tipo': 'Início da Conversa',
-            'Remetente': format_timestamp_br(conversation.start_time),
-            'Conteúdo': '',
-            'Data/Hora': '',
-            'ID': ''
-        })
+def pdf_job_status_or_404(job_id: str):
+    if not pdf_reports.JOB_ID.match(job_id):
+        raise HTTPException(status_code=400, detail="job_id inválido")
+    status = pdf_reports.job_status(job_id)
+    if status["status"] == "unknown":
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return status
 
-        if conversation.end_time:
-            csv_data.append({
-                'Tipo': 'Fim da Conversa',
-                'Remetente': format_timestamp_br(conversation.end_time),
-                'Conteúdo': '',
-                'Data/Hora': '',
-                'ID': ''
-            })
-
-        # Linha separadora
-        csv_data.append({
-            'Tipo': '',
-            'Remetente': '',
-            'Conteúdo': '',
-            'Data/Hora': '',
-            'ID': ''
-        })
 
-        csv_data.append({
-            'Tipo': 'MENSAGENS DA CONVERSA',
-            'Remetente': '',
-            'Conteúdo': '',
-            'Data/Hora': '',
-            'ID': ''
-        })
+@router.get("/admin/pdf-jobs/{job_id}")
+def get_pdf_job(job_id: str):
+    """Estado do job de PDF: running, done ou failed"""
+    return pdf_job_status_or_404(job_id)
 
-        # Adicionar mensagens
-        for msg in sorted(messages, key=lambda x: x.timestamp):
-            csv_data.append({
-                'Tipo': 'Mensagem',
-                'Remetente': 'Cliente' if msg.from_user else 'Bot',
-                'Conteúdo': msg.content,
-                'Data/Hora': format_timestamp_br(msg.timestamp),
-                'ID': str(msg.id)
-            })
-
-        # Criar DataFrame
-        df = pd.DataFrame(csv_data)
-
-        # Gerar CSV
-        output = io.StringIO()
-        df.to_csv(output, index=False, encoding='utf-8-sig')
-        output.seek(0)
-
-        # Nome do arquivo
-        filename = f"conversa_{conversation.user_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-
-        # Retornar como download
-        return StreamingResponse(
-            io.BytesIO(output.getvalue().encode('utf-8-sig')),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
 
-    except Exception as e:
+@router.get("/admin/pdf-jobs/{job_id}/download")
+def download_pdf_job(
+    job_id: str,
+    db: Session = Depends(get_db)
+):
+    """Download do PDF de um job concluído"""
+    status = pdf_job_status_or_404(job_id)
+    if status["status"] != "done":
         raise HTTPException(
-            status_code=500, detail=f"Erro ao gerar CSV: {str(e)}")
+            status_code=409, detail=f"PDF ainda não disponível ({status['status']})")
+
+    conversation = get_conversation_by_id(db, job_id[:36])
+    return pdf_download_response(pdf_reports.cache_path(job_id), conversation)
 
 
 @router.get("/admin/conversations/{conversation_id}/download/pdf")
@@ -266,142 +558,17 @@ async def download_conversation_pdf(
     conversation_id: str,
     db: Session = Depends(get_db)
 ):
-    """Download da conversa em formato PDF"""
+    """Download da conversa em formato PDF (gerado no pool de processos, com cache)"""
+    conversation, job_id = await run_in_threadpool(
+        submit_conversation_pdf, db, conversation_id)
     try:
-        # Buscar conversa
-        conversation = get_conversation_by_id(db, conversation_id)
-        if not conversation:
-            raise HTTPException(
-                status_code=404, detail="Conversa não encontrada")
-
-        # Buscar mensagens
-        messages = get_messages_by_conversation_id(db, conversation_id)
-
-        # Criar PDF em memória
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*inch)
-
-        # Estilos
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            spaceAfter=30,
-            textColor=colors.HexColor('#2c3e50')
-        )
-
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=14,
-            spaceAfter=12,
-            textColor=colors.HexColor('#34495e')
-        )
-
-        message_user_style = ParagraphStyle(
-            'MessageUser',
-            parent=styles['Normal'],
-            fontSize=10,
-            spaceAfter=8,
-            leftIndent=20,
-            backgroundColor=colors.HexColor('#e3f2fd'),
-            borderPadding=8
-        )
-
-        message_bot_style = ParagraphStyle(
-            'MessageBot',
-            parent=styles['Normal'],
-            fontSize=10,
-            spaceAfter=8,
-            rightIndent=20,
-            backgroundColor=colors.HexColor('#f5f5f5'),
-            borderPadding=8
-        )
-
-        # Conteúdo do PDF
-        story = []
-
-        # Título
-        story.append(
-            Paragraph("💬 Relatório de Conversa WhatsApp", title_style))
-        story.append(Spacer(1, 20))
-
-        # Informações da conversa
-        story.append(Paragraph("📋 Informações da Conversa", heading_style))
-
-        info_data = [
-            ['Campo', 'Valor'],
-            ['📱 Número do Cliente', conversation.user_number],
-            ['🏢 Tipo de Negócio', translate_business_type(
-                conversation.business_type)],
-            ['📊 Status', translate_status(conversation.status)],
-            ['🆘 Precisa Humano', 'Sim' if conversation.needs_human else 'Não'],
-            ['🕐 Início', format_timestamp_br(conversation.start_time)],
-            ['🏁 Fim', format_timestamp_br(
-                conversation.end_time) if conversation.end_time else 'Em andamento'],
-            ['🆔 ID da Conversa', str(conversation.id)]
-        ]
-
-        info_table = Table(info_data, colWidths=[2*inch, 4*inch])
-        info_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1),
-             [colors.white, colors.HexColor('#f8f9fa')])
-        ]))
-
-        story.append(info_table)
-        story.append(Spacer(1, 30))
-
-        # Mensagens
-        story.append(Paragraph("💬 Histórico de Mensagens", heading_style))
-        story.append(Spacer(1, 10))
-
-        for i, msg in enumerate(sorted(messages, key=lambda x: x.timestamp), 1):
-            sender = "👤 Cliente" if msg.from_user else "🤖 Bot"
-            timestamp = format_timestamp_br(msg.timestamp)
-            content = html.escape(msg.content)
-
-            # Estilo baseado no remetente
-            style = message_user_style if msg.from_user else message_bot_style
-
-            message_text = f"<b>{sender}</b> - {timestamp}<br/>{content}"
-            story.append(Paragraph(message_text, style))
-
-        # Rodapé
-        story.append(Spacer(1, 30))
-        story.append(Paragraph(
-            f"Relatório gerado em {datetime.now().strftime('%d/%m/%Y às %H:%M:%S')}",
-            ParagraphStyle(
-                'Footer', parent=styles['Normal'], fontSize=8, textColor=colors.grey)
-        ))
-
-        # Gerar PDF
-        doc.build(story)
-        buffer.seek(0)
-
-        # Nome do arquivo
-        filename = f"conversa_{conversation.user_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-
-        # Retornar como download
-        return StreamingResponse(
-            buffer,
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
-
+        path = await pdf_reports.wait(job_id)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Erro ao gerar PDF: {str(e)}")
 
+    return pdf_download_response(path, conversation)
+
 
 @router.post("/admin/conversations/{conversation_id}/update-sentiment")
 async def update_conversation_sentiment_endpoint(
@@ -429,3 +596,134 @@ async def update_conversation_sentiment_endpoint(
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Erro ao atualizar sentiment: {str(e)}")
+
+
+@router.get("/admin/metrics/llm")
+def llm_metrics():
+    """Chamadas, latência e tokens da OpenAI por mensagem (processo atual)"""
+    return metrics.llm_snapshot()
+
+
+@router.get("/admin/metrics/db")
+def db_pool_metrics():
+    """Conexões em uso, overflow e histograma de espera por conexão de cada pool"""
+    return pool_status()
+
+
+@router.get("/admin/metrics/cache")
+def conversation_cache_metrics():
+    """Acertos, expirações, remoções e conflitos de versão do cache de conversas (processo atual)"""
+    return conversation_cache.snapshot()
+
+
+@router.get("/admin/metrics/queue")
+def user_queue_metrics():
+    """Rodadas da fila por cliente, mensagens juntadas em rajadas e esperas (processo atual)"""
+    return user_queue.snapshot()
+
+
+@router.get("/admin/metrics/inbound")
+def inbound_queue_metrics(db: Session = Depends(get_db)):
+    """Profundidade da fila durável de mensagens recebidas, dead-letter e idade da mais antiga"""
+    return inbound_queue.backlog(db)
+
+
+REPORT_TIMEZONE = 'America/Sao_Paulo'
+
+
+@router.get("/admin/reports/messages")
+def message_report(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    granularity: str = "hour",
+    business_type: Optional[str] = None,
+    from_user: Optional[bool] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Série de mensagens por tipo de negócio já agrupada no horário de Brasília,
+    lida do agregado por hora. granularity: hour, day ou hour_of_day (0-23)
+    """
+    if granularity not in ("hour", "day", "hour_of_day"):
+        raise HTTPException(status_code=400, detail="granularity inválida")
+
+    rollup = models.MessageRollup
+    local_hour = func.timezone(REPORT_TIMEZONE, rollup.hour)
+    if granularity == "day":
+        bucket = func.date(local_hour)
+    elif granularity == "hour_of_day":
+        bucket = cast(func.extract('hour', local_hour), Integer)
+    else:
+        bucket = local_hour
+    bucket = bucket.label('bucket')
+
+    query = db.query(
+        bucket,
+        rollup.business_type,
+        func.sum(rollup.message_count).label('messages')
+    )
+
+    # Horas parciais nas bordas entram inteiras (granularidade do agregado)
+    if start_date:
+        query = query.filter(rollup.hour > start_date - timedelta(hours=1))
+    if end_date:
+        query = query.filter(rollup.hour <= end_date)
+    if business_type:
+        query = query.filter(rollup.business_type == business_type)
+    if from_user is not None:
+        query = query.filter(rollup.from_user == from_user)
+
+    rows = query.group_by(bucket, rollup.business_type).order_by(
+        bucket, rollup.business_type).all()
+
+    return {
+        "timezone": REPORT_TIMEZONE,
+        "granularity": granularity,
+        "series": [{
+            "bucket": row.bucket.isoformat() if hasattr(row.bucket, 'isoformat') else row.bucket,
+            "business_type": row.business_type,
+            "messages": int(row.messages)
+        } for row in rows]
+    }
+
+
+@router.get("/admin/reports/tokens")
+def token_report(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """Tokens, latência e taxa de cache da OpenAI por tipo de negócio"""
+    query = db.query(
+        models.Conversation.business_type,
+        func.count(models.Conversation.id).label('conversations'),
+        func.coalesce(func.sum(models.Conversation.llm_calls), 0).label('llm_calls'),
+        func.coalesce(func.sum(models.Conversation.llm_seconds), 0).label('llm_seconds'),
+        func.coalesce(func.sum(models.Conversation.prompt_tokens), 0).label('prompt_tokens'),
+        func.coalesce(func.sum(models.Conversation.completion_tokens), 0).label('completion_tokens'),
+        func.coalesce(func.sum(models.Conversation.cached_tokens), 0).label('cached_tokens')
+    )
+
+    if start_date:
+        query = query.filter(models.Conversation.start_time >= start_date)
+    if end_date:
+        query = query.filter(models.Conversation.start_time <= end_date)
+
+    result = []
+    for row in query.group_by(models.Conversation.business_type).all():
+        conversations = row.conversations or 1
+        result.append({
+            "business_type": row.business_type,
+            "conversations": row.conversations,
+            "llm_calls": int(row.llm_calls),
+            "prompt_tokens": int(row.prompt_tokens),
+            "completion_tokens": int(row.completion_tokens),
+            "cached_tokens": int(row.cached_tokens),
+            "tokens_per_conversation": round(
+                (row.prompt_tokens + row.completion_tokens) / conversations, 1),
+            "llm_seconds_per_conversation": round(float(row.llm_seconds) / conversations, 3),
+            "cache_hit_ratio": round(
+                row.cached_tokens / row.prompt_tokens, 3) if row.prompt_tokens else 0.0
+        })
+
+    return result
@@ -1,37 +1,101 @@
+import json
+import time
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
-from app.db import crud
-from app.core import message_handler
-from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import AsyncSessionLocal
+from app.core import inbound_queue, message_handler, metrics, user_queue
+from fastapi.responses import JSONResponse, StreamingResponse
 
 router = APIRouter()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 @router.post('/webhook')
-async def receive_message(payload: dict, db: Session = Depends(get_db)):
+async def receive_message(payload: dict, db: AsyncSession = Depends(get_db)):
     user_number = payload.get('user_number', 'unknown')
     content = payload.get('message', '')
 
-    saved_message = crud.create_message(db, user_number, content)
+    # Fila durável: a resposta sai pelos workers, entregue ao bridge
+    if inbound_queue.INBOUND_QUEUE_ENABLED:
+        message_id = await inbound_queue.enqueue(
+            db, user_number, content, external_id=payload.get('message_id'))
+        return JSONResponse(status_code=202, content={
+            "queued": True,
+            "id": message_id,
+            "duplicate": message_id is None
+        })
 
-    result = message_handler.process_message(
-        db=db,
-        user_number=user_number,
-        content=content,
-        conversation_id=saved_message.conversation_id
-    )
+    # Uma rodada por vez por cliente; rajadas podem virar uma só resposta
+    async with user_queue.turn(user_number, content) as burst:
+        if not burst:
+            return JSONResponse(content={"reply": None, "merged": True})
+
+        result = await message_handler.process_message(
+            db=db,
+            user_number=user_number,
+            content=burst
+        )
 
     return JSONResponse(content={
         "reply": result.get("reply"),
         "sentiment": result.get("sentiment"),
-        "score": result.get("score")
+        "score": result.get("score"),
+        "merged_messages": len(burst)
     })
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post('/webhook/stream')
+async def receive_message_stream(payload: dict):
+    """
+    Versão em streaming (Server-Sent Events): envia cada frase do reply
+    assim que fica pronta e, ao final, um evento 'done' com o resultado
+    """
+    user_number = payload.get('user_number', 'unknown')
+    content = payload.get('message', '')
+    started = time.perf_counter()
+
+    async def event_stream():
+        # Sessão própria: o corpo do stream roda depois das dependências
+        async with AsyncSessionLocal() as db, user_queue.turn(user_number, content) as burst:
+            if not burst:
+                yield format_sse("done", {"reply": None, "merged": True})
+                return
+            first_sentence_at = None
+
+            async for event in message_handler.process_message_stream(
+                db=db,
+                user_number=user_number,
+                content=burst
+            ):
+                now = time.perf_counter()
+                if first_sentence_at is None:
+                    first_sentence_at = now
+
+                if event["event"] == "sentence":
+                    yield format_sse("sentence", {"text": event["text"]})
+                    continue
+
+                ttfb = first_sentence_at - started
+                total = now - started
+                metrics.record_stream(ttfb, total)
+                print(f"⏱️ Streaming: primeira frase em {ttfb * 1000:.0f}ms, "
+                      f"total {total * 1000:.0f}ms")
+                yield format_sse("done", {
+                    "reply": event.get("reply"),
+                    "sentiment": event.get("sentiment"),
+                    "score": event.get("score"),
+                    "streamed": event.get("streamed"),
+                    "merged_messages": len(burst),
+                    "ttfb_ms": round(ttfb * 1000, 1),
+                    "total_ms": round(total * 1000, 1)
+                })
+
+    return StreamingResponse(event_stream(), media_type='text/event-stream')
@@ -0,0 +1,262 @@
+"""
+Analytics das conversas calculadas no servidor.
+
+Cada conversa guarda contadores incrementais (mensagens do cliente e do bot,
+respostas e tempo de resposta somado, mensagem do cliente aguardando
+resposta) atualizados por record_message na mesma transação de cada
+mensagem, com UPDATE atômico. O resumo do dashboard é uma única consulta
+agrupada sobre conversations (status, tipo de negócio, sentimento,
+needs_human e faixa de duração), sem ler mensagens.
+
+Tempo de resposta: da primeira mensagem do cliente ainda sem resposta até a
+próxima mensagem do bot.
+
+Para recalcular tudo do zero (bancos antigos ou correções):
+python -m app.core.analytics --backfill
+"""
+
+import os
+import sys
+import time
+from sqlalchemy import case, extract, func, literal, select, update
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.orm import Session
+from app.db import models
+
+ANALYTICS_BACKFILL_BATCH = int(os.getenv('ANALYTICS_BACKFILL_BATCH', '5000'))
+
+# Faixas de duração (segundos) e rótulos: < 1 min, 1-5 min, ...
+DURATION_BUCKETS_SECONDS = [60, 300, 900, 3600, 14400]
+DURATION_LABELS = ['< 1 min', '1-5 min', '5-15 min', '15-60 min', '1-4 h', '> 4 h']
+
+COUNTER_COLUMNS = ('user_message_count', 'bot_message_count', 'response_count',
+                   'response_seconds', 'awaiting_reply_since')
+
+
+def counter_values(from_user: bool, timestamp, previous=None):
+    """
+    Novos valores dos contadores com a mensagem, como expressões SQL (UPDATE
+    atômico). previous: valores já calculados para mensagens anteriores
+    gravadas no mesmo UPDATE (por padrão, os da linha)
+    """
+    Conversation = models.Conversation
+    previous = previous or {}
+
+    def value(column):
+        if column not in previous:
+            return getattr(Conversation, column)
+        if previous[column] is None:
+            return literal(None, getattr(Conversation, column).type)
+        return previous[column]
+
+    awaiting = value('awaiting_reply_since')
+    if from_user:
+        return {
+            **previous,
+            'user_message_count': func.coalesce(value('user_message_count'), 0) + 1,
+            'awaiting_reply_since': func.coalesce(awaiting, timestamp),
+        }
+
+    # No SET todas as expressões leem os valores anteriores da linha
+    waited = extract('epoch', timestamp - awaiting)
+    return {
+        **previous,
+        'bot_message_count': func.coalesce(value('bot_message_count'), 0) + 1,
+        'response_count': func.coalesce(value('response_count'), 0) + case(
+            (awaiting.is_not(None), 1), else_=0),
+        'response_seconds': func.coalesce(
+            value('response_seconds'), 0) + func.coalesce(waited, 0),
+        'awaiting_reply_since': None,
+    }
+
+
+def exchange_counter_values(messages):
+    """Contadores de várias mensagens [(from_user, timestamp)] em um único UPDATE"""
+    values = {}
+    for from_user, timestamp in messages:
+        values = counter_values(from_user, timestamp, values)
+    return values
+
+
+def record_message(conversation: models.Conversation, from_user: bool, timestamp):
+    """Atualiza os contadores da conversa com a nova mensagem (UPDATE atômico no flush)"""
+    for column, value in counter_values(from_user, timestamp).items():
+        setattr(conversation, column, value)
+
+
+def summary_columns(status_column, end_time_column):
+    """Colunas do resumo agrupado: (dimensões, agregados)"""
+    Conversation = models.Conversation
+    duration = extract('epoch', func.coalesce(
+        end_time_column, Conversation.last_message_at) - Conversation.start_time)
+    dimensions = [
+        status_column.label('status'),
+        func.coalesce(Conversation.business_type, 'unknown').label('business_type'),
+        Conversation.sentiment.label('sentiment'),
+        func.coalesce(Conversation.needs_human, False).label('needs_human'),
+        func.width_bucket(duration, array(DURATION_BUCKETS_SECONDS)).label('duration_bucket'),
+    ]
+    aggregates = [
+        func.count(Conversation.id).label('conversations'),
+        func.coalesce(func.sum(Conversation.user_message_count), 0).label('user_messages'),
+        func.coalesce(func.sum(Conversation.bot_message_count), 0).label('bot_messages'),
+        func.coalesce(func.sum(Conversation.response_count), 0).label('responses'),
+        func.coalesce(func.sum(Conversation.response_seconds), 0).label('response_seconds'),
+    ]
+    return dimensions, aggregates
+
+
+def summarize(rows):
+    """Monta o resumo do dashboard a partir das linhas agrupadas"""
+    total = needs_human = user_messages = bot_messages = responses = 0
+    response_seconds = 0.0
+    by_status, by_business_type, by_sentiment = {}, {}, {}
+    durations = [0] * len(DURATION_LABELS)
+
+    for row in rows:
+        count = row.conversations
+        total += count
+        by_status[row.status] = by_status.get(row.status, 0) + count
+        by_business_type[row.business_type] = by_business_type.get(row.business_type, 0) + count
+        sentiment = row.sentiment or 'none'
+        by_sentiment[sentiment] = by_sentiment.get(sentiment, 0) + count
+        if row.needs_human:
+            needs_human += count
+        if row.duration_bucket is not None:
+            durations[row.duration_bucket] += count
+        user_messages += row.user_messages
+        bot_messages += row.bot_messages
+        responses += row.responses
+        response_seconds += float(row.response_seconds)
+
+    return {
+        "total": total,
+        "by_status": by_status,
+        "by_business_type": by_business_type,
+        "by_sentiment": by_sentiment,
+        "needs_human": needs_human,
+        "needs_human_rate": needs_human / total if total else 0.0,
+        "messages": {"from_user": user_messages, "from_bot": bot_messages},
+        "response_latency": {
+            "responses": responses,
+            "avg_seconds": response_seconds / responses if responses else None
+        },
+        "duration_distribution": [
+            {"bucket": label, "conversations": count}
+            for label, count in zip(DURATION_LABELS, durations)
+        ]
+    }
+
+
+def compute_counters(messages):
+    """
+    Contadores de várias conversas de uma vez (vetorizado). messages:
+    DataFrame com conversation_id, from_user e timestamp, ordenado por
+    conversa e horário. Devolve um DataFrame indexado por conversation_id.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if messages.empty:
+        return pd.DataFrame(columns=list(COUNTER_COLUMNS))
+
+    codes, conversation_ids = pd.factorize(messages['conversation_id'], sort=False)
+    from_user = messages['from_user'].fillna(True).to_numpy(dtype=bool)
+    timestamps = pd.to_datetime(messages['timestamp'], utc=True).reset_index(drop=True)
+    bot = (~from_user).astype(np.int64)
+
+    # Trecho da conversa = mensagens depois de n respostas do bot; a resposta
+    # n+1 fecha o trecho n
+    frame = pd.DataFrame({'code': codes, 'bot': bot, 'timestamp': timestamps})
+    frame['segment'] = frame.groupby('code')['bot'].cumsum() - frame['bot']
+
+    first_user = frame[from_user].groupby(['code', 'segment'])['timestamp'].min()
+    bots = frame[~from_user].join(first_user.rename('first_user'), on=['code', 'segment'])
+    waited = (bots['timestamp'] - bots['first_user']).dt.total_seconds()
+
+    n = len(conversation_ids)
+    user_count = np.bincount(codes, weights=from_user, minlength=n).astype(np.int64)
+    bot_count = np.bincount(codes, weights=bot, minlength=n).astype(np.int64)
+    answered = waited.notna().to_numpy()
+    bot_codes = bots['code'].to_numpy()
+    response_count = np.bincount(bot_codes, weights=answered, minlength=n).astype(np.int64)
+    response_seconds = np.bincount(bot_codes, weights=waited.fillna(0).to_numpy(), minlength=n)
+
+    # Trecho aberto (depois da última resposta) com mensagem do cliente
+    open_segment = pd.MultiIndex.from_arrays([np.arange(n), bot_count])
+    awaiting = first_user.reindex(open_segment).reset_index(drop=True)
+
+    return pd.DataFrame({
+        'user_message_count': user_count,
+        'bot_message_count': bot_count,
+        'response_count': response_count,
+        'response_seconds': response_seconds,
+        'awaiting_reply_since': awaiting.to_numpy(),
+    }, index=conversation_ids)
+
+
+def backfill(db: Session, batch_size: int = ANALYTICS_BACKFILL_BATCH):
+    """
+    Recalcula do zero os contadores de todas as conversas, em lotes. As
+    conversas do lote ficam bloqueadas (FOR UPDATE) durante o recálculo,
+    então mensagens gravadas em paralelo somam sobre o valor novo.
+    """
+    import pandas as pd
+
+    Conversation, Message = models.Conversation, models.Message
+    last_id, conversations, messages = None, 0, 0
+    while True:
+        query = select(Conversation.id).order_by(Conversation.id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(Conversation.id > last_id)
+        ids = db.execute(query.with_for_update()).scalars().all()
+        if not ids:
+            break
+
+        frame = pd.read_sql(
+            select(Message.conversation_id, Message.from_user, Message.timestamp).where(
+                Message.conversation_id.in_(ids), Message.timestamp.is_not(None)
+            ).order_by(Message.conversation_id, Message.timestamp, Message.id),
+            db.connection())
+        counters = compute_counters(frame).reindex(ids)
+
+        # Conversas sem mensagens ficam zeradas
+        awaiting = counters['awaiting_reply_since']
+        values = [{
+            'id': conversation_id,
+            'user_message_count': int(user_count),
+            'bot_message_count': int(bot_count),
+            'response_count': int(response_count),
+            'response_seconds': float(response_seconds),
+            'awaiting_reply_since': None if pd.isna(since) else since.to_pydatetime(),
+        } for conversation_id, user_count, bot_count, response_count, response_seconds, since in zip(
+            ids,
+            counters['user_message_count'].fillna(0),
+            counters['bot_message_count'].fillna(0),
+            counters['response_count'].fillna(0),
+            counters['response_seconds'].fillna(0),
+            pd.to_datetime(awaiting, utc=True),
+        )]
+        db.execute(update(Conversation), values)
+        db.commit()
+
+        conversations += len(ids)
+        messages += len(frame)
+        last_id = ids[-1]
+    return conversations, messages
+
+
+if __name__ == '__main__':
+    from app.db.session import SessionLocal
+
+    if '--backfill' not in sys.argv:
+        print("Uso: python -m app.core.analytics --backfill")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    with SessionLocal() as session:
+        total_conversations, total_messages = backfill(session)
+    elapsed = time.perf_counter() - started
+    print(f"✅ Contadores recalculados: {total_conversations} conversas, "
+          f"{total_messages} mensagens em {elapsed:.1f}s "
+          f"({total_messages / elapsed if elapsed else 0:,.0f} mensagens/s)")
@@ -0,0 +1,182 @@
+"""
+Exportação em lote: ZIP com o CSV e/ou o PDF de cada conversa filtrada.
+
+Os arquivos são gerados no pool de processos dos PDFs e cada entrada entra
+no ZIP assim que fica pronta. O ZIP é escrito sem seek (data descriptors) e
+enviado em blocos, então nem o arquivo nem a lista de conversas ficam
+inteiros em memória: as conversas vêm de um cursor do lado do servidor e as
+mensagens são lidas por lote. PDFs já em cache (pdf_reports) não são
+renderizados de novo, e os novos ficam no cache.
+"""
+
+import os
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from app.db.session import SessionLocal
+from app.db import models
+from app.core import csv_export, pdf_reports
+from app.core.report_format import conversation_snapshot
+
+# Conversas por consulta de mensagens
+BULK_EXPORT_CHUNK = int(os.getenv('BULK_EXPORT_CHUNK', '50'))
+# Jobs em renderização ao mesmo tempo (limita a memória)
+BULK_EXPORT_IN_FLIGHT = int(os.getenv(
+    'BULK_EXPORT_IN_FLIGHT', str(pdf_reports.PDF_WORKERS * 4)))
+
+FORMATS = ('csv', 'pdf')
+
+
+class ZipStream:
+    """Destino do ZipFile que só acumula bytes até o próximo envio"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offset = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def entry_name(conversation, kind):
+    number = re.sub(r'[^0-9A-Za-z]+', '', conversation['user_number'] or '') or 'desconhecido'
+    return f"conversa_{number}_{conversation['id']}.{kind}"
+
+
+def render_entries(entries):
+    """
+    Executado no worker: gera uma lista de arquivos e devolve [(nome, bytes ou
+    exceção)]. entries: [(kind, job_id, conversa, mensagens)], com mensagens
+    em (id, from_user, content, timestamp).
+    """
+    results = []
+    for kind, job_id, conversation, messages in entries:
+        name = entry_name(conversation, kind)
+        try:
+            if kind == 'csv':
+                results.append((name, csv_export.conversation_csv_bytes(conversation, messages)))
+                continue
+            path = pdf_reports.render_to_cache(
+                job_id, conversation, [message[1:] for message in messages])
+            with open(path, 'rb') as f:
+                results.append((name, f.read()))
+        except Exception as e:
+            results.append((name, e))
+    return results
+
+
+def load_messages(db, conversation_ids):
+    """Mensagens de um lote de conversas, em uma consulta"""
+    grouped = {conversation_id: [] for conversation_id in conversation_ids}
+    if not conversation_ids:
+        return grouped
+    rows = db.query(
+        models.Message.conversation_id, models.Message.id, models.Message.from_user,
+        models.Message.content, models.Message.timestamp
+    ).filter(
+        models.Message.conversation_id.in_(conversation_ids)
+    ).order_by(models.Message.conversation_id, models.Message.timestamp.asc(), models.Message.id.asc())
+    for row in rows:
+        grouped[str(row.conversation_id)].append(tuple(row)[1:])
+    return grouped
+
+
+def write_completed(archive, pending, block=True):
+    """Grava no ZIP os arquivos dos jobs prontos (espera ao menos um se block)"""
+    done, _ = wait(list(pending), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+    for future in done:
+        names = pending.pop(future)
+        try:
+            results = future.result()
+        except Exception as e:
+            results = [(name, e) for name in names]
+        for name, data in results:
+            if isinstance(data, Exception):
+                archive.writestr(f"{name}.erro.txt", f"Erro ao gerar {name}: {data}\n")
+                continue
+            # PDF já é comprimido
+            compression = zipfile.ZIP_STORED if name.endswith('.pdf') else zipfile.ZIP_DEFLATED
+            archive.writestr(name, data, compress_type=compression)
+
+
+def submit_chunk(db, archive, out, chunk, kinds, pending):
+    """
+    Enfileira os arquivos de um lote de conversas: os CSVs (baratos) vão em
+    um único job, cada PDF em um job próprio para dividir entre os workers
+    """
+    executor = pdf_reports.get_executor()
+    to_render = []
+    for conversation in chunk:
+        if 'csv' in kinds:
+            to_render.append(('csv', None, conversation))
+        if 'pdf' in kinds:
+            job_id = pdf_reports.job_id_for(conversation)
+            path = pdf_reports.cache_path(job_id)
+            if os.path.exists(path):
+                archive.write(path, entry_name(conversation, 'pdf'),
+                              compress_type=zipfile.ZIP_STORED)
+            else:
+                to_render.append(('pdf', job_id, conversation))
+
+    messages = load_messages(db, {conversation['id'] for _, _, conversation in to_render})
+    entries = [(kind, job_id, conversation, messages[conversation['id']])
+               for kind, job_id, conversation in to_render]
+    jobs = [[entry for entry in entries if entry[0] == 'csv']]
+    jobs += [[entry] for entry in entries if entry[0] == 'pdf']
+
+    for job in jobs:
+        if not job:
+            continue
+        while len(pending) >= BULK_EXPORT_IN_FLIGHT:
+            write_completed(archive, pending)
+            yield out.pop()
+        future = executor.submit(render_entries, job)
+        pending[future] = [entry_name(conversation, kind) for kind, _, conversation, _ in job]
+
+    if pending:
+        write_completed(archive, pending, block=False)
+    yield out.pop()
+
+
+def stream_zip(build_query, kinds):
+    """
+    Gera o ZIP em blocos. build_query(db) devolve a Query de linhas
+    (Conversation, status, end_time), com o status e o end_time efetivos
+    (crud.effective_conversation_columns), os filtros e a ordem da exportação.
+    """
+    out = ZipStream()
+    pending = {}
+    try:
+        archive = zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED)
+        with SessionLocal() as db:
+            chunk = []
+            for conversation, status, end_time in build_query(db).yield_per(BULK_EXPORT_CHUNK):
+                chunk.append(conversation_snapshot(conversation, (status, end_time)))
+                if len(chunk) == BULK_EXPORT_CHUNK:
+                    yield from submit_chunk(db, archive, out, chunk, kinds, pending)
+                    chunk = []
+            if chunk:
+                yield from submit_chunk(db, archive, out, chunk, kinds, pending)
+
+        while pending:
+            write_completed(archive, pending)
+            yield out.pop()
+        archive.close()
+        yield out.pop()
+    finally:
+        # Cliente desconectou no meio: não renderiza o resto
+        for future in pending:
+            future.cancel()
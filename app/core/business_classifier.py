@@ -0,0 +1,148 @@
+"""
+Classificador local de tipo de negócio (Naive Bayes sobre palavras).
+
+Responde sem chamada de rede quando está confiante e deixa os casos
+ambíguos para a OpenAI. O vocabulário parte dos nomes e tipos de produtos e
+serviços de business_context.business_profiles e é refinado com o histórico
+de mensagens já classificadas no banco.
+"""
+
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from sqlalchemy.orm import Session
+from app.core import business_context
+from app.db import models
+
+LABELS = ['delivery', 'mechanic', 'pharmacy', 'unknown']
+
+CONFIDENCE_THRESHOLD = float(
+    os.getenv('LOCAL_CLASSIFIER_THRESHOLD', '0.9'))
+TRAINING_LIMIT = int(os.getenv('LOCAL_CLASSIFIER_TRAINING_LIMIT', '50000'))
+
+# Termos usados no prompt do classificador da OpenAI
+SEED_KEYWORDS = {
+    'delivery': ['comida', 'pedido', 'pedir', 'delivery', 'entrega', 'sabor', 'sabores', 'fome', 'lanche'],
+    'mechanic': ['veiculo', 'carro', 'moto', 'automotivo', 'manutencao', 'oficina', 'motor', 'pneu', 'revisao'],
+    'pharmacy': ['medicamento', 'remedio', 'saude', 'farmacia', 'receita', 'comprimido', 'dor', 'gotas'],
+}
+
+SEED_WEIGHT = 5
+
+STOPWORDS = {
+    'que', 'com', 'para', 'por', 'uma', 'um', 'uns', 'umas', 'dos', 'das', 'nos', 'nas',
+    'de', 'da', 'do', 'em', 'no', 'na', 'os', 'as', 'ao', 'se', 'ou', 'e', 'o', 'a',
+    'sem', 'mais', 'meu', 'minha', 'voce', 'voces', 'tem', 'ter', 'qual', 'quais',
+    'valor', 'preco', 'quanto', 'custa', 'disponivel', 'ola', 'oi', 'bom', 'boa', 'dia',
+    'tarde', 'noite', 'obrigado', 'obrigada', 'favor', 'sim', 'nao',
+}
+
+
+def tokenize(text):
+    """Minúsculas, sem acentos, descartando stopwords e tokens curtos"""
+    text = unicodedata.normalize('NFKD', str(text or '').lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return [
+        token for token in re.findall(r'[a-z0-9]+', text)
+        if len(token) > 2 and token not in STOPWORDS and not token.isdigit()
+    ]
+
+
+class NaiveBayesBusinessClassifier:
+    """Naive Bayes multinomial; predict devolve (tipo, confiança 0-1)"""
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.token_counts = {label: Counter() for label in LABELS}
+        self.doc_counts = Counter()
+        self.vocabulary = set()
+
+    def fit_text(self, text, label, weight=1):
+        tokens = tokenize(text)
+        if not tokens or label not in LABELS:
+            return
+        for token in tokens:
+            self.token_counts[label][token] += weight
+        self.vocabulary.update(tokens)
+        self.doc_counts[label] += 1
+
+    def seed_from_profiles(self, profiles=None):
+        profiles = profiles or business_context.business_profiles
+        for label, profile in profiles.items():
+            for item in profile.get('products', []) + profile.get('services', []):
+                if isinstance(item, str):
+                    self.fit_text(item, label, SEED_WEIGHT)
+                    continue
+                self.fit_text(item.get('name', ''), label, SEED_WEIGHT)
+                self.fit_text(item.get('type', ''), label, SEED_WEIGHT)
+        for label, keywords in SEED_KEYWORDS.items():
+            for keyword in keywords:
+                self.fit_text(keyword, label, SEED_WEIGHT)
+        return self
+
+    def fit_history(self, db: Session, limit: int = TRAINING_LIMIT):
+        """Treina com mensagens de clientes rotuladas pelo tipo da conversa"""
+        rows = db.query(models.Message.content, models.Conversation.business_type).join(
+            models.Conversation, models.Message.conversation_id == models.Conversation.id
+        ).filter(
+            models.Message.from_user == True,  # noqa: E712
+            # 'unknown' só é rótulo confiável em conversas já encerradas
+            (models.Conversation.business_type != 'unknown') |
+            (models.Conversation.status == 'closed')
+        ).order_by(models.Message.timestamp.desc()).limit(limit).all()
+
+        for content, business_type in rows:
+            self.fit_text(content, business_type)
+        return len(rows)
+
+    def predict(self, texts):
+        tokens = [t for text in texts for t in tokenize(text)
+                  if t in self.vocabulary]
+        # Rótulos sem nenhum exemplo não competem
+        labels = [label for label in LABELS if self.doc_counts[label]]
+        if not tokens or not labels:
+            return 'unknown', 0.0
+
+        total_docs = sum(self.doc_counts[label] for label in labels)
+        vocabulary_size = len(self.vocabulary)
+        scores = {}
+        for label in labels:
+            counts = self.token_counts[label]
+            denominator = sum(counts.values()) + self.alpha * vocabulary_size
+            score = math.log((self.doc_counts[label] + 1) /
+                             (total_docs + len(labels)))
+            for token in tokens:
+                score += math.log((counts[token] + self.alpha) / denominator)
+            scores[label] = score
+
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        normalizer = sum(math.exp(score - top) for score in scores.values())
+        return best, 1.0 / normalizer
+
+
+classifier = NaiveBayesBusinessClassifier().seed_from_profiles()
+
+
+def set_classifier(new_classifier):
+    """Troca o classificador local (qualquer objeto com predict(texts))"""
+    global classifier
+    classifier = new_classifier
+
+
+def train_from_history(db: Session):
+    model = NaiveBayesBusinessClassifier().seed_from_profiles()
+    trained = model.fit_history(db)
+    set_classifier(model)
+    print(f"✅ Classificador local treinado com {trained} mensagens")
+    return model
+
+
+def classify(texts, threshold: float = CONFIDENCE_THRESHOLD):
+    """Retorna o tipo quando confiante, ou None para escalar à OpenAI"""
+    business_type, confidence = classifier.predict(texts)
+    if business_type != 'unknown' and confidence >= threshold:
+        return business_type
+    return None
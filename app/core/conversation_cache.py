@@ -0,0 +1,227 @@
+"""
+Cache por processo do estado da conversa aberta de cada cliente.
+
+Guarda, por user_number, o id da conversa, a versão da linha, o tipo de
+negócio, o resumo e as mensagens ainda não resumidas (as mesmas que o
+webhook leria do banco). É preenchido quando o webhook lê a conversa e
+atualizado a cada gravação, então em regime o webhook não faz leituras:
+a mensagem recebida vira um UPDATE condicionado à versão em cache
+(WHERE version = ...). Se outro worker gravou na conversa, o UPDATE não
+encontra a linha, a entrada é descartada e a requisição segue pelo banco.
+
+Limites: CONVERSATION_CACHE_SIZE entradas (LRU; 0 desliga o cache) e
+CONVERSATION_CACHE_TTL_SECONDS desde a última gravação.
+
+Uma requisição consulta o cache mais de uma vez (mensagem recebida, estado
+para a resposta, resposta do bot), então cada consulta diz a finalidade:
+hits/misses/hit_ratio contam só a primeira de cada requisição ('request');
+as demais ficam em lookups, por finalidade.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+from app.db import models
+
+CONVERSATION_CACHE_SIZE = int(os.getenv('CONVERSATION_CACHE_SIZE', '5000'))
+CONVERSATION_CACHE_TTL_SECONDS = int(os.getenv('CONVERSATION_CACHE_TTL_SECONDS', '900'))
+
+# user_number -> estado (mais recente no fim)
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+# Finalidades das consultas; a primeira de cada requisição é 'request'
+LOOKUP_PURPOSES = ('request', 'message', 'state', 'reply')
+
+cache_stats = {
+    'hits': 0,
+    'misses': 0,
+    'expirations': 0,
+    'evictions': 0,
+    'invalidations': 0,
+    'conflicts': 0,
+}
+lookup_stats = {purpose: {'hits': 0, 'misses': 0} for purpose in LOOKUP_PURPOSES}
+
+
+def enabled():
+    return CONVERSATION_CACHE_SIZE > 0
+
+
+def _drop(user_number, reason):
+    if _entries.pop(user_number, None) is not None:
+        cache_stats[reason] += 1
+
+
+def _count(purpose, outcome):
+    if purpose is None:
+        return
+    lookup_stats[purpose][outcome] += 1
+    if purpose == 'request':
+        cache_stats[outcome] += 1
+
+
+def get(user_number, active_since=None, purpose=None):
+    """
+    Estado em cache da conversa do cliente, ou None. active_since: corte de
+    inatividade; conversa sem mensagens desde então não vale mais.
+    purpose: finalidade da consulta (LOOKUP_PURPOSES); None não conta.
+    """
+    if not enabled():
+        return None
+    with _lock:
+        state = _entries.get(user_number)
+        if state is not None and state['expires_at'] < time.monotonic():
+            _drop(user_number, 'expirations')
+            state = None
+        if state is not None and active_since and state['last_message_at'] < active_since:
+            _drop(user_number, 'invalidations')
+            state = None
+        if state is None:
+            _count(purpose, 'misses')
+            return None
+        _entries.move_to_end(user_number)
+        _count(purpose, 'hits')
+        return {**state, 'messages': list(state['messages'])}
+
+
+def store(conversation, messages, limit):
+    """
+    Guarda o estado lido do banco. messages: mensagens ainda não resumidas
+    em ordem cronológica; limit: quantas o webhook lê (as mais recentes).
+    """
+    if not enabled():
+        return
+    state = {
+        'conversation_id': conversation.id,
+        'user_number': conversation.user_number,
+        'version': conversation.version,
+        'business_type': conversation.business_type,
+        'start_time': conversation.start_time,
+        'summary': conversation.summary,
+        'summarized_until': conversation.summarized_until,
+        'last_message_at': conversation.last_message_at,
+        'messages': [(m.from_user, m.content, m.timestamp) for m in messages][-limit:],
+        'limit': limit,
+        'expires_at': time.monotonic() + CONVERSATION_CACHE_TTL_SECONDS,
+    }
+    with _lock:
+        _entries[conversation.user_number] = state
+        _entries.move_to_end(conversation.user_number)
+        while len(_entries) > CONVERSATION_CACHE_SIZE:
+            _entries.popitem(last=False)
+            cache_stats['evictions'] += 1
+
+
+def _advance(user_number, conversation_id, version):
+    """Estado que pode receber a gravação que levou a linha a `version`"""
+    state = _entries.get(user_number)
+    if state is None or state['conversation_id'] != conversation_id:
+        return None
+    if version != state['version'] + 1:
+        # Outro processo gravou entre a leitura e esta gravação
+        _drop(user_number, 'conflicts')
+        return None
+    state['version'] = version
+    state['expires_at'] = time.monotonic() + CONVERSATION_CACHE_TTL_SECONDS
+    return state
+
+
+def add_messages(user_number, conversation_id, version, messages, business_type=None):
+    """
+    Mensagens [(from_user, content, timestamp)] gravadas com o UPDATE que
+    levou a conversa a `version`
+    """
+    with _lock:
+        state = _advance(user_number, conversation_id, version)
+        if state is None:
+            return
+        if business_type:
+            state['business_type'] = business_type
+        state['last_message_at'] = messages[-1][2]
+        state['messages'].extend(messages)
+        del state['messages'][:-state['limit']]
+
+
+def record_update(conversation):
+    """Depois do commit de alterações na conversa (version veio do RETURNING)"""
+    with _lock:
+        state = _entries.get(conversation.user_number)
+        if state is None or conversation.version == state['version']:
+            return
+        state = _advance(conversation.user_number, conversation.id, conversation.version)
+        if state is not None:
+            state['business_type'] = conversation.business_type
+
+
+def invalidate(user_number, conflict=False):
+    with _lock:
+        _drop(user_number, 'conflicts' if conflict else 'invalidations')
+
+
+def invalidate_conversations(conversation_ids):
+    """Descarta as entradas das conversas (ex.: encerradas pelo job de expiração)"""
+    ids = set(conversation_ids)
+    if not ids:
+        return
+    with _lock:
+        for user_number in [user for user, state in _entries.items()
+                            if state['conversation_id'] in ids]:
+            _drop(user_number, 'invalidations')
+
+
+def attach(db, state):
+    """
+    Conversa do estado em cache como objeto persistente da sessão, sem
+    SELECT: alterações nela viram UPDATE pela chave primária
+    """
+    conversation = db.identity_map.get(
+        identity_key(models.Conversation, state['conversation_id']))
+    if conversation is not None:
+        return conversation
+    conversation = models.Conversation(
+        id=state['conversation_id'],
+        user_number=state['user_number'],
+        status='open',
+        business_type=state['business_type'],
+        # Colunas com default do servidor já carregadas: o flush não relê a linha
+        start_time=state['start_time'],
+        summary=state['summary'],
+        summarized_until=state['summarized_until'],
+        last_message_at=state['last_message_at'],
+        version=state['version'],
+    )
+    make_transient_to_detached(conversation)
+    db.add(conversation)
+    return conversation
+
+
+def message_objects(state):
+    """Mensagens em cache no formato lido do banco (transientes)"""
+    return [models.Message(from_user=from_user, content=content, timestamp=timestamp)
+            for from_user, content, timestamp in state['messages']]
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def hit_ratio(counts):
+    return round(counts['hits'] / ((counts['hits'] + counts['misses']) or 1), 3)
+
+
+def snapshot():
+    return {
+        'enabled': enabled(),
+        'size': len(_entries),
+        'max_size': CONVERSATION_CACHE_SIZE,
+        'ttl_seconds': CONVERSATION_CACHE_TTL_SECONDS,
+        **cache_stats,
+        'hit_ratio': hit_ratio(cache_stats),
+        'lookups': {purpose: {**counts, 'hit_ratio': hit_ratio(counts)}
+                    for purpose, counts in lookup_stats.items()},
+    }
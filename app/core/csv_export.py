@@ -0,0 +1,133 @@
+"""
+Exportação CSV em streaming.
+
+As linhas saem direto de um cursor do lado do servidor (yield_per) e são
+escritas em blocos pequenos, então a memória fica constante mesmo para
+exportações de milhões de mensagens. Cada gerador abre a própria sessão:
+a sessão da requisição já foi fechada quando o StreamingResponse começa a
+iterar.
+"""
+
+import csv
+import io
+import os
+from sqlalchemy import select
+from app.db.session import SessionLocal
+from app.db import models
+from app.core.report_format import (
+    format_timestamp_br, translate_business_type, translate_status, conversation_snapshot)
+
+# Linhas lidas do cursor por vez (e por bloco enviado ao cliente)
+CSV_EXPORT_BATCH = int(os.getenv('CSV_EXPORT_BATCH', '2000'))
+
+CONVERSATION_HEADER = ['Tipo', 'Remetente', 'Conteúdo', 'Data/Hora', 'ID']
+MESSAGES_HEADER = ['ID da Conversa', 'Número do Cliente', 'Tipo de Negócio',
+                   'Remetente', 'Conteúdo', 'Data/Hora', 'ID']
+
+# BOM para o Excel reconhecer UTF-8
+BOM = '\ufeff'
+
+
+def encode_rows(rows):
+    """Serializa linhas em CSV (um bloco de bytes)"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def stream_rows(statement, to_row):
+    """Executa o SELECT com cursor do lado do servidor e gera blocos CSV"""
+    with SessionLocal() as db:
+        result = db.execute(statement.execution_options(yield_per=CSV_EXPORT_BATCH))
+        for partition in result.partitions():
+            yield encode_rows(to_row(row) for row in partition)
+
+
+def conversation_info_rows(conversation):
+    """Bloco de informações no topo do CSV de uma conversa (snapshot em dict)"""
+    rows = [
+        CONVERSATION_HEADER,
+        ['INFORMAÇÕES DA CONVERSA', '', '', '', ''],
+        ['Número do Cliente', conversation['user_number'], '', '', ''],
+        ['Tipo de Negócio', translate_business_type(conversation['business_type']), '', '', ''],
+        ['Status', translate_status(conversation['status']), '', '', ''],
+        ['Precisa Humano', 'Sim' if conversation['needs_human'] else 'Não', '', '', ''],
+        ['Início da Conversa', format_timestamp_br(conversation['start_time']), '', '', ''],
+    ]
+    if conversation['end_time']:
+        rows.append(['Fim da Conversa', format_timestamp_br(conversation['end_time']), '', '', ''])
+    rows.append(['', '', '', '', ''])
+    rows.append(['MENSAGENS DA CONVERSA', '', '', '', ''])
+    return rows
+
+
+def conversation_message_row(message_id, from_user, content, timestamp):
+    return ['Mensagem', 'Cliente' if from_user else 'Bot', content,
+            format_timestamp_br(timestamp), str(message_id)]
+
+
+def stream_conversation_csv(conversation, effective=None):
+    """
+    CSV de uma conversa: bloco de informações seguido das mensagens.
+    effective: (status, end_time) efetivos, como na exportação em lote
+    """
+    yield BOM.encode('utf-8') + encode_rows(
+        conversation_info_rows(conversation_snapshot(conversation, effective)))
+
+    statement = select(
+        models.Message.id, models.Message.from_user,
+        models.Message.content, models.Message.timestamp
+    ).where(
+        models.Message.conversation_id == conversation.id
+    ).order_by(models.Message.timestamp.asc(), models.Message.id.asc())
+
+    yield from stream_rows(statement, lambda row: conversation_message_row(*row))
+
+
+def conversation_csv_bytes(conversation, messages):
+    """
+    CSV completo de uma conversa já carregada (exportação em lote).
+    messages: lista de (id, from_user, content, timestamp) em ordem.
+    """
+    return BOM.encode('utf-8') + encode_rows(
+        conversation_info_rows(conversation) + [conversation_message_row(*m) for m in messages])
+
+
+def messages_export_statement(conversation_ids=None, start_date=None, end_date=None,
+                              business_type=None, from_user=None):
+    """SELECT das mensagens a exportar, com o business_type da conversa"""
+    statement = select(
+        models.Message.id, models.Message.conversation_id,
+        models.Message.user_number, models.Message.from_user,
+        models.Message.content, models.Message.timestamp,
+        models.Conversation.business_type
+    ).join(
+        models.Conversation, models.Message.conversation_id == models.Conversation.id
+    )
+
+    if conversation_ids:
+        statement = statement.where(models.Message.conversation_id.in_(conversation_ids))
+    if start_date:
+        statement = statement.where(models.Message.timestamp >= start_date)
+    if end_date:
+        statement = statement.where(models.Message.timestamp <= end_date)
+    if business_type:
+        statement = statement.where(models.Conversation.business_type == business_type)
+    if from_user is not None:
+        statement = statement.where(models.Message.from_user == from_user)
+
+    if conversation_ids:
+        return statement.order_by(models.Message.conversation_id,
+                                  models.Message.timestamp.asc(), models.Message.id.asc())
+    # Sem lista de conversas a ordem segue o índice (timestamp, id)
+    return statement.order_by(models.Message.timestamp.asc(), models.Message.id.asc())
+
+
+def stream_messages_csv(statement):
+    """CSV de mensagens de várias conversas (uma linha por mensagem)"""
+    yield BOM.encode('utf-8') + encode_rows([MESSAGES_HEADER])
+    yield from stream_rows(statement, lambda row: [
+        str(row.conversation_id), row.user_number,
+        translate_business_type(row.business_type or 'unknown'),
+        'Cliente' if row.from_user else 'Bot', row.content,
+        format_timestamp_br(row.timestamp), str(row.id)])
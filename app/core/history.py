@@ -0,0 +1,164 @@
+"""
+Histórico limitado da conversa enviado à OpenAI.
+
+As últimas HISTORY_MAX_TURNS mensagens vão literais (dentro do orçamento de
+tokens); as mais antigas são incorporadas aos poucos a um resumo persistido
+em Conversation.summary. O resumo é atualizado de forma incremental, em lotes,
+por uma tarefa em segundo plano fora do caminho da resposta. Até entrarem no
+resumo, as mensagens que saíram da janela continuam no prompt (enquanto
+couberem no orçamento): nenhuma mensagem fica fora do resumo e do prompt.
+Se o orçamento cortar alguma, o resumo roda sem esperar o lote completo.
+"""
+
+import asyncio
+import os
+from sqlalchemy import update
+from app.core import openai_client, conversation_cache, metrics
+from app.db import async_crud, models
+from app.db.session import AsyncSessionLocal
+
+HISTORY_MAX_TURNS = int(os.getenv('HISTORY_MAX_TURNS', '20'))
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '3000'))
+HISTORY_SUMMARY_BATCH = int(os.getenv('HISTORY_SUMMARY_BATCH', '10'))
+HISTORY_SUMMARY_MAX_BATCH = int(os.getenv('HISTORY_SUMMARY_MAX_BATCH', '50'))
+
+# Janela + um lote pendente é o máximo que o webhook precisa ler
+HISTORY_FETCH_LIMIT = HISTORY_MAX_TURNS + HISTORY_SUMMARY_BATCH
+
+SUMMARY_PROMPT = (
+    "Você mantém o resumo de um atendimento ao cliente via WhatsApp. "
+    "Atualize o resumo existente incorporando as novas mensagens. "
+    "Preserve pedidos, produtos, serviços, valores, horários, dados do cliente "
+    "e pendências; descarte cumprimentos e repetições. "
+    "Responda apenas com o novo resumo, em português, com no máximo 150 palavras."
+)
+
+# Conversas com resumo em andamento neste processo (id -> tarefa)
+_summaries_in_progress = {}
+
+
+def estimate_tokens(text) -> int:
+    """Estimativa barata (~4 caracteres por token)"""
+    return len(text or '') // 4 + 4
+
+
+def literal_count(messages) -> int:
+    """
+    Quantas das mensagens mais recentes ficam literais de vez: até
+    HISTORY_MAX_TURNS, dentro do orçamento de tokens (ao menos uma)
+    """
+    count, total = 0, 0
+    for m in reversed(messages[-HISTORY_MAX_TURNS:] if HISTORY_MAX_TURNS > 0 else []):
+        total += estimate_tokens(m.content)
+        if count and total > HISTORY_TOKEN_BUDGET:
+            break
+        count += 1
+    return count
+
+
+def split_window(messages):
+    """
+    Divide as mensagens ainda não resumidas (em ordem cronológica) em
+    janela do prompt, quantidade pendente de resumo (as anteriores às
+    literais) e se o orçamento de tokens deixou alguma de fora do prompt
+    """
+    window = messages
+
+    # Respeitar o orçamento de tokens, descartando as mais antigas
+    total = sum(estimate_tokens(m.content) for m in window)
+    while len(window) > 1 and total > HISTORY_TOKEN_BUDGET:
+        total -= estimate_tokens(window[0].content)
+        window = window[1:]
+
+    return window, len(messages) - literal_count(messages), len(window) < len(messages)
+
+
+def summary_due(pending, dropped) -> bool:
+    """Lote completo, ou mensagens fora do prompt que só o resumo recupera"""
+    return pending >= HISTORY_SUMMARY_BATCH or (pending > 0 and dropped)
+
+
+def build_messages(system_prompt, summary, window):
+    """Prefixo estático, resumo e depois as mensagens recentes"""
+    openai_messages = [{"role": "system", "content": system_prompt}]
+    if summary:
+        openai_messages.append({
+            "role": "system",
+            "content": f"Resumo da conversa até aqui: {summary}"
+        })
+    for m in window:
+        role = 'user' if m.from_user else 'assistant'
+        openai_messages.append({"role": role, "content": m.content})
+    return openai_messages
+
+
+async def summarize(previous_summary, messages):
+    transcript = "\n".join(
+        f"{'Cliente' if m.from_user else 'Atendente'}: {m.content}" for m in messages
+    )
+    return await openai_client.get_openai_response_async([
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": (
+            f"Resumo atual: {previous_summary or '(vazio)'}\n\n"
+            f"Novas mensagens:\n{transcript}"
+        )}
+    ], purpose='summary')
+
+
+async def fold_into_summary(conversation_id):
+    """Incorpora ao resumo as mensagens anteriores às literais"""
+    task_stats = metrics.start_task()
+
+    async with AsyncSessionLocal() as db:
+        conversation = await async_crud.get_conversation(db, conversation_id)
+        if conversation is None:
+            return
+
+        unsummarized = await async_crud.get_messages_after(
+            db, conversation_id, conversation.summarized_until,
+            limit=HISTORY_SUMMARY_MAX_BATCH + HISTORY_MAX_TURNS)
+        _, pending_count, dropped = split_window(unsummarized)
+        pending = unsummarized[:pending_count][:HISTORY_SUMMARY_MAX_BATCH]
+        previous_until = conversation.summarized_until
+        await db.commit()
+
+        if not summary_due(len(pending), dropped):
+            return
+
+        summary = await summarize(conversation.summary, pending)
+        if not summary:
+            return
+
+        # Só grava se ninguém avançou o resumo enquanto a OpenAI respondia
+        result = await db.execute(
+            update(models.Conversation)
+            .where(
+                models.Conversation.id == conversation_id,
+                models.Conversation.summarized_until.is_not_distinct_from(
+                    previous_until)
+            )
+            .values(summary=summary, summarized_until=pending[-1].timestamp)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            async_crud.add_llm_usage(conversation, task_stats)
+            print(f"✅ Resumo atualizado com {len(pending)} mensagens")
+        await db.commit()
+        # Mensagens resumidas saem da janela em cache
+        conversation_cache.invalidate(conversation.user_number)
+
+
+async def _run_summary(conversation_id):
+    try:
+        await fold_into_summary(conversation_id)
+    except Exception as e:
+        print(f"❌ Erro ao atualizar resumo da conversa: {e}")
+    finally:
+        _summaries_in_progress.pop(conversation_id, None)
+
+
+def schedule_summary(conversation_id):
+    if conversation_id in _summaries_in_progress:
+        return
+    _summaries_in_progress[conversation_id] = asyncio.create_task(
+        _run_summary(conversation_id))
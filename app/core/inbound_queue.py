@@ -0,0 +1,344 @@
+"""
+Fila durável (Postgres) das mensagens recebidas do WhatsApp.
+
+Com INBOUND_QUEUE_ENABLED=true o /webhook só grava a mensagem em
+inbound_messages e responde 202. Processos worker drenam a fila, geram a
+resposta pelo mesmo caminho do webhook (message_handler) e a entregam ao
+bridge em INBOUND_DELIVERY_URL (POST {number, message}):
+
+    python -m app.core.inbound_queue --workers 4 --concurrency 10
+
+Estados: pending -> processing -> done. Com a resposta gerada, a linha
+segue em processing até a entrega; se a entrega falha, vai para replied
+e só a entrega é repetida. Cada falha volta a linha para a fila com
+espera exponencial (INBOUND_QUEUE_RETRY_SECONDS * 2^tentativas); depois
+de INBOUND_QUEUE_MAX_ATTEMPTS tentativas vai para dead (dead-letter),
+com o último erro em last_error.
+
+Ordem por cliente: cada reserva pega todas as mensagens pendentes de um
+cliente (até USER_QUEUE_MAX_BURST) e responde juntas; as que chegarem
+depois esperam a entrega da resposta anterior. A reserva lê a linha mais
+antiga de cada cliente, se ela venceu, com FOR UPDATE SKIP LOCKED
+(workers diferentes pegam clientes diferentes) e o cliente é reservado
+com pg_try_advisory_xact_lock.
+
+Uma reserva vale INBOUND_QUEUE_LEASE_SECONDS e é renovada a cada terço
+desse tempo enquanto o worker trabalha nela (chamada à OpenAI, entrega):
+só vence se o worker cair ou ficar sem banco por mais que o lease, e aí
+a linha volta a ser reservável. Regra: o lease precisa ser bem maior que
+uma ida ao banco; os timeouts da OpenAI e da entrega não o limitam.
+Entrega ao menos uma vez: um worker que cai entre a gravação da resposta
+e a atualização da fila repete o processamento.
+
+A mensagem do cliente é gravada na conversa uma vez só: a linha da fila
+recebe o id da mensagem (message_id) na mesma transação, e uma nova
+tentativa depois de uma falha (OpenAI fora do ar, por exemplo) só gera a
+resposta de novo.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+from datetime import timedelta
+import httpx
+from sqlalchemy import and_, case, exists, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+from app.core import message_handler, user_queue
+from app.db import locks, models
+from app.db.session import AsyncSessionLocal, SessionLocal
+
+INBOUND_QUEUE_ENABLED = os.getenv('INBOUND_QUEUE_ENABLED', 'false').lower() == 'true'
+INBOUND_QUEUE_WORKERS = int(os.getenv('INBOUND_QUEUE_WORKERS', '2'))
+INBOUND_QUEUE_CONCURRENCY = int(os.getenv('INBOUND_QUEUE_CONCURRENCY', '10'))
+INBOUND_QUEUE_MAX_ATTEMPTS = int(os.getenv('INBOUND_QUEUE_MAX_ATTEMPTS', '5'))
+INBOUND_QUEUE_RETRY_SECONDS = float(os.getenv('INBOUND_QUEUE_RETRY_SECONDS', '5'))
+INBOUND_QUEUE_LEASE_SECONDS = int(os.getenv('INBOUND_QUEUE_LEASE_SECONDS', '120'))
+INBOUND_QUEUE_POLL_SECONDS = float(os.getenv('INBOUND_QUEUE_POLL_SECONDS', '0.5'))
+# Clientes (primeira linha de cada um) lidos por reserva em busca de um livre
+INBOUND_QUEUE_SCAN = int(os.getenv('INBOUND_QUEUE_SCAN', '50'))
+INBOUND_DELIVERY_URL = os.getenv('INBOUND_DELIVERY_URL', '')
+INBOUND_DELIVERY_TIMEOUT = float(os.getenv('INBOUND_DELIVERY_TIMEOUT', '15'))
+
+ACTIVE_STATUSES = ('pending', 'processing', 'replied')
+
+InboundMessage = models.InboundMessage
+
+
+async def enqueue(db: AsyncSession, user_number: str, content: str, external_id=None):
+    """Grava a mensagem na fila; devolve o id ou None se external_id já estava na fila"""
+    result = await db.execute(
+        insert(InboundMessage)
+        .values(user_number=user_number, content=content, external_id=external_id)
+        .on_conflict_do_nothing(index_elements=['external_id'])
+        .returning(InboundMessage.id)
+    )
+    message_id = result.scalar()
+    await db.commit()
+    return message_id
+
+
+def is_due():
+    """Linha que pode ser reservada agora (inclui reservas vencidas)"""
+    now = func.now()
+    return or_(
+        and_(InboundMessage.status.in_(('pending', 'replied')), InboundMessage.available_at <= now),
+        and_(InboundMessage.status == 'processing', InboundMessage.locked_until < now),
+    )
+
+
+async def claim_user(db: AsyncSession, user_number: str):
+    """
+    Trabalho do cliente (já com o advisory lock): a entrega pendente mais
+    antiga ou as mensagens pendentes, ou None se ele não tem nada a fazer agora
+    """
+    rows = (await db.execute(
+        select(InboundMessage, is_due().label('due'),
+               (func.clock_timestamp() - InboundMessage.created_at).label('quiet_since'))
+        .where(InboundMessage.user_number == user_number,
+               InboundMessage.status.in_(ACTIVE_STATUSES))
+        .order_by(InboundMessage.id)
+    )).all()
+    # A mais antiga ainda não venceu (reserva de outro worker ou espera de nova tentativa)
+    if not rows or not rows[0].due:
+        return None
+
+    first = rows[0].InboundMessage
+    if first.reply is not None:
+        batch = [first]
+    else:
+        # Rajada: as pendentes em sequência, depois que o cliente parou de escrever
+        if user_queue.USER_QUEUE_DEBOUNCE_MS > 0 and rows[-1].quiet_since < timedelta(
+                milliseconds=user_queue.USER_QUEUE_DEBOUNCE_MS):
+            return None
+        batch = [row.InboundMessage for row in rows[:user_queue.USER_QUEUE_MAX_BURST]
+                 if row.InboundMessage.reply is None]
+
+    ids = [message.id for message in batch]
+    # Antes do UPDATE: ele também incrementa os objetos já carregados na sessão
+    attempts = max(message.attempts for message in batch) + 1
+    await db.execute(
+        update(InboundMessage)
+        .where(InboundMessage.id.in_(ids))
+        .values(status='processing', attempts=InboundMessage.attempts + 1,
+                locked_until=func.now() + timedelta(seconds=INBOUND_QUEUE_LEASE_SECONDS))
+    )
+    return {
+        'ids': ids,
+        'user_number': user_number,
+        'contents': [message.content for message in batch],
+        'message_ids': [message.message_id for message in batch],
+        'reply': first.reply,
+        'attempts': attempts,
+    }
+
+
+async def claim(db: AsyncSession):
+    """Reserva o trabalho de um cliente livre; None se a fila não tem nada vencido"""
+    # Só a linha mais antiga de cada cliente e só se ela venceu: um cliente
+    # com a primeira mensagem em andamento (ou esperando nova tentativa)
+    # não ocupa a varredura com as mensagens seguintes
+    older = aliased(InboundMessage)
+    candidates = (await db.execute(
+        select(InboundMessage.user_number)
+        .where(InboundMessage.status.in_(ACTIVE_STATUSES), is_due(),
+               ~exists().where(older.user_number == InboundMessage.user_number,
+                               older.status.in_(ACTIVE_STATUSES),
+                               older.id < InboundMessage.id))
+        .order_by(InboundMessage.id)
+        .limit(INBOUND_QUEUE_SCAN)
+        .with_for_update(skip_locked=True)
+    )).scalars().all()
+
+    for user_number in candidates:
+        locked = (await db.execute(select(func.pg_try_advisory_xact_lock(
+            *locks.lock_key(locks.INBOUND_USER_LOCK_CLASS, user_number))))).scalar()
+        if not locked:
+            continue
+        job = await claim_user(db, user_number)
+        if job is not None:
+            await db.commit()
+            return job
+    await db.rollback()
+    return None
+
+
+async def store_reply(db: AsyncSession, job, reply):
+    """Resposta gerada: fica na primeira linha até a entrega; as outras terminam"""
+    lead_id, merged_ids = job['ids'][0], job['ids'][1:]
+    await db.execute(
+        update(InboundMessage).where(InboundMessage.id == lead_id)
+        .values(reply=reply, attempts=0, last_error=None)
+    )
+    if merged_ids:
+        await db.execute(
+            update(InboundMessage).where(InboundMessage.id.in_(merged_ids))
+            .values(status='done', locked_until=None, finished_at=func.now())
+        )
+    await db.commit()
+
+
+async def finish(db: AsyncSession, job):
+    await db.execute(
+        update(InboundMessage)
+        .where(InboundMessage.id.in_(job['ids']), InboundMessage.status == 'processing')
+        .values(status='done', locked_until=None, finished_at=func.now())
+    )
+    await db.commit()
+
+
+async def retry_later(db: AsyncSession, job, reply, error):
+    """Volta o trabalho para a fila com espera exponencial, ou para dead-letter"""
+    attempts = 0 if reply is not None and job['reply'] is None else job['attempts']
+    if attempts >= INBOUND_QUEUE_MAX_ATTEMPTS:
+        values = {'status': 'dead', 'finished_at': func.now()}
+        print(f"❌ Mensagens {job['ids']} de {job['user_number']} foram para dead-letter: {error}")
+    else:
+        values = {
+            'status': 'replied' if reply is not None else 'pending',
+            'available_at': func.now() + timedelta(
+                seconds=INBOUND_QUEUE_RETRY_SECONDS * 2 ** max(attempts - 1, 0)),
+        }
+        print(f"⚠️ Mensagens {job['ids']} de {job['user_number']} voltaram para a fila "
+              f"(tentativa {attempts}): {error}")
+    await db.execute(
+        update(InboundMessage)
+        .where(InboundMessage.id.in_(job['ids']), InboundMessage.status == 'processing')
+        .values(locked_until=None, last_error=str(error)[:1000], **values)
+    )
+    await db.commit()
+
+
+async def deliver(client: httpx.AsyncClient, user_number: str, reply: str):
+    """Envia a resposta ao bridge do WhatsApp"""
+    if not INBOUND_DELIVERY_URL:
+        print(f"⚠️ INBOUND_DELIVERY_URL não configurada; resposta para {user_number} não enviada")
+        return
+    response = await client.post(INBOUND_DELIVERY_URL, json={'number': user_number, 'message': reply})
+    response.raise_for_status()
+
+
+async def keep_lease(job):
+    """Renova a reserva das linhas do job enquanto ele roda (heartbeat)"""
+    while True:
+        await asyncio.sleep(INBOUND_QUEUE_LEASE_SECONDS / 3)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(InboundMessage)
+                    .where(InboundMessage.id.in_(job['ids']), InboundMessage.status == 'processing')
+                    .values(locked_until=func.now() + timedelta(seconds=INBOUND_QUEUE_LEASE_SECONDS))
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"⚠️ Erro ao renovar a reserva das mensagens {job['ids']}: {e}")
+
+
+async def run_job(client: httpx.AsyncClient, job):
+    reply = job['reply']
+    heartbeat = asyncio.create_task(keep_lease(job))
+    async with AsyncSessionLocal() as db:
+        try:
+            if reply is None:
+                result = await message_handler.process_message(
+                    db, job['user_number'], job['contents'],
+                    inbound=list(zip(job['ids'], job['message_ids'])))
+                reply = result['reply']
+                await store_reply(db, job, reply)
+            await deliver(client, job['user_number'], reply)
+            await finish(db, job)
+        except Exception as e:
+            await db.rollback()
+            await retry_later(db, job, reply, e)
+        finally:
+            heartbeat.cancel()
+
+
+async def worker_loop(client: httpx.AsyncClient):
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                job = await claim(db)
+        except Exception as e:
+            print(f"❌ Erro ao reservar mensagens da fila: {e}")
+            job = None
+        if job is None:
+            await asyncio.sleep(INBOUND_QUEUE_POLL_SECONDS)
+            continue
+        await run_job(client, job)
+
+
+async def serve(concurrency: int):
+    async with httpx.AsyncClient(timeout=INBOUND_DELIVERY_TIMEOUT) as client:
+        await asyncio.gather(*(worker_loop(client) for _ in range(concurrency)))
+
+
+def run_worker(concurrency: int):
+    try:
+        asyncio.run(serve(concurrency))
+    except KeyboardInterrupt:
+        pass
+
+
+def backlog(db: Session):
+    """Profundidade da fila por estado e idade da mensagem pendente mais antiga"""
+    by_status = dict(db.execute(
+        select(InboundMessage.status, func.count())
+        .where(InboundMessage.status.in_(ACTIVE_STATUSES))
+        .group_by(InboundMessage.status)
+    ).all())
+    dead = db.execute(
+        select(func.count()).where(InboundMessage.status == 'dead')).scalar()
+    oldest = db.execute(
+        select(func.extract('epoch', func.now() - func.min(InboundMessage.created_at)))
+        .where(InboundMessage.status.in_(ACTIVE_STATUSES))
+    ).scalar()
+    return {
+        'enabled': INBOUND_QUEUE_ENABLED,
+        'depth': sum(by_status.values()),
+        'by_status': {status: by_status.get(status, 0) for status in ACTIVE_STATUSES},
+        'dead': dead,
+        'oldest_seconds': float(oldest) if oldest is not None else None,
+    }
+
+
+def requeue_dead(db: Session):
+    """Devolve as mensagens em dead-letter para a fila"""
+    result = db.execute(
+        update(InboundMessage).where(InboundMessage.status == 'dead')
+        .values(status=case((InboundMessage.reply.is_not(None), 'replied'), else_='pending'),
+                attempts=0, available_at=func.now(), finished_at=None)
+    )
+    db.commit()
+    return result.rowcount
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Workers da fila de mensagens recebidas')
+    parser.add_argument('--workers', type=int, default=INBOUND_QUEUE_WORKERS,
+                        help='processos')
+    parser.add_argument('--concurrency', type=int, default=INBOUND_QUEUE_CONCURRENCY,
+                        help='mensagens em paralelo por processo')
+    parser.add_argument('--requeue-dead', action='store_true',
+                        help='devolve as mensagens em dead-letter para a fila e sai')
+    args = parser.parse_args()
+
+    if args.requeue_dead:
+        with SessionLocal() as session:
+            print(f"✅ {requeue_dead(session)} mensagens devolvidas para a fila")
+        sys.exit(0)
+
+    print(f"✅ Fila de mensagens: {args.workers} processos x {args.concurrency} em paralelo")
+    processes = [multiprocessing.get_context('spawn').Process(
+        target=run_worker, args=(args.concurrency,)) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
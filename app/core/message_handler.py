@@ -1,11 +1,58 @@
-from app.core import openai_client, business_context
-import json
-from datetime import datetime, timezone
-from sqlalchemy.orm import Session
-from app.db import crud, models
+from app.core import openai_client, business_classifier, conversation_cache, history, metrics, prompts, response_parser, streaming
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import async_crud, models
 
+VALID_BUSINESS_TYPES = ['delivery', 'mechanic', 'pharmacy', 'unknown']
 
-def detect_business_type(db, conversation_id, messages):
+LOCAL_CLASSIFIER_ENABLED = os.getenv(
+    'LOCAL_CLASSIFIER_ENABLED', 'true').lower() == 'true'
+
+# 'single_call': a classificação vem no mesmo JSON da resposta; enquanto o
+#   negócio não é identificado, o prompt traz os dados de todos os perfis
+#   (prompt maior, mas estático e reaproveitado pelo cache do provedor)
+# 'separate': chamada dedicada de classificação antes da resposta
+BUSINESS_TYPE_MODE = os.getenv('BUSINESS_TYPE_MODE', 'single_call')
+
+# Com JSON mode / structured outputs a segunda chamada é desnecessária
+RETRY_ON_INVALID_JSON = os.getenv(
+    'RETRY_ON_INVALID_JSON',
+    'true' if response_parser.OPENAI_JSON_MODE == 'off' else 'false').lower() == 'true'
+
+REPLY_RESPONSE_FORMAT = response_parser.reply_response_format()
+
+# Unidade de trabalho: a mensagem recebida, a classificação, o sentimento e a
+# resposta do bot são gravados juntos em uma única transação no fim da
+# resposta. Menos idas ao banco e commits (WAL) por mensagem, mas a mensagem
+# recebida só fica no banco se a resposta for gerada.
+WEBHOOK_UNIT_OF_WORK = os.getenv(
+    'WEBHOOK_UNIT_OF_WORK', 'false').lower() == 'true'
+
+
+def normalize_business_type(business_type):
+    """Limpa a resposta do modelo e força 'unknown' para valores inválidos"""
+    business_type = str(business_type or '').lower().strip()
+
+    # Limpar resposta removendo possíveis caracteres extra
+    business_type = business_type.replace('"', '').replace(
+        "'", "").replace(".", "").replace(",", "")
+
+    # Se a resposta não for exatamente uma das opções válidas, forçar 'unknown'
+    if business_type not in VALID_BUSINESS_TYPES:
+        print(
+            f"⚠️ Tipo de negócio inválido detectado: '{business_type}'. Usando 'unknown'.")
+        business_type = 'unknown'
+
+    return business_type
+
+
+def should_classify(conversation):
+    """Política "sticky": uma vez identificado o negócio, não reclassifica"""
+    return conversation is None or conversation.business_type not in ['delivery', 'mechanic', 'pharmacy']
+
+
+async def detect_business_type(db: AsyncSession, conversation_id, messages):
     formatted_messages = []
     for m in messages:
         role = 'user' if m.from_user else 'assistant'
@@ -28,32 +75,21 @@ def detect_business_type(db, conversation_id, messages):
         {"role": "system", "content": system_prompt}] + formatted_messages
 
     try:
-        business_type = openai_client.get_openai_response(openai_messages)
-        business_type = business_type.lower().strip()
-
-        # Limpar resposta removendo possíveis caracteres extra
-        business_type = business_type.replace('"', '').replace(
-            "'", "").replace(".", "").replace(",", "")
-
-        # Verificar se a resposta é válida
-        valid_types = ['delivery', 'mechanic', 'pharmacy', 'unknown']
-
-        # Se a resposta não for exatamente uma das opções válidas, forçar 'unknown'
-        if business_type not in valid_types:
-            print(
-                f"⚠️ Tipo de negócio inválido detectado: '{business_type}'. Usando 'unknown'.")
-            business_type = 'unknown'
+        business_type = await openai_client.get_openai_response_async(
+            openai_messages, purpose='classification')
+        business_type = normalize_business_type(business_type)
 
         print(f"✅ Tipo de negócio detectado: '{business_type}'")
 
         # Só atualizar se for um tipo válido e diferente do atual
         if business_type in ['delivery', 'mechanic', 'pharmacy']:
-            conversation = db.query(models.Conversation).filter(
-                models.Conversation.id == conversation_id
-            ).first()
+            conversation = await async_crud.get_conversation(db, conversation_id)
             if conversation and conversation.business_type != business_type:
                 conversation.business_type = business_type
-                db.commit()
+                # Na unidade de trabalho vai junto com a resposta
+                if not WEBHOOK_UNIT_OF_WORK:
+                    await db.commit()
+                    conversation_cache.record_update(conversation)
                 print(f"✅ Business type atualizado para: {business_type}")
 
         return business_type
@@ -80,248 +116,148 @@ def extract_json_from_response(text):
     """
     Extrai JSON da resposta da OpenAI de forma mais robusta
     """
-    try:
-        # Remove espaços em branco e quebras de linha
-        text = text.strip()
-
-        # Primeiro, tenta parsear como JSON direto
-        try:
-            return json.loads(text)
-        except json.JSONDecodeError:
-            pass
-
-        # Procura por um JSON válido na resposta
-        start_idx = text.find('{')
-        end_idx = text.rfind('}')
-
-        if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-            json_str = text[start_idx:end_idx + 1]
-            return json.loads(json_str)
-
-        # Se a resposta não contém JSON mas tem conteúdo, criar um JSON válido
-        if text and len(text.strip()) > 0:
-            return {
-                "reply": text.strip(),
-                "sentiment": "NEUTRO",
-                "score": 0.0
-            }
-
-        return None
-
-    except json.JSONDecodeError as e:
-        print(f"❌ Erro ao decodificar JSON: {e}")
-        print(f"❌ Texto recebido: {repr(text)}")
-
-        # Como último recurso, se tiver texto, usar como reply
-        if text and len(text.strip()) > 0:
-            return {
-                "reply": text.strip(),
-                "sentiment": "NEUTRO",
-                "score": 0.0
-            }
-
-        return None
-
-
-def process_message(db: Session, user_number: str, content: str, conversation_id):
-    messages = db.query(models.Message).filter(
-        models.Message.conversation_id == conversation_id
-    ).order_by(models.Message.timestamp).all()
-
-    # Buscar a conversa
-    conversation = db.query(models.Conversation).filter(
-        models.Conversation.id == conversation_id
-    ).first()
-
-    # Sempre reexecuta a detecção a cada nova mensagem
-    detected_type = detect_business_type(db, conversation_id, messages + [models.Message(
-        user_number=user_number,
-        content=content,
-        from_user=True
-    )])
+    return response_parser.extract_json_from_response(text)
 
-    # Verificação extra de segurança para business_type
-    valid_business_types = ['delivery', 'mechanic', 'pharmacy', 'unknown']
-    if detected_type not in valid_business_types:
-        print(
-            f"⚠️ Tipo de negócio inválido detectado: '{detected_type}'. Forçando 'unknown'.")
-        detected_type = 'unknown'
-
-    # Só atualizar se for diferente e válido
-    if detected_type != 'unknown' and conversation.business_type != detected_type:
-        conversation.business_type = detected_type
-        try:
-            db.commit()
-            print(f"✅ Business type salvo: {detected_type}")
-        except Exception as e:
-            print(f"❌ Erro ao salvar business_type: {e}")
-            db.rollback()
-
-    # Construir o system prompt baseado no business_type
-    system_prompt = "Você é um chatbot de atendimento ao cliente. "
-
-    if conversation and conversation.business_type in business_context.business_profiles:
-        profile = business_context.business_profiles[conversation.business_type]
-
-        system_prompt += f"Negócio: {conversation.business_type}. "
-        system_prompt += f"Horário de funcionamento: {profile.get('working_hours', '')}. "
-
-        if 'products' in profile:
-            product_list = []
-            for p in profile['products']:
-                status = 'Disponível' if p.get('available') else 'Indisponível'
-                price_info = f" - {p.get('price', 'Preço sob consulta')}" if p.get(
-                    'available') else ""
-                prescription_info = " (RECEITA OBRIGATÓRIA)" if p.get(
-                    'requires_prescription') else ""
-                note_info = f" ({p.get('note', '')})" if p.get('note') else ""
-
-                product_list.append(
-                    f"{p['name']}{price_info} ({status}){prescription_info}{note_info}")
-
-            system_prompt += f"Produtos: {'; '.join(product_list)}. "
-
-        if 'services' in profile:
-            service_list = []
-            for s in profile['services']:
-                # Para serviços que são strings simples (compatibilidade com formato antigo)
-                if isinstance(s, str):
-                    service_list.append(s)
-                # Para serviços que são dicionários com preço
-                elif isinstance(s, dict):
-                    status = 'Disponível' if s.get(
-                        'available') else 'Indisponível'
-                    price_info = f" - {s.get('price', 'Preço sob consulta')}" if s.get(
-                        'available') else ""
-                    duration_info = f" (Duração: {s.get('duration', '')})" if s.get(
-                        'duration') else ""
-                    note_info = f" ({s.get('note', '')})" if s.get(
-                        'note') else ""
-
-                    service_list.append(
-                        f"{s['name']}{price_info} ({status}){duration_info}{note_info}")
-
-            system_prompt += f"Serviços: {'; '.join(service_list)}. "
-
-        # Incluir políticas importantes
-        if 'policies' in profile:
-            for key, value in profile['policies'].items():
-                if key == 'payment_methods':
-                    system_prompt += f"Formas de pagamento: {', '.join(value)}. "
-                elif key == 'delivery_fee':
-                    system_prompt += f"Taxa de entrega: {value}. "
-                elif key == 'minimum_order':
-                    system_prompt += f"Pedido mínimo: {value}. "
-                elif key == 'delivery_time':
-                    system_prompt += f"Tempo de entrega: {value}. "
-                elif key == 'diagnostic_fee':
-                    system_prompt += f"Taxa de diagnóstico: {value}. "
-                elif key == 'warranty':
-                    system_prompt += f"Garantia: {value}. "
-                elif key == 'appointment_required' and value:
-                    system_prompt += "Agendamento obrigatório para todos os serviços. "
-
-    # Regras gerais para IA responder de forma completa
-    tone_guidelines = ""
-
-    if conversation.business_type == 'delivery':
-        tone_guidelines = (
-            "Responda de forma leve, simpática e descontraída. "
-            "Use emojis quando fizer sentido (ex: 🍕😉). "
-            "Seja rápido nas respostas. Mantenha o clima de um atendimento de pizzaria ou restaurante informal."
-            "O cliente pode escolher até 2 sabores por pizza, sendo que o tamanho da pizza é sempre grande e o preço será do valor do sabor mais caro."
-            "SEMPRE informe o preço quando o cliente perguntar sobre produtos específicos. "
-            "Se o cliente perguntar por um sabor que não existe, informe que não temos esse sabor. "
-            "Informe sempre o horário de funcionamento quando relevante."
-            "Caso o cliente faça o pedido fora do horário de funcionamento, explique que estamos fechados e informe o próximo horário de abertura. "
-            "Se o cliente perguntar sobre formas de pagamento, informe: Pix, Dinheiro ou Cartão. "
-            "Mencione a taxa de entrega e pedido mínimo quando necessário. "
-        )
-
-    elif conversation.business_type == 'mechanic':
-        tone_guidelines = (
-            "Seja profissional, direto e prestativo. "
-            "Use linguagem técnica acessível. Foque em agendamentos, revisões, diagnósticos e informações claras. "
-            "Evite exageros ou brincadeiras. Mantenha um tom objetivo, mas cordial."
-            "SEMPRE informe preços dos serviços quando solicitado. "
-            "Explique que alguns serviços incluem apenas a mão de obra, sendo peças por conta do cliente. "
-            "Informe que é necessário agendar um horário para serviços de mecânica e que o preço final será informado após a avaliação."
-            "Se o cliente perguntar sobre preços, explique que é necessário trazer o veículo para uma avaliação antes de confirmar valores. "
-            "Se o cliente perguntar por serviços que não realizamos (ex: conserto residencial), informe de forma educada que só atendemos veículos automotores."
-        )
 
-    elif conversation.business_type == 'pharmacy':
-        tone_guidelines = (
-            "Seja educado, empático e confiável. "
-            "Oriente o cliente com clareza sobre medicamentos controlados e exigência de receita. "
-            "Use emojis de forma moderada (ex: 💊🙂). "
-            "SEMPRE informe preços quando solicitado. "
-            "Se o cliente perguntar por um produto que tem diferentes versões ou que exija prescrição, pergunte por mais detalhes como dosagem e tipo antes de confirmar. "
-            "Se não encontrar o produto ou serviço, informe claramente. "
-            "Se o cliente mencionar apenas o nome genérico de um medicamento (ex: 'Dipirona'), sempre pergunte pela dosagem e forma (comprimido, gotas, etc) antes de confirmar. "
-            "Se o medicamento for controlado ou exigir receita, informe claramente que só é possível vender mediante apresentação da receita física ou digital, conforme a legislação. "
-            "Se o cliente perguntar por um produto que não temos, informe de forma clara e educada."
-            "Informe sobre entrega em domicílio quando apropriado. "
-        )
+async def receive_message(db: AsyncSession, user_number: str, contents, inbound=None):
+    """
+    Mensagens recebidas do cliente (uma ou uma rajada, em ordem). Por padrão
+    são gravadas na hora; na unidade de trabalho só a conversa é lida e as
+    mensagens são gravadas com a resposta. inbound (fila durável): (id da
+    linha, id da mensagem já gravada ou None) de cada mensagem; as já
+    gravadas em uma tentativa anterior não são gravadas de novo. Devolve
+    (conversation_id, (conversa, mensagens, recebidas, ids na fila) já
+    lidas ou None).
+    """
+    inbound = inbound or [(None, None)] * len(contents)
+    if not WEBHOOK_UNIT_OF_WORK:
+        cache_lookup = 'request'
+        for content, (inbound_id, message_id) in zip(contents, inbound):
+            if message_id is not None:
+                conversation_id = await async_crud.message_conversation_id(db, message_id)
+                continue
+            saved_message = await async_crud.create_message(
+                db, user_number, content, inbound_id=inbound_id, cache_lookup=cache_lookup)
+            conversation_id = saved_message.conversation_id
+            # Demais mensagens da rajada: mesma requisição
+            cache_lookup = 'message'
+        return conversation_id, None
+
+    received_at = datetime.now(timezone.utc)
+    conversation, messages = await async_crud.open_conversation_state(
+        db, user_number, received_at, limit=history.HISTORY_FETCH_LIMIT)
+    pending = [(content, inbound_id) for content, (inbound_id, message_id)
+               in zip(contents, inbound) if message_id is None]
+    # Horários distintos mantêm a ordem da rajada
+    new_messages = [models.Message(
+        user_number=user_number,
+        content=content,
+        from_user=True,
+        timestamp=received_at + timedelta(microseconds=n)
+    ) for n, (content, _) in enumerate(pending)]
+    inbound_ids = [inbound_id for _, inbound_id in pending if inbound_id is not None]
+    messages = (messages + new_messages)[-history.HISTORY_FETCH_LIMIT:]
+    return conversation.id, (conversation, messages, new_messages, inbound_ids)
+
+
+async def prepare_reply(db: AsyncSession, user_number: str, content: str, conversation_id, loaded=None):
+    """Classificação e montagem do prompt; devolve o contexto da resposta"""
+    message_stats = metrics.start_message()
+
+    # Conversa e mensagens ainda não incorporadas ao resumo (limitado),
+    # do cache de conversas quando possível
+    if loaded:
+        conversation, messages, inbound, inbound_ids = loaded
+    else:
+        inbound, inbound_ids = None, ()
+        conversation, messages = await async_crud.load_conversation_state(
+            db, user_number, conversation_id, limit=history.HISTORY_FETCH_LIMIT)
+    window, pending_summary, dropped = history.split_window(messages)
+
+    # Encerra a transação de leitura para não segurar a conexão durante a OpenAI
+    await db.commit()
+
+    needs_classification = should_classify(conversation)
+
+    # Pré-filtro local: casos claros não precisam da OpenAI
+    if needs_classification and LOCAL_CLASSIFIER_ENABLED:
+        # messages já traz a mensagem atual (gravada ou acrescentada em receive_message)
+        user_texts = [m.content for m in messages if m.from_user][-10:]
+        local_type = business_classifier.classify(user_texts)
+        metrics.record_local_classification(local_type is not None)
+        if local_type:
+            print(f"✅ Tipo de negócio classificado localmente: '{local_type}'")
+            conversation.business_type = local_type
+            needs_classification = False
+
+    classify_inline = needs_classification and BUSINESS_TYPE_MODE == 'single_call'
+
+    if needs_classification and not classify_inline:
+        detected_type = await detect_business_type(db, conversation_id, messages + [models.Message(
+            user_number=user_number,
+            content=content,
+            from_user=True
+        )])
+
+        # Verificação extra de segurança para business_type
+        if detected_type not in VALID_BUSINESS_TYPES:
+            print(
+                f"⚠️ Tipo de negócio inválido detectado: '{detected_type}'. Forçando 'unknown'.")
+            detected_type = 'unknown'
+
+        # Só atualizar se for diferente e válido
+        if detected_type != 'unknown' and conversation.business_type != detected_type:
+            conversation.business_type = detected_type
+            if not WEBHOOK_UNIT_OF_WORK:
+                try:
+                    await db.commit()
+                    conversation_cache.record_update(conversation)
+                    print(f"✅ Business type salvo: {detected_type}")
+                except Exception as e:
+                    print(f"❌ Erro ao salvar business_type: {e}")
+                    await db.rollback()
+
+    system_prompt = prompts.get_system_prompt(
+        conversation.business_type, classify_inline)
+
+    # Montar histórico da conversa (resumo + janela recente)
+    openai_messages = history.build_messages(
+        system_prompt, conversation.summary, window)
 
-    system_prompt += (
-        " Sempre responda de forma educada, objetiva e sem inventar informações. "
-        "No final da resposta, envie **apenas** um objeto JSON válido, sem nenhuma explicação ou texto fora do JSON. "
-        "O formato exato deve ser:\n"
-        "{\n"
-        "  \"reply\": \"Mensagem que deve ser enviada ao cliente\",\n"
-        "  \"sentiment\": \"POSITIVO\" | \"NEUTRO\" | \"NEGATIVO\",\n"
-        "  \"score\": número decimal entre -1.0 e 1.0\n"
-        "}\n\n"
-        "➡️ Interprete o **sentimento do cliente**, com base nas palavras, tom, pontuação e contexto:\n"
-        "- Use **NEGATIVO** e score negativo se o cliente expressar frustração, impaciência, ironia, cobrança ou reclamação.\n"
-        "- Use **POSITIVO** e score positivo se o cliente demonstrar entusiasmo, elogio ou gratidão.\n"
-        "- Use **NEUTRO** se o cliente apenas fizer uma pergunta ou comentário objetivo, sem emoção clara.\n"
-        "Quanto mais intenso o sentimento, mais próximo de -1.0 ou 1.0 deve ser o score. Por padrão, use 0.0 para casos neutros."
-        "Analise o tom emocional do cliente com atenção. Use a pontuação, palavras e contexto para identificar emoções.\n"
-        "- Se houver empolgação, alegria ou aprovação: use POSITIVO e score entre 0.6 e 1.0\n"
-        "- Se houver reclamação, ironia ou frustração: use NEGATIVO e score entre -0.6 e -1.0\n"
-        "- Se for neutro ou dúvida direta: use NEUTRO e score entre -0.1 e 0.1\n"
-        "Evite usar score 0.0 em casos com emoção clara."
-        "\n\n*** FORMATO DE RESPOSTA OBRIGATÓRIO ***\n"
-        "VOCÊ DEVE SEMPRE, EM TODAS AS RESPOSTAS, retornar APENAS um JSON válido.\n"
-        "NÃO adicione texto antes ou depois do JSON.\n"
-        "NÃO explique sua resposta.\n"
-        "NÃO adicione comentários.\n"
-        "RETORNE APENAS O JSON:\n\n"
-        "{\n"
-        "  \"reply\": \"Sua mensagem completa para o cliente aqui\",\n"
-        "  \"sentiment\": \"POSITIVO\" | \"NEUTRO\" | \"NEGATIVO\",\n"
-        "  \"score\": número entre -1.0 e 1.0\n"
-        "}\n\n"
-        "INSTRUÇÕES PARA SENTIMENTO:\n"
-        "- NEGATIVO (score -1.0 a -0.1): cliente frustrado, irritado, reclamando\n"
-        "- POSITIVO (score 0.1 a 1.0): cliente animado, satisfeito, elogiando\n"
-        "- NEUTRO (score 0.0): pergunta normal, sem emoção aparente\n\n"
-        "LEMBRE-SE: Responda SOMENTE com o JSON, nada mais!"
-    )
+    # Adicionar a nova mensagem
+    openai_messages.append({"role": "user", "content": content})
 
-    system_prompt += tone_guidelines
+    return {
+        "conversation": conversation,
+        "messages": messages,
+        "openai_messages": openai_messages,
+        "classify_inline": classify_inline,
+        "pending_summary": pending_summary,
+        "dropped": dropped,
+        "message_stats": message_stats,
+        "inbound": inbound,
+        "inbound_ids": inbound_ids,
+    }
 
-    # Montar histórico da conversa
-    openai_messages = [{"role": "system", "content": system_prompt}]
-    for m in messages:
-        role = 'user' if m.from_user else 'assistant'
-        openai_messages.append({"role": role, "content": m.content})
 
-    # Adicionar a nova mensagem
-    openai_messages.append({"role": "user", "content": content})
+async def finalize_reply(db: AsyncSession, user_number: str, conversation_id, context, response_raw):
+    """Interpreta a resposta da OpenAI, atualiza a conversa e salva a resposta do bot"""
+    conversation = context["conversation"]
+    messages = context["messages"]
+    openai_messages = context["openai_messages"]
+    classify_inline = context["classify_inline"]
+    pending_summary = context["pending_summary"]
+    message_stats = context["message_stats"]
 
-    # Chamar a OpenAI
-    response_raw = openai_client.get_openai_response(openai_messages)
     print("📤 Resposta da OpenAI:", response_raw)
     print("DEBUG (repr):", repr(response_raw))
 
-    # Tentar extrair JSON da resposta
-    response_data = extract_json_from_response(response_raw)
+    # Tentar extrair JSON da resposta (tolerante a cercas, texto extra e truncamento)
+    response_data, outcome = response_parser.parse_reply(response_raw)
+    metrics.record_reply_parse(outcome)
 
-    # Se não conseguiu extrair JSON válido, fazer nova tentativa com prompt mais direto
-    if response_data is None or not response_data.get("reply"):
+    # Última tentativa só quando o modelo não está preso a um formato JSON
+    if RETRY_ON_INVALID_JSON and (response_data is None or not response_data.get("reply")):
         print("⚠️ Primeira resposta não estava em formato JSON. Tentando novamente...")
 
         # Fazer nova tentativa com prompt mais direto
@@ -331,10 +267,11 @@ def process_message(db: Session, user_number: str, content: str, conversation_id
         }
 
         retry_messages = openai_messages + [retry_prompt]
-        response_raw = openai_client.get_openai_response(retry_messages)
+        response_raw = await openai_client.get_openai_response_async(
+            retry_messages, purpose='retry', response_format=REPLY_RESPONSE_FORMAT)
         print("📤 Segunda tentativa - Resposta da OpenAI:", response_raw)
 
-        response_data = extract_json_from_response(response_raw)
+        response_data, outcome = response_parser.parse_reply(response_raw)
 
     if response_data is None:
         # Se não conseguir extrair JSON, usar valores padrão
@@ -345,11 +282,11 @@ def process_message(db: Session, user_number: str, content: str, conversation_id
             "score": 0.0
         }
 
-    # Extrair dados da resposta
+    # Extrair dados da resposta (sentiment e score já normalizados)
     ai_response = response_data.get(
         "reply", "Desculpe, não consegui entender.")
-    sentiment = response_data.get("sentiment", "NEUTRO").upper()
-    score = float(response_data.get("score", 0.0))
+    sentiment = response_data.get("sentiment", "NEUTRO")
+    score = response_data.get("score", 0.0)
 
     # Fallback se OpenAI retornar vazio na primeira mensagem
     if (not ai_response or ai_response.strip() == '') and len(messages) == 0:
@@ -358,6 +295,18 @@ def process_message(db: Session, user_number: str, content: str, conversation_id
             "Somos especializados em delivery, mecânica ou farmácia. Em que posso te auxiliar? 😊"
         )
 
+    # Sem a segunda chamada, um reply vazio não pode chegar ao cliente
+    if not ai_response or ai_response.strip() == '':
+        ai_response = "Desculpe, não consegui processar sua mensagem. Pode repetir?"
+
+    # Classificação devolvida junto com a resposta (modo single_call)
+    if classify_inline and response_data.get("business_type"):
+        inline_type = normalize_business_type(
+            response_data.get("business_type"))
+        if inline_type != 'unknown' and conversation.business_type != inline_type:
+            conversation.business_type = inline_type
+            print(f"✅ Business type atualizado para: {inline_type}")
+
     # Atualizar conversa com sentimento
     conversation.sentiment = sentiment
     conversation.sentiment_score = score
@@ -369,19 +318,81 @@ def process_message(db: Session, user_number: str, content: str, conversation_id
     if check_if_needs_human(ai_response):
         conversation.needs_human = True
 
-    db.commit()
+    async_crud.add_llm_usage(conversation, message_stats)
+
+    if WEBHOOK_UNIT_OF_WORK:
+        # Uma transação: alterações da conversa, mensagem recebida e resposta
+        conversation_id = await async_crud.save_exchange(db, user_number, conversation, [
+            (True, m.content, 'unknown', m.timestamp) for m in context["inbound"]
+        ] + [(False, ai_response, conversation.business_type, datetime.now(timezone.utc))],
+            inbound_ids=context["inbound_ids"])
+    else:
+        await db.commit()
+        conversation_cache.record_update(conversation)
+
+        # Salvar a resposta do bot
+        await async_crud.create_message(
+            db=db,
+            user_number=user_number,
+            content=ai_response,
+            from_user=False,
+            business_type=conversation.business_type
+        )
 
-    # Salvar a resposta do bot
-    crud.create_message(
-        db=db,
-        user_number=user_number,
-        content=ai_response,
-        from_user=False,
-        business_type=conversation.business_type
-    )
+    # Mensagens anteriores às literais viram resumo em segundo plano
+    if history.summary_due(pending_summary, context["dropped"]):
+        history.schedule_summary(conversation_id)
+
+    print(f"📊 Chamadas à OpenAI nesta mensagem: {message_stats['llm_calls']} "
+          f"({message_stats['llm_seconds']:.2f}s)")
 
     return {
         "reply": ai_response,
         "sentiment": sentiment,
-        "score": score
+        "score": score,
+        "llm_calls": message_stats['llm_calls']
     }
+
+
+def burst_contents(content):
+    """Texto de uma mensagem ou lista de mensagens de uma rajada (user_queue)"""
+    return [content] if isinstance(content, str) else list(content)
+
+
+async def process_message(db: AsyncSession, user_number: str, content, inbound=None):
+    contents = burst_contents(content)
+    conversation_id, loaded = await receive_message(db, user_number, contents, inbound)
+    # Rajada: as mensagens vão juntas como a pergunta a responder
+    content = "\n".join(contents)
+    context = await prepare_reply(db, user_number, content, conversation_id, loaded)
+
+    # Chamar a OpenAI
+    response_raw = await openai_client.get_openai_response_async(
+        context["openai_messages"], response_format=REPLY_RESPONSE_FORMAT)
+
+    return await finalize_reply(db, user_number, conversation_id, context, response_raw)
+
+
+async def process_message_stream(db: AsyncSession, user_number: str, content):
+    """
+    Igual a process_message, mas gera eventos: 'sentence' para cada frase do
+    reply assim que ela fica completa e 'done' com o resultado final
+    """
+    contents = burst_contents(content)
+    conversation_id, loaded = await receive_message(db, user_number, contents)
+    content = "\n".join(contents)
+    context = await prepare_reply(db, user_number, content, conversation_id, loaded)
+
+    parser = streaming.ReplyStreamParser()
+    async for delta in openai_client.stream_openai_response_async(
+            context["openai_messages"], response_format=REPLY_RESPONSE_FORMAT):
+        for sentence in parser.feed(delta):
+            yield {"event": "sentence", "text": sentence}
+    for sentence in parser.flush():
+        yield {"event": "sentence", "text": sentence}
+
+    result = await finalize_reply(
+        db, user_number, conversation_id, context, parser.raw)
+
+    # Sem reply no stream (texto fora do JSON, nova tentativa): envia o final
+    yield {"event": "done", "streamed": parser.emitted, **result}
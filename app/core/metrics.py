@@ -0,0 +1,170 @@
+"""
+Contadores em memória (por processo) das chamadas à OpenAI e do pool de conexões
+"""
+
+from collections import defaultdict
+from contextvars import ContextVar
+
+_current_message = ContextVar('current_message_stats', default=None)
+
+llm_stats = {
+    'messages': 0,
+    'llm_calls': 0,
+    'llm_seconds': 0.0,
+    'prompt_tokens': 0,
+    'completion_tokens': 0,
+    'cached_tokens': 0,
+    'calls_by_purpose': defaultdict(int),
+    'prompt_tokens_by_purpose': defaultdict(int),
+    'local_classifications': 0,
+    'local_escalations': 0,
+    'reply_parse': defaultdict(int),
+}
+
+stream_stats = {
+    'responses': 0,
+    'ttfb_seconds': 0.0,
+    'total_seconds': 0.0,
+}
+
+
+# Limites (ms) do histograma de espera por conexão do pool
+POOL_WAIT_BUCKETS_MS = [1, 5, 10, 50, 100, 500, 1000, 5000]
+
+pool_stats = defaultdict(lambda: {
+    'checkouts': 0,
+    'timeouts': 0,
+    'wait_seconds': 0.0,
+    'max_wait_seconds': 0.0,
+    'max_checked_out': 0,
+    'histogram': [0] * (len(POOL_WAIT_BUCKETS_MS) + 1),
+})
+
+
+def start_message():
+    """Abre os contadores da mensagem em processamento no contexto atual"""
+    stats = {'llm_calls': 0, 'llm_seconds': 0.0, 'purposes': [],
+             'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0}
+    _current_message.set(stats)
+    llm_stats['messages'] += 1
+    return stats
+
+
+def start_task():
+    """Contadores próprios para tarefas em segundo plano (não contam como mensagem)"""
+    stats = {'llm_calls': 0, 'llm_seconds': 0.0, 'purposes': [],
+             'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0}
+    _current_message.set(stats)
+    return stats
+
+
+def usage_tokens(usage):
+    """(prompt, completion, cached) a partir do usage da OpenAI"""
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached = getattr(details, 'cached_tokens', None) or 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0, cached
+
+
+def record_llm_call(purpose: str, seconds: float, usage=None):
+    prompt_tokens, completion_tokens, cached_tokens = usage_tokens(usage)
+
+    llm_stats['llm_calls'] += 1
+    llm_stats['llm_seconds'] += seconds
+    llm_stats['calls_by_purpose'][purpose] += 1
+    llm_stats['prompt_tokens_by_purpose'][purpose] += prompt_tokens
+    llm_stats['prompt_tokens'] += prompt_tokens
+    llm_stats['completion_tokens'] += completion_tokens
+    llm_stats['cached_tokens'] += cached_tokens
+
+    stats = _current_message.get()
+    if stats is not None:
+        stats['llm_calls'] += 1
+        stats['llm_seconds'] += seconds
+        stats['purposes'].append(purpose)
+        stats['prompt_tokens'] += prompt_tokens
+        stats['completion_tokens'] += completion_tokens
+        stats['cached_tokens'] += cached_tokens
+
+
+def record_local_classification(resolved: bool):
+    """Conta se o classificador local resolveu ou escalou para a OpenAI"""
+    if resolved:
+        llm_stats['local_classifications'] += 1
+    else:
+        llm_stats['local_escalations'] += 1
+
+
+def record_reply_parse(outcome: str):
+    """Como o JSON da resposta foi lido: direct, repaired, plain_text ou empty"""
+    llm_stats['reply_parse'][outcome] += 1
+
+
+def record_stream(ttfb_seconds: float, total_seconds: float):
+    """Tempo até a primeira frase e tempo total de uma resposta em streaming"""
+    stream_stats['responses'] += 1
+    stream_stats['ttfb_seconds'] += ttfb_seconds
+    stream_stats['total_seconds'] += total_seconds
+
+
+def record_pool_wait(pool_name: str, seconds: float, timed_out: bool = False, checked_out: int = 0):
+    """Tempo que um checkout esperou por conexão (inclui abrir conexão nova)"""
+    stats = pool_stats[pool_name]
+    if timed_out:
+        stats['timeouts'] += 1
+        return
+    stats['checkouts'] += 1
+    stats['wait_seconds'] += seconds
+    stats['max_wait_seconds'] = max(stats['max_wait_seconds'], seconds)
+    stats['max_checked_out'] = max(stats['max_checked_out'], checked_out)
+    milliseconds = seconds * 1000
+    bucket = next((i for i, limit in enumerate(POOL_WAIT_BUCKETS_MS)
+                   if milliseconds <= limit), len(POOL_WAIT_BUCKETS_MS))
+    stats['histogram'][bucket] += 1
+
+
+def pool_wait_snapshot(pool_name: str):
+    stats = pool_stats[pool_name]
+    labels = [f'<={limit}ms' for limit in POOL_WAIT_BUCKETS_MS] + \
+        [f'>{POOL_WAIT_BUCKETS_MS[-1]}ms']
+    return {
+        'checkouts': stats['checkouts'],
+        'timeouts': stats['timeouts'],
+        'wait_ms_avg': round(
+            stats['wait_seconds'] / (stats['checkouts'] or 1) * 1000, 2),
+        'wait_ms_max': round(stats['max_wait_seconds'] * 1000, 2),
+        'max_checked_out': stats['max_checked_out'],
+        'wait_histogram': dict(zip(labels, stats['histogram'])),
+    }
+
+
+def llm_snapshot():
+    messages = llm_stats['messages'] or 1
+    local_total = (llm_stats['local_classifications'] +
+                   llm_stats['local_escalations']) or 1
+    return {
+        'messages': llm_stats['messages'],
+        'llm_calls': llm_stats['llm_calls'],
+        'llm_calls_per_message': round(llm_stats['llm_calls'] / messages, 3),
+        'llm_seconds_per_message': round(llm_stats['llm_seconds'] / messages, 3),
+        'prompt_tokens': llm_stats['prompt_tokens'],
+        'completion_tokens': llm_stats['completion_tokens'],
+        'cached_tokens': llm_stats['cached_tokens'],
+        'cache_hit_ratio': round(
+            llm_stats['cached_tokens'] / (llm_stats['prompt_tokens'] or 1), 3),
+        'tokens_per_message': round(
+            (llm_stats['prompt_tokens'] + llm_stats['completion_tokens']) / messages, 1),
+        'calls_by_purpose': dict(llm_stats['calls_by_purpose']),
+        'prompt_tokens_by_purpose': dict(llm_stats['prompt_tokens_by_purpose']),
+        'local_classifications': llm_stats['local_classifications'],
+        'local_escalations': llm_stats['local_escalations'],
+        'local_hit_ratio': round(llm_stats['local_classifications'] / local_total, 3),
+        'reply_parse': dict(llm_stats['reply_parse']),
+        'retry_rate': round(llm_stats['calls_by_purpose'].get('retry', 0) / messages, 3),
+        'stream_responses': stream_stats['responses'],
+        'stream_ttfb_ms_avg': round(
+            stream_stats['ttfb_seconds'] / (stream_stats['responses'] or 1) * 1000, 1),
+        'stream_total_ms_avg': round(
+            stream_stats['total_seconds'] / (stream_stats['responses'] or 1) * 1000, 1),
+    }
@@ -1,17 +1,72 @@
 import os
-from openai import OpenAI
+import time
+from openai import OpenAI, AsyncOpenAI
+from app.core import metrics
 
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
 
-def get_openai_response(messages):
+def request_options(response_format=None):
+    """Parâmetros opcionais da chamada (JSON mode / structured outputs)"""
+    return {"response_format": response_format} if response_format else {}
+
+
+def get_openai_response(messages, purpose='reply', response_format=None):
     try:
+        started = time.perf_counter()
         response = client.chat.completions.create(
             model='gpt-4o',
             messages=messages,
-            temperature=0.7
+            temperature=0.7,
+            **request_options(response_format)
         )
+        metrics.record_llm_call(
+            purpose, time.perf_counter() - started, response.usage)
         return response.choices[0].message.content.strip()
     except Exception as e:
         print(f"Erro ao chamar OpenAI: {e}")
         return None
+
+
+async def get_openai_response_async(messages, purpose='reply', response_format=None):
+    """Versão não bloqueante, usada no caminho do webhook"""
+    try:
+        started = time.perf_counter()
+        response = await async_client.chat.completions.create(
+            model='gpt-4o',
+            messages=messages,
+            temperature=0.7,
+            **request_options(response_format)
+        )
+        metrics.record_llm_call(
+            purpose, time.perf_counter() - started, response.usage)
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"Erro ao chamar OpenAI: {e}")
+        return None
+
+
+async def stream_openai_response_async(messages, purpose='reply', response_format=None):
+    """Gera os pedaços de texto da resposta conforme chegam da OpenAI"""
+    started = time.perf_counter()
+    usage = None
+    try:
+        stream = await async_client.chat.completions.create(
+            model='gpt-4o',
+            messages=messages,
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True},
+            **request_options(response_format)
+        )
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        print(f"Erro ao chamar OpenAI (stream): {e}")
+    finally:
+        metrics.record_llm_call(
+            purpose, time.perf_counter() - started, usage)
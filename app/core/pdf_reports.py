@@ -0,0 +1,270 @@
+"""
+Relatórios PDF de conversas.
+
+O layout do ReportLab é só CPU e leva segundos em conversas longas, então
+roda em um pool de processos, fora do event loop da API. Cada versão de
+uma conversa vira um job com id determinístico (id da conversa + hash da
+última mensagem e dos campos exibidos no cabeçalho) e o PDF fica em disco
+em PDF_CACHE_DIR: uma conversa encerrada é renderizada uma vez, e o arquivo
+serve qualquer worker da API que receba o polling ou o download.
+"""
+
+import asyncio
+import functools
+import glob
+import hashlib
+import html
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib import colors
+from app.core.report_format import format_timestamp_br, translate_business_type, translate_status
+
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', '2'))
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', os.path.join(
+    tempfile.gettempdir(), 'conversation_pdfs'))
+# Falhas recentes guardadas para o polling responder 'failed'
+PDF_FAILED_JOBS_KEPT = int(os.getenv('PDF_FAILED_JOBS_KEPT', '100'))
+
+JOB_ID = re.compile(r'^[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}-[0-9a-f]{16}$')
+
+# job_id -> Future dos jobs deste processo em andamento (o callback remove
+# ao terminar); job_id -> mensagem de erro das últimas falhas
+jobs = {}
+failures = {}
+_jobs_lock = threading.Lock()
+_executor = None
+
+
+def job_id_for(snapshot):
+    """Id do job: muda quando chega mensagem ou muda algo do cabeçalho"""
+    version = '|'.join(str(snapshot[key]) for key in (
+        'last_message_at', 'status', 'end_time', 'business_type', 'needs_human'))
+    return f"{snapshot['id']}-{hashlib.sha1(version.encode()).hexdigest()[:16]}"
+
+
+def cache_path(job_id):
+    return os.path.join(PDF_CACHE_DIR, f"{job_id}.pdf")
+
+
+def build_pdf(conversation, messages):
+    """
+    Gera o PDF da conversa. messages: lista de (from_user, content, timestamp)
+    em ordem cronológica. Retorna os bytes do arquivo.
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*inch)
+
+    # Estilos
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        textColor=colors.HexColor('#2c3e50')
+    )
+
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=14,
+        spaceAfter=12,
+        textColor=colors.HexColor('#34495e')
+    )
+
+    message_user_style = ParagraphStyle(
+        'MessageUser',
+        parent=styles['Normal'],
+        fontSize=10,
+        spaceAfter=8,
+        leftIndent=20,
+        backgroundColor=colors.HexColor('#e3f2fd'),
+        borderPadding=8
+    )
+
+    message_bot_style = ParagraphStyle(
+        'MessageBot',
+        parent=styles['Normal'],
+        fontSize=10,
+        spaceAfter=8,
+        rightIndent=20,
+        backgroundColor=colors.HexColor('#f5f5f5'),
+        borderPadding=8
+    )
+
+    # Conteúdo do PDF
+    story = []
+
+    # Título
+    story.append(
+        Paragraph("💬 Relatório de Conversa WhatsApp", title_style))
+    story.append(Spacer(1, 20))
+
+    # Informações da conversa
+    story.append(Paragraph("📋 Informações da Conversa", heading_style))
+
+    info_data = [
+        ['Campo', 'Valor'],
+        ['📱 Número do Cliente', conversation['user_number']],
+        ['🏢 Tipo de Negócio', translate_business_type(
+            conversation['business_type'])],
+        ['📊 Status', translate_status(conversation['status'])],
+        ['🆘 Precisa Humano', 'Sim' if conversation['needs_human'] else 'Não'],
+        ['🕐 Início', format_timestamp_br(conversation['start_time'])],
+        ['🏁 Fim', format_timestamp_br(
+            conversation['end_time']) if conversation['end_time'] else 'Em andamento'],
+        ['🆔 ID da Conversa', conversation['id']]
+    ]
+
+    info_table = Table(info_data, colWidths=[2*inch, 4*inch])
+    info_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1),
+         [colors.white, colors.HexColor('#f8f9fa')])
+    ]))
+
+    story.append(info_table)
+    story.append(Spacer(1, 30))
+
+    # Mensagens
+    story.append(Paragraph("💬 Histórico de Mensagens", heading_style))
+    story.append(Spacer(1, 10))
+
+    for from_user, content, timestamp in messages:
+        sender = "👤 Cliente" if from_user else "🤖 Bot"
+        content = html.escape(content or '')
+
+        # Estilo baseado no remetente
+        style = message_user_style if from_user else message_bot_style
+
+        message_text = f"<b>{sender}</b> - {format_timestamp_br(timestamp)}<br/>{content}"
+        story.append(Paragraph(message_text, style))
+
+    # Rodapé
+    story.append(Spacer(1, 30))
+    story.append(Paragraph(
+        f"Relatório gerado em {datetime.now().strftime('%d/%m/%Y às %H:%M:%S')}",
+        ParagraphStyle(
+            'Footer', parent=styles['Normal'], fontSize=8, textColor=colors.grey)
+    ))
+
+    # Gerar PDF
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def render_to_cache(job_id, conversation, messages):
+    """Executado no worker: gera o PDF e grava no cache (escrita atômica)"""
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    path = cache_path(job_id)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(build_pdf(conversation, messages))
+    os.replace(tmp_path, path)
+
+    # Versões anteriores da mesma conversa não serão mais pedidas
+    for old in glob.glob(os.path.join(PDF_CACHE_DIR, f"{conversation['id']}-*.pdf")):
+        if old != path:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return path
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # spawn: o worker não herda conexões do banco nem o event loop da API
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def submit(snapshot, load_messages):
+    """
+    Enfileira a renderização da versão atual da conversa, se ainda não houver
+    PDF em cache nem job em andamento (uma falha anterior é tentada de novo).
+    load_messages() só é chamado quando é preciso renderizar. Retorna o job_id.
+    """
+    job_id = job_id_for(snapshot)
+    if os.path.exists(cache_path(job_id)) or job_id in jobs:
+        return job_id
+
+    # A consulta das mensagens roda fora do lock para não segurar os outros
+    # pedidos; depois confere de novo se outra thread já enfileirou a versão
+    messages = load_messages()
+    with _jobs_lock:
+        if job_id in jobs or os.path.exists(cache_path(job_id)):
+            return job_id
+        failures.pop(job_id, None)
+        future = jobs[job_id] = get_executor().submit(
+            render_to_cache, job_id, snapshot, messages)
+    # Fora do lock: se o job já terminou, o callback roda nesta thread
+    future.add_done_callback(functools.partial(_finish, job_id))
+    return job_id
+
+
+def _finish(job_id, future):
+    """Callback do job: tira o Future de jobs e guarda a falha, se houver"""
+    error = None
+    if future.cancelled():
+        error = "job cancelado"
+    elif future.exception() is not None:
+        error = str(future.exception())
+    with _jobs_lock:
+        if jobs.get(job_id) is future:
+            del jobs[job_id]
+        if error is not None:
+            failures[job_id] = error
+            while len(failures) > PDF_FAILED_JOBS_KEPT:
+                del failures[next(iter(failures))]
+
+
+def job_status(job_id):
+    """Estado do job: done, running, failed ou unknown"""
+    if os.path.exists(cache_path(job_id)):
+        return {"job_id": job_id, "status": "done"}
+    if job_id in jobs:
+        return {"job_id": job_id, "status": "running"}
+    error = failures.get(job_id)
+    if error is not None:
+        return {"job_id": job_id, "status": "failed", "error": error}
+    # Concluído mas o arquivo sumiu do cache: trata como desconhecido
+    return {"job_id": job_id, "status": "unknown"}
+
+
+async def wait(job_id):
+    """Aguarda o job sem bloquear o event loop; levanta a exceção do worker"""
+    future = jobs.get(job_id)
+    if future is not None:
+        await asyncio.wrap_future(future)
+    elif job_id in failures:
+        # Falhou antes de começarmos a esperar
+        raise RuntimeError(failures[job_id])
+    return cache_path(job_id)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
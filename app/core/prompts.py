@@ -0,0 +1,248 @@
+"""
+Compilador de system prompts por perfil de negócio.
+
+O prompt de um tipo de negócio só depende dos dados do perfil em
+business_context, então é renderizado uma vez e reaproveitado; cada entrada
+guarda o hash (versão) do perfil que a gerou e é recompilada apenas quando
+esse hash muda (chame compile_prompts() após alterar os perfis).
+"""
+
+import hashlib
+import json
+from app.core import business_context
+
+INLINE_CLASSIFICATION_PROMPT = (
+    "\n\nCLASSIFICAÇÃO DO NEGÓCIO:\n"
+    "Inclua também no JSON o campo \"business_type\" com apenas uma das opções: "
+    "\"delivery\" (comida, pedidos ou delivery), \"mechanic\" (veículos, serviços automotivos ou manutenção de carros), "
+    "\"pharmacy\" (medicamentos, saúde, farmácia ou remédios) ou \"unknown\" (não é possível identificar).\n"
+)
+
+UNCLASSIFIED_PROMPT = (
+    "O tipo de negócio desta conversa ainda não foi identificado. Abaixo estão os "
+    "dados de cada negócio atendido: identifique pela conversa qual deles o cliente "
+    "procura e responda só com os dados e o tom desse negócio. Se não der para "
+    "identificar, pergunte educadamente como pode ajudar."
+)
+
+
+# Regras de formato, iguais para todos os negócios: ficam no início do
+# prompt para formar um prefixo estável (cache de prompt do provedor)
+RESPONSE_FORMAT_RULES = (
+    " Sempre responda de forma educada, objetiva e sem inventar informações. "
+    "No final da resposta, envie **apenas** um objeto JSON válido, sem nenhuma explicação ou texto fora do JSON. "
+    "O formato exato deve ser:\n"
+    "{\n"
+    "  \"reply\": \"Mensagem que deve ser enviada ao cliente\",\n"
+    "  \"sentiment\": \"POSITIVO\" | \"NEUTRO\" | \"NEGATIVO\",\n"
+    "  \"score\": número decimal entre -1.0 e 1.0\n"
+    "}\n\n"
+    "➡️ Interprete o **sentimento do cliente**, com base nas palavras, tom, pontuação e contexto:\n"
+    "- Use **NEGATIVO** e score negativo se o cliente expressar frustração, impaciência, ironia, cobrança ou reclamação.\n"
+    "- Use **POSITIVO** e score positivo se o cliente demonstrar entusiasmo, elogio ou gratidão.\n"
+    "- Use **NEUTRO** se o cliente apenas fizer uma pergunta ou comentário objetivo, sem emoção clara.\n"
+    "Quanto mais intenso o sentimento, mais próximo de -1.0 ou 1.0 deve ser o score. Por padrão, use 0.0 para casos neutros."
+    "Analise o tom emocional do cliente com atenção. Use a pontuação, palavras e contexto para identificar emoções.\n"
+    "- Se houver empolgação, alegria ou aprovação: use POSITIVO e score entre 0.6 e 1.0\n"
+    "- Se houver reclamação, ironia ou frustração: use NEGATIVO e score entre -0.6 e -1.0\n"
+    "- Se for neutro ou dúvida direta: use NEUTRO e score entre -0.1 e 0.1\n"
+    "Evite usar score 0.0 em casos com emoção clara."
+    "\n\n*** FORMATO DE RESPOSTA OBRIGATÓRIO ***\n"
+    "VOCÊ DEVE SEMPRE, EM TODAS AS RESPOSTAS, retornar APENAS um JSON válido.\n"
+    "NÃO adicione texto antes ou depois do JSON.\n"
+    "NÃO explique sua resposta.\n"
+    "NÃO adicione comentários.\n"
+    "RETORNE APENAS O JSON:\n\n"
+    "{\n"
+    "  \"reply\": \"Sua mensagem completa para o cliente aqui\",\n"
+    "  \"sentiment\": \"POSITIVO\" | \"NEUTRO\" | \"NEGATIVO\",\n"
+    "  \"score\": número entre -1.0 e 1.0\n"
+    "}\n\n"
+    "INSTRUÇÕES PARA SENTIMENTO:\n"
+    "- NEGATIVO (score -1.0 a -0.1): cliente frustrado, irritado, reclamando\n"
+    "- POSITIVO (score 0.1 a 1.0): cliente animado, satisfeito, elogiando\n"
+    "- NEUTRO (score 0.0): pergunta normal, sem emoção aparente\n\n"
+    "LEMBRE-SE: Responda SOMENTE com o JSON, nada mais!"
+)
+
+
+def profile_version(profile) -> str:
+    """Hash estável dos dados do perfil"""
+    payload = json.dumps(profile, sort_keys=True,
+                         ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def render_profile(business_type, profile):
+    """Dados do negócio: horário, produtos, serviços e políticas"""
+    text = f"Negócio: {business_type}. "
+    text += f"Horário de funcionamento: {profile.get('working_hours', '')}. "
+
+    if 'products' in profile:
+        product_list = []
+        for p in profile['products']:
+            status = 'Disponível' if p.get('available') else 'Indisponível'
+            price_info = f" - {p.get('price', 'Preço sob consulta')}" if p.get(
+                'available') else ""
+            prescription_info = " (RECEITA OBRIGATÓRIA)" if p.get(
+                'requires_prescription') else ""
+            note_info = f" ({p.get('note', '')})" if p.get('note') else ""
+
+            product_list.append(
+                f"{p['name']}{price_info} ({status}){prescription_info}{note_info}")
+
+        text += f"Produtos: {'; '.join(product_list)}. "
+
+    if 'services' in profile:
+        service_list = []
+        for s in profile['services']:
+            # Para serviços que são strings simples (compatibilidade com formato antigo)
+            if isinstance(s, str):
+                service_list.append(s)
+            # Para serviços que são dicionários com preço
+            elif isinstance(s, dict):
+                status = 'Disponível' if s.get(
+                    'available') else 'Indisponível'
+                price_info = f" - {s.get('price', 'Preço sob consulta')}" if s.get(
+                    'available') else ""
+                duration_info = f" (Duração: {s.get('duration', '')})" if s.get(
+                    'duration') else ""
+                note_info = f" ({s.get('note', '')})" if s.get(
+                    'note') else ""
+
+                service_list.append(
+                    f"{s['name']}{price_info} ({status}){duration_info}{note_info}")
+
+        text += f"Serviços: {'; '.join(service_list)}. "
+
+    # Incluir políticas importantes
+    if 'policies' in profile:
+        for key, value in profile['policies'].items():
+            if key == 'payment_methods':
+                text += f"Formas de pagamento: {', '.join(value)}. "
+            elif key == 'delivery_fee':
+                text += f"Taxa de entrega: {value}. "
+            elif key == 'minimum_order':
+                text += f"Pedido mínimo: {value}. "
+            elif key == 'delivery_time':
+                text += f"Tempo de entrega: {value}. "
+            elif key == 'diagnostic_fee':
+                text += f"Taxa de diagnóstico: {value}. "
+            elif key == 'warranty':
+                text += f"Garantia: {value}. "
+            elif key == 'appointment_required' and value:
+                text += "Agendamento obrigatório para todos os serviços. "
+
+    return text
+
+
+def tone_guidelines(business_type):
+    """Regras gerais para IA responder de forma completa"""
+    tone_guidelines = ""
+
+    if business_type == 'delivery':
+        tone_guidelines = (
+            "Responda de forma leve, simpática e descontraída. "
+            "Use emojis quando fizer sentido (ex: 🍕😉). "
+            "Seja rápido nas respostas. Mantenha o clima de um atendimento de pizzaria ou restaurante informal."
+            "O cliente pode escolher até 2 sabores por pizza, sendo que o tamanho da pizza é sempre grande e o preço será do valor do sabor mais caro."
+            "SEMPRE informe o preço quando o cliente perguntar sobre produtos específicos. "
+            "Se o cliente perguntar por um sabor que não existe, informe que não temos esse sabor. "
+            "Informe sempre o horário de funcionamento quando relevante."
+            "Caso o cliente faça o pedido fora do horário de funcionamento, explique que estamos fechados e informe o próximo horário de abertura. "
+            "Se o cliente perguntar sobre formas de pagamento, informe: Pix, Dinheiro ou Cartão. "
+            "Mencione a taxa de entrega e pedido mínimo quando necessário. "
+        )
+
+    elif business_type == 'mechanic':
+        tone_guidelines = (
+            "Seja profissional, direto e prestativo. "
+            "Use linguagem técnica acessível. Foque em agendamentos, revisões, diagnósticos e informações claras. "
+            "Evite exageros ou brincadeiras. Mantenha um tom objetivo, mas cordial."
+            "SEMPRE informe preços dos serviços quando solicitado. "
+            "Explique que alguns serviços incluem apenas a mão de obra, sendo peças por conta do cliente. "
+            "Informe que é necessário agendar um horário para serviços de mecânica e que o preço final será informado após a avaliação."
+            "Se o cliente perguntar sobre preços, explique que é necessário trazer o veículo para uma avaliação antes de confirmar valores. "
+            "Se o cliente perguntar por serviços que não realizamos (ex: conserto residencial), informe de forma educada que só atendemos veículos automotores."
+        )
+
+    elif business_type == 'pharmacy':
+        tone_guidelines = (
+            "Seja educado, empático e confiável. "
+            "Oriente o cliente com clareza sobre medicamentos controlados e exigência de receita. "
+            "Use emojis de forma moderada (ex: 💊🙂). "
+            "SEMPRE informe preços quando solicitado. "
+            "Se o cliente perguntar por um produto que tem diferentes versões ou que exija prescrição, pergunte por mais detalhes como dosagem e tipo antes de confirmar. "
+            "Se não encontrar o produto ou serviço, informe claramente. "
+            "Se o cliente mencionar apenas o nome genérico de um medicamento (ex: 'Dipirona'), sempre pergunte pela dosagem e forma (comprimido, gotas, etc) antes de confirmar. "
+            "Se o medicamento for controlado ou exigir receita, informe claramente que só é possível vender mediante apresentação da receita física ou digital, conforme a legislação. "
+            "Se o cliente perguntar por um produto que não temos, informe de forma clara e educada."
+            "Informe sobre entrega em domicílio quando apropriado. "
+        )
+
+    return tone_guidelines
+
+
+def render_system_prompt(business_type, profiles=None, classify_inline=False):
+    """Monta o system prompt completo (caminho lento, sem cache)"""
+    profiles = business_context.business_profiles if profiles is None else profiles
+
+    # Conteúdo estático primeiro, do mais geral ao mais específico, para que
+    # o prefixo seja idêntico entre mensagens e conversas do mesmo negócio
+    system_prompt = "Você é um chatbot de atendimento ao cliente. "
+    system_prompt += RESPONSE_FORMAT_RULES + "\n\n"
+
+    if business_type in profiles:
+        system_prompt += render_profile(business_type, profiles[business_type])
+        system_prompt += tone_guidelines(business_type)
+    elif classify_inline:
+        # Negócio ainda não identificado (single_call): a resposta usa os
+        # dados do perfil certo já na primeira mensagem
+        system_prompt += UNCLASSIFIED_PROMPT
+        for profile_type, profile in profiles.items():
+            system_prompt += f"\n\n[{profile_type}] "
+            system_prompt += render_profile(profile_type, profile)
+            system_prompt += tone_guidelines(profile_type)
+
+    if classify_inline:
+        system_prompt += INLINE_CLASSIFICATION_PROMPT
+
+    return system_prompt
+
+
+# (business_type, classify_inline) -> (versão do perfil, prompt)
+_compiled_prompts = {}
+
+
+def compile_prompts(profiles=None):
+    """Renderiza os prompts de todos os perfis, refazendo só os alterados"""
+    profiles = business_context.business_profiles if profiles is None else profiles
+    recompiled = 0
+
+    for business_type in list(profiles) + ['unknown']:
+        # O prompt genérico com classificação inline lista todos os perfis
+        version = profile_version(
+            profiles[business_type] if business_type in profiles else profiles)
+        for classify_inline in (False, True):
+            key = (business_type, classify_inline)
+            cached = _compiled_prompts.get(key)
+            if cached and cached[0] == version:
+                continue
+            _compiled_prompts[key] = (version, render_system_prompt(
+                business_type, profiles, classify_inline))
+            recompiled += 1
+
+    return recompiled
+
+
+def get_system_prompt(business_type, classify_inline=False):
+    """Prompt já compilado; tipos fora dos perfis usam o prompt genérico"""
+    cached = _compiled_prompts.get((business_type, classify_inline))
+    if cached is None:
+        compile_prompts()
+        cached = _compiled_prompts.get((business_type, classify_inline)) or \
+            _compiled_prompts[('unknown', classify_inline)]
+    return cached[1]
+
+
+compile_prompts()
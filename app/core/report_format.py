@@ -0,0 +1,59 @@
+"""
+Formatação de campos nos relatórios exportados (CSV e PDF)
+"""
+
+from datetime import datetime
+
+
+def format_timestamp_br(timestamp):
+    """Formata timestamp para padrão brasileiro"""
+    if timestamp:
+        try:
+            if hasattr(timestamp, 'strftime'):
+                return timestamp.strftime("%d/%m/%Y %H:%M:%S")
+            else:
+                dt = datetime.fromisoformat(
+                    str(timestamp).replace('Z', '+00:00'))
+                return dt.strftime("%d/%m/%Y %H:%M:%S")
+        except:
+            return str(timestamp)
+    return "Não informado"
+
+
+def translate_business_type(business_type):
+    """Traduz business_type para português"""
+    mapping = {
+        "delivery": "Delivery",
+        "mecanica": "Mecânica",
+        "farmacia": "Farmácia",
+        "unknown": "Indefinido"
+    }
+    return mapping.get(str(business_type).lower(), business_type)
+
+
+def translate_status(status):
+    """Traduz status para português"""
+    mapping = {
+        "open": "Aberta",
+        "closed": "Fechada"
+    }
+    return mapping.get(str(status).lower(), status)
+
+
+def conversation_snapshot(conversation, effective=None):
+    """
+    Campos da conversa exibidos nos relatórios (serializáveis para os
+    workers). effective: (status, end_time) efetivos
+    (crud.effective_conversation_columns) no lugar dos gravados
+    """
+    status, end_time = effective or (conversation.status, conversation.end_time)
+    return {
+        'id': str(conversation.id),
+        'user_number': conversation.user_number,
+        'business_type': conversation.business_type,
+        'status': status,
+        'needs_human': conversation.needs_human,
+        'start_time': conversation.start_time,
+        'end_time': end_time,
+        'last_message_at': conversation.last_message_at,
+    }
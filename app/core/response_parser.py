@@ -0,0 +1,218 @@
+"""
+Interpretação tolerante do JSON devolvido pela OpenAI.
+
+Aceita cercas de código, texto antes/depois do objeto, aspas simples,
+literais do Python, vírgulas sobrando, quebras de linha dentro de strings e
+objetos truncados, para que a resposta não precise de uma segunda chamada.
+"""
+
+import json
+import os
+import re
+
+VALID_SENTIMENTS = ['POSITIVO', 'NEUTRO', 'NEGATIVO']
+
+# 'json_schema' (structured outputs), 'json_object' (JSON mode) ou 'off'
+OPENAI_JSON_MODE = os.getenv('OPENAI_JSON_MODE', 'json_schema')
+
+REPLY_JSON_SCHEMA = {
+    "name": "chatbot_reply",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "reply": {"type": "string"},
+            "sentiment": {"type": "string", "enum": VALID_SENTIMENTS},
+            "score": {"type": "number"},
+            "business_type": {
+                "type": "string",
+                "enum": ['delivery', 'mechanic', 'pharmacy', 'unknown']
+            }
+        },
+        "required": ["reply", "sentiment", "score", "business_type"],
+        "additionalProperties": False
+    }
+}
+
+CODE_FENCE = re.compile(r'```(?:json|JSON)?\s*(.*?)(?:```|$)', re.DOTALL)
+PYTHON_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+CLOSERS = {'{': '}', '[': ']'}
+JSON_KEY = re.compile(r'["\']\w+["\']\s*:')
+
+
+def reply_response_format(mode: str = OPENAI_JSON_MODE):
+    """Parâmetro response_format da OpenAI para o modo configurado"""
+    if mode == 'json_schema':
+        return {"type": "json_schema", "json_schema": REPLY_JSON_SCHEMA}
+    if mode == 'json_object':
+        return {"type": "json_object"}
+    return None
+
+
+def strip_code_fences(text):
+    match = CODE_FENCE.search(text)
+    return match.group(1).strip() if match else text
+
+
+def repair_json(text):
+    """
+    Reescreve um objeto "quase JSON" em JSON válido: aspas simples viram
+    duplas, True/False/None viram literais JSON, vírgulas antes de } ou ]
+    são removidas, quebras de linha em strings são escapadas e strings e
+    chaves abertas (resposta truncada) são fechadas.
+    """
+    output = []
+    stack = []
+    quote = None
+    i = 0
+
+    while i < len(text):
+        char = text[i]
+
+        if quote:
+            if char == '\\':
+                if i + 1 >= len(text):
+                    break
+                escaped = text[i + 1]
+                # \' não é escape válido em JSON
+                output.append("'" if escaped == "'" else text[i:i + 2])
+                i += 2
+                continue
+            if char == quote:
+                output.append('"')
+                quote = None
+            elif char == '"':
+                output.append('\\"')
+            elif char == '\n':
+                output.append('\\n')
+            elif char == '\r':
+                output.append('\\r')
+            elif char == '\t':
+                output.append('\\t')
+            else:
+                output.append(char)
+            i += 1
+            continue
+
+        if char in ('"', "'"):
+            quote = char
+            output.append('"')
+        elif char in CLOSERS:
+            stack.append(CLOSERS[char])
+            output.append(char)
+        elif char in ('}', ']'):
+            # Vírgula sobrando antes de fechar
+            while output and output[-1].isspace():
+                output.pop()
+            if output and output[-1] == ',':
+                output.pop()
+            if stack:
+                stack.pop()
+            output.append(char)
+            if not stack:
+                break
+        elif char.isalpha():
+            match = re.match(r'[A-Za-z_]+', text[i:])
+            word = match.group(0)
+            output.append(PYTHON_LITERALS.get(word, word))
+            i += len(word)
+            continue
+        else:
+            output.append(char)
+        i += 1
+
+    # Resposta truncada: fechar string, descartar par chave/valor incompleto
+    repaired = ''.join(output)
+    if quote:
+        repaired = re.sub(r'\\u[0-9a-fA-F]{0,3}$', '', repaired)
+        repaired = re.sub(r'\\u[dD][89abAB][0-9a-fA-F]{2}$', '', repaired)
+        repaired += '"'
+    repaired = re.sub(r'(\d)\.$', r'\1', repaired.rstrip())
+    if stack and stack[-1] == '}':
+        repaired = re.sub(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*:?\s*-?$', r'\1', repaired)
+    repaired = re.sub(r'[,:]\s*$', '', repaired)
+    return repaired + ''.join(reversed(stack))
+
+
+def _first_object(text):
+    """
+    Primeiro objeto do texto: a partir de cada '{', tenta decodificar direto
+    e depois reparado (o objeto mais cedo vence texto ou JSON posteriores)
+    """
+    decoder = json.JSONDecoder()
+    start = text.find('{')
+    while start != -1:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+            if isinstance(value, dict):
+                return value
+        except json.JSONDecodeError:
+            pass
+        try:
+            value = json.loads(repair_json(text[start:]))
+            if isinstance(value, dict):
+                return value
+        except json.JSONDecodeError:
+            pass
+        start = text.find('{', start + 1)
+    return None
+
+
+def normalize_reply_data(data):
+    """Garante sentiment válido e score numérico entre -1.0 e 1.0"""
+    sentiment = str(data.get('sentiment') or 'NEUTRO').strip().upper()
+    data['sentiment'] = sentiment if sentiment in VALID_SENTIMENTS else 'NEUTRO'
+
+    try:
+        score = float(data.get('score', 0.0))
+    except (TypeError, ValueError):
+        score = 0.0
+    data['score'] = max(-1.0, min(1.0, score))
+
+    if data.get('reply') is not None and not isinstance(data['reply'], str):
+        data['reply'] = str(data['reply'])
+    return data
+
+
+def parse_reply(text):
+    """
+    Retorna (dados, resultado), com resultado em 'direct', 'repaired',
+    'plain_text' ou 'empty'
+    """
+    if text is None:
+        return None, 'empty'
+
+    text = text.strip().lstrip('﻿')
+    if not text:
+        return None, 'empty'
+
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return normalize_reply_data(data), 'direct'
+    except json.JSONDecodeError:
+        pass
+
+    candidate = strip_code_fences(text)
+    data = _first_object(candidate)
+    if data is not None:
+        return normalize_reply_data(data), 'repaired'
+
+    # Texto antes de um JSON irrecuperável ainda pode ser a mensagem
+    start_idx = candidate.find('{')
+    if start_idx > 0 and JSON_KEY.search(candidate, start_idx):
+        text = candidate[:start_idx].strip()
+
+    # Se a resposta não contém JSON mas tem conteúdo, usar como reply
+    return {
+        "reply": text,
+        "sentiment": "NEUTRO",
+        "score": 0.0
+    }, 'plain_text'
+
+
+def extract_json_from_response(text):
+    """
+    Extrai JSON da resposta da OpenAI de forma mais robusta
+    """
+    return parse_reply(text)[0]
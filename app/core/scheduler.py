@@ -0,0 +1,77 @@
+"""
+Tarefas periódicas executadas em segundo plano pela API.
+
+Com vários processos (workers ou containers) cada job roda em um só: o
+que detém o advisory lock do job (locks.LeaderLock). Os outros conferem a
+cada intervalo e assumem se o líder cair. O treino do classificador local
+roda em todos, porque cada processo tem o seu modelo em memória.
+"""
+
+import asyncio
+import os
+from app.db.session import SessionLocal
+from app.db import crud, locks, rollups
+from app.core import business_classifier
+
+EXPIRY_INTERVAL_SECONDS = int(os.getenv('EXPIRY_INTERVAL_SECONDS', '60'))
+ROLLUP_INTERVAL_SECONDS = int(os.getenv('ROLLUP_INTERVAL_SECONDS', '60'))
+
+
+expiry_leader = locks.LeaderLock('expiry')
+rollup_leader = locks.LeaderLock('rollups')
+
+
+def run_expiry_once():
+    if not expiry_leader.acquire():
+        return None
+    db = SessionLocal()
+    try:
+        return crud.close_inactive_conversations(db)
+    finally:
+        db.close()
+
+
+def run_rollup_once():
+    if not rollup_leader.acquire():
+        return None
+    db = SessionLocal()
+    try:
+        return rollups.refresh_message_rollups(db)
+    finally:
+        db.close()
+
+
+def train_business_classifier():
+    db = SessionLocal()
+    try:
+        business_classifier.train_from_history(db)
+    except Exception as e:
+        print(f"❌ Erro ao treinar classificador local: {e}")
+    finally:
+        db.close()
+
+
+async def expiry_loop(interval_seconds: int = EXPIRY_INTERVAL_SECONDS):
+    """Encerra conversas inativas fora do caminho da requisição"""
+    while True:
+        try:
+            await asyncio.to_thread(run_expiry_once)
+        except Exception as e:
+            print(f"❌ Erro ao encerrar conversas inativas: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+async def rollup_loop(interval_seconds: int = ROLLUP_INTERVAL_SECONDS):
+    """Mantém o agregado por hora usado nos gráficos do dashboard"""
+    while True:
+        try:
+            await asyncio.to_thread(run_rollup_once)
+        except Exception as e:
+            print(f"❌ Erro ao atualizar agregado de mensagens: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+def release_locks():
+    """Libera os jobs para outro processo assumir (desligamento)"""
+    expiry_leader.release()
+    rollup_leader.release()
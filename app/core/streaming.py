@@ -0,0 +1,119 @@
+"""
+Leitura incremental do campo "reply" enquanto a OpenAI ainda está gerando
+o JSON da resposta, liberando o texto frase a frase.
+"""
+
+import re
+
+REPLY_KEY = re.compile(r'"reply"\s*:\s*"')
+SENTENCE_END = re.compile(r'[.!?…]+["\')\]]*\s+|\n+')
+
+ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b',
+           'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+HEX4 = re.compile(r'[0-9a-fA-F]{4}')
+
+
+def unicode_escape(raw, i):
+    """Código do escape \\uXXXX em raw[i:i + 6], ou None se malformado"""
+    if raw[i:i + 2] != '\\u' or not HEX4.fullmatch(raw[i + 2:i + 6]):
+        return None
+    return int(raw[i + 2:i + 6], 16)
+
+
+class ReplyStreamParser:
+    """
+    Recebe os pedaços de texto do stream (feed) e devolve as frases completas
+    do campo "reply" assim que ficam prontas.
+    """
+
+    def __init__(self):
+        self.raw = ''
+        self.position = None  # início do valor de "reply" em raw
+        self.pending = ''     # texto decodificado ainda não liberado
+        self.finished = False
+        self.emitted = False
+
+    def feed(self, chunk):
+        self.raw += chunk
+        if self.finished:
+            return []
+
+        if self.position is None:
+            match = REPLY_KEY.search(self.raw)
+            if not match:
+                return []
+            self.position = match.end()
+
+        self._decode()
+        return self._sentences(final=self.finished)
+
+    def flush(self):
+        """Libera o que sobrou do reply (stream encerrado)"""
+        return self._sentences(final=True)
+
+    def _decode(self):
+        raw, i = self.raw, self.position
+        decoded = []
+        while i < len(raw):
+            char = raw[i]
+            if char == '"':
+                self.finished = True
+                i += 1
+                break
+            if char != '\\':
+                decoded.append(char)
+                i += 1
+                continue
+
+            # Escape incompleto: espera o próximo pedaço
+            if i + 1 >= len(raw):
+                break
+            code = raw[i + 1]
+            if code != 'u':
+                decoded.append(ESCAPES.get(code, code))
+                i += 2
+                continue
+            if i + 6 > len(raw):
+                break
+            codepoint = unicode_escape(raw, i)
+            if codepoint is None:
+                # Escape malformado: mantém os caracteres como texto
+                decoded.append(raw[i:i + 2])
+                i += 2
+                continue
+            if 0xD800 <= codepoint < 0xDC00:
+                # Par substituto (emoji): precisa das duas metades
+                following = raw[i + 6:i + 12]
+                if len(following) < 6 and '\\u'.startswith(following[:2]):
+                    break
+                low = unicode_escape(raw, i + 6)
+                if low is not None and 0xDC00 <= low < 0xE000:
+                    decoded.append(chr(0x10000 + ((codepoint - 0xD800) << 10) + (low - 0xDC00)))
+                    i += 12
+                    continue
+            if 0xD800 <= codepoint < 0xE000:
+                # Metade de par sem a outra: texto, não um caractere inválido
+                decoded.append(raw[i:i + 6])
+            else:
+                decoded.append(chr(codepoint))
+            i += 6
+
+        self.position = i
+        self.pending += ''.join(decoded)
+
+    def _sentences(self, final=False):
+        sentences = []
+        last = 0
+        for match in SENTENCE_END.finditer(self.pending):
+            sentences.append(self.pending[last:match.end()].strip())
+            last = match.end()
+        self.pending = self.pending[last:]
+
+        if final and self.pending.strip():
+            sentences.append(self.pending.strip())
+            self.pending = ''
+
+        sentences = [s for s in sentences if s]
+        if sentences:
+            self.emitted = True
+        return sentences
@@ -0,0 +1,108 @@
+"""
+Fila por cliente das mensagens recebidas (por processo).
+
+O WhatsApp entrega rajadas de mensagens curtas e cada uma chega ao webhook
+em uma requisição própria. Sem fila, as requisições do mesmo cliente rodam
+em paralelo: leem o mesmo histórico, chamam a OpenAI cada uma e podem criar
+conversas duplicadas em get_or_create_conversation. Aqui as mensagens de
+um user_number são processadas uma rodada de cada vez, na ordem de chegada.
+
+Com USER_QUEUE_DEBOUNCE_MS > 0, a rodada espera o cliente ficar essa janela
+sem mandar mensagem e responde de uma vez todas as que chegaram (até
+USER_QUEUE_MAX_BURST), inclusive as que chegaram enquanto a rodada anterior
+era processada: uma chamada à OpenAI por rajada. A primeira requisição da
+rajada leva a resposta; as outras saem sem reply (merged).
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+USER_QUEUE_ENABLED = os.getenv('USER_QUEUE_ENABLED', 'true').lower() == 'true'
+USER_QUEUE_DEBOUNCE_MS = int(os.getenv('USER_QUEUE_DEBOUNCE_MS', '0'))
+USER_QUEUE_MAX_BURST = int(os.getenv('USER_QUEUE_MAX_BURST', '10'))
+
+queue_stats = {
+    'requests': 0,
+    'rounds': 0,
+    'merged': 0,
+    'waited': 0,
+    'largest_burst': 0,
+}
+
+
+class _UserQueue:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = []
+        self.last_arrival = 0.0
+        self.requests = 0
+
+
+# user_number -> fila (só enquanto há requisições do cliente)
+_queues = {}
+
+
+async def _quiet_period(queue):
+    """Espera o cliente ficar USER_QUEUE_DEBOUNCE_MS sem mandar mensagem"""
+    loop = asyncio.get_running_loop()
+    while len(queue.pending) < USER_QUEUE_MAX_BURST:
+        wait = queue.last_arrival + USER_QUEUE_DEBOUNCE_MS / 1000 - loop.time()
+        if wait <= 0:
+            return
+        await asyncio.sleep(wait)
+
+
+@asynccontextmanager
+async def turn(user_number: str, content: str):
+    """
+    Vez do cliente: entrega a lista de mensagens que esta requisição deve
+    responder (em ordem), com as outras requisições do cliente esperando.
+    Lista vazia: a mensagem já foi respondida junto com outra da rajada.
+    """
+    if not USER_QUEUE_ENABLED:
+        yield [content]
+        return
+
+    queue = _queues.get(user_number)
+    if queue is None:
+        queue = _queues[user_number] = _UserQueue()
+    queue.requests += 1
+    queue_stats['requests'] += 1
+    if queue.lock.locked():
+        queue_stats['waited'] += 1
+
+    try:
+        if USER_QUEUE_DEBOUNCE_MS <= 0:
+            async with queue.lock:
+                queue_stats['rounds'] += 1
+                yield [content]
+            return
+
+        queue.pending.append(content)
+        queue.last_arrival = asyncio.get_running_loop().time()
+        async with queue.lock:
+            # A rodada anterior pode ter levado esta mensagem; as que chegaram
+            # depois dela esperam o fim da rajada
+            await _quiet_period(queue)
+            batch = queue.pending[:USER_QUEUE_MAX_BURST]
+            del queue.pending[:USER_QUEUE_MAX_BURST]
+            if batch:
+                queue_stats['rounds'] += 1
+                queue_stats['merged'] += len(batch) - 1
+                queue_stats['largest_burst'] = max(queue_stats['largest_burst'], len(batch))
+            yield batch
+    finally:
+        queue.requests -= 1
+        if queue.requests == 0:
+            del _queues[user_number]
+
+
+def snapshot():
+    return {
+        'enabled': USER_QUEUE_ENABLED,
+        'debounce_ms': USER_QUEUE_DEBOUNCE_MS,
+        'max_burst': USER_QUEUE_MAX_BURST,
+        'active_users': len(_queues),
+        **queue_stats,
+    }
@@ -0,0 +1,300 @@
+"""
+Variantes assíncronas (asyncpg) das operações de crud usadas no webhook
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy import case, desc, func, inspect, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import models
+from app.core import analytics, conversation_cache
+from app.db.crud import INACTIVITY_MINUTES, open_conversation_insert
+
+
+async def get_or_create_conversation(db: AsyncSession, user_number: str):
+
+    # Verificar se existe conversa aberta para este usuário
+    result = await db.execute(
+        select(models.Conversation).where(
+            models.Conversation.user_number == user_number,
+            models.Conversation.status == 'open'
+        ).order_by(desc(models.Conversation.start_time)).limit(1)
+    )
+    last_conversation = result.scalars().first()
+
+    if last_conversation:
+        cutoff_time = datetime.now(timezone.utc) - \
+            timedelta(minutes=INACTIVITY_MINUTES)
+
+        if last_conversation.last_message_at and last_conversation.last_message_at >= cutoff_time:
+            return last_conversation
+        else:
+            # Esta conversa específica deve ser fechada
+            last_conversation.status = 'closed'
+            # Mesmo fim que as leituras mostram (effective_conversation_columns)
+            last_conversation.end_time = last_conversation.last_message_at or \
+                datetime.now(timezone.utc)
+            await db.commit()
+            conversation_cache.invalidate(user_number)
+
+    # Criar nova conversa (ou usar a que outro processo acabou de criar)
+    new_conversation = (await db.execute(
+        open_conversation_insert(user_number))).scalars().first()
+    await db.commit()
+    if new_conversation is None:
+        result = await db.execute(
+            select(models.Conversation).where(
+                models.Conversation.user_number == user_number,
+                models.Conversation.status == 'open'
+            )
+        )
+        new_conversation = result.scalars().first()
+    return new_conversation
+
+
+async def touch_cached_conversation(db: AsyncSession, user_number: str, from_user: bool, now,
+                                    cache_lookup: str):
+    """
+    Registra a mensagem na conversa em cache sem ler o banco: UPDATE só se a
+    versão da linha ainda é a do cache. Devolve (id, nova versão) ou None.
+    """
+    state = conversation_cache.get(
+        user_number, active_since=now - timedelta(minutes=INACTIVITY_MINUTES),
+        purpose=cache_lookup)
+    if state is None:
+        return None
+
+    version = await update_conversation(
+        db, {'last_message_at': now, **analytics.counter_values(from_user, now)},
+        models.Conversation.id == state['conversation_id'],
+        models.Conversation.version == state['version'],
+        models.Conversation.status == 'open'
+    )
+    if version is None:
+        # Outro processo gravou ou encerrou a conversa: segue pelo banco
+        conversation_cache.invalidate(user_number, conflict=True)
+        return None
+    return state['conversation_id'], version
+
+
+async def create_message(db: AsyncSession, user_number: str, content: str, from_user=True,
+                         business_type='unknown', inbound_id=None, cache_lookup=None):
+    """
+    Grava a mensagem na conversa aberta. inbound_id: linha da fila durável
+    que recebe o id da mensagem na mesma transação (inbound_queue).
+    cache_lookup: finalidade da consulta ao cache (padrão: 'request' para a
+    mensagem do cliente, 'reply' para a do bot)
+    """
+    now = datetime.now(timezone.utc)
+    cached = await touch_cached_conversation(
+        db, user_number, from_user, now,
+        cache_lookup or ('request' if from_user else 'reply'))
+    if cached:
+        conversation_id, version = cached
+    else:
+        conversation = await get_or_create_conversation(db, user_number)
+        # Mesmo instante para a mensagem e para a última atividade da conversa
+        conversation.last_message_at = now
+        analytics.record_message(conversation, from_user, now)
+        conversation_id = conversation.id
+
+    db_message = models.Message(
+        user_number=user_number,
+        content=content,
+        from_user=from_user,
+        business_type=business_type,
+        conversation_id=conversation_id,
+        timestamp=now
+    )
+
+    db.add(db_message)
+    if inbound_id is not None:
+        await db.flush()
+        await mark_inbound_persisted(db, [(inbound_id, db_message.id)])
+    await db.commit()
+    if cached:
+        conversation_cache.add_messages(
+            user_number, conversation_id, version, [(from_user, content, now)])
+    return db_message
+
+
+async def mark_inbound_persisted(db: AsyncSession, pairs):
+    """Anota nas linhas da fila durável [(id, message_id)] as mensagens gravadas"""
+    for inbound_id, message_id in pairs:
+        await db.execute(
+            update(models.InboundMessage)
+            .where(models.InboundMessage.id == inbound_id)
+            .values(message_id=message_id)
+        )
+
+
+async def message_conversation_id(db: AsyncSession, message_id):
+    result = await db.execute(
+        select(models.Message.conversation_id).where(models.Message.id == message_id))
+    return result.scalar()
+
+
+async def load_conversation_state(db: AsyncSession, user_number: str, conversation_id, limit: int):
+    """
+    Conversa e mensagens ainda não resumidas (até `limit`) para montar a
+    resposta: do cache quando ele tem esta conversa, senão do banco (e o
+    resultado vai para o cache)
+    """
+    state = conversation_cache.get(user_number, purpose='state')
+    if state is not None and state['conversation_id'] == conversation_id:
+        return conversation_cache.attach(db, state), conversation_cache.message_objects(state)
+
+    conversation = await get_conversation(db, conversation_id)
+    messages = await get_recent_messages(
+        db, conversation_id, after=conversation.summarized_until, limit=limit)
+    if conversation.status == 'open':
+        conversation_cache.store(conversation, messages, limit)
+    return conversation, messages
+
+
+async def open_conversation_state(db: AsyncSession, user_number: str, now, limit: int):
+    """
+    Unidade de trabalho: conversa aberta do cliente e mensagens ainda não
+    resumidas, sem gravar a mensagem recebida (do cache quando possível)
+    """
+    state = conversation_cache.get(
+        user_number, active_since=now - timedelta(minutes=INACTIVITY_MINUTES),
+        purpose='request')
+    if state is not None:
+        return conversation_cache.attach(db, state), conversation_cache.message_objects(state)
+
+    conversation = await get_or_create_conversation(db, user_number)
+    messages = await get_recent_messages(
+        db, conversation.id, after=conversation.summarized_until, limit=limit)
+    conversation_cache.store(conversation, messages, limit)
+    return conversation, messages
+
+
+def pending_changes(conversation: models.Conversation) -> dict:
+    """Atributos alterados e ainda não gravados (valores ou expressões SQL)"""
+    return {attr.key: attr.history.added[0]
+            for attr in inspect(conversation).attrs if attr.history.added}
+
+
+async def update_conversation(db: AsyncSession, values: dict, *conditions) -> Optional[int]:
+    """UPDATE de uma conversa; devolve a nova versão ou None se nenhuma linha atendeu"""
+    result = await db.execute(
+        update(models.Conversation)
+        .where(*conditions)
+        .values(**values)
+        .returning(models.Conversation.version)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalar()
+
+
+async def save_exchange(db: AsyncSession, user_number: str, conversation: models.Conversation,
+                        messages, inbound_ids=()):
+    """
+    Unidade de trabalho: grava em uma transação as mensagens da troca
+    [(from_user, content, business_type, timestamp)] e as alterações
+    pendentes da conversa, com um UPDATE condicionado à versão lida e um
+    INSERT das mensagens. Se outro processo gravou ou encerrou a conversa
+    nesse meio-tempo, grava mesmo assim na conversa lida: a resposta foi
+    gerada com o contexto dela. A mensagem recebida só é gravada aqui, então
+    o job de expiração pode encerrar a conversa durante a OpenAI; nesse caso
+    ela continua encerrada e o fim passa a ser esta troca. Só se a conversa
+    não existe mais a troca vai para a conversa aberta atual, sem as
+    alterações da antiga. inbound_ids: linhas da fila durável das primeiras
+    mensagens, anotadas na mesma transação. Devolve o id da conversa.
+    """
+    last_message_at = messages[-1][3]
+    counters = analytics.exchange_counter_values(
+        [(from_user, timestamp) for from_user, _, _, timestamp in messages])
+    values = {**pending_changes(conversation), 'last_message_at': last_message_at, **counters}
+    # As alterações vão no UPDATE abaixo, não no flush do objeto
+    db.expunge(conversation)
+
+    conversation_id = conversation.id
+    version = await update_conversation(
+        db, values,
+        models.Conversation.id == conversation_id,
+        models.Conversation.version == conversation.version,
+        models.Conversation.status == 'open'
+    )
+    if version is None:
+        conversation_cache.invalidate(user_number, conflict=True)
+        version = await update_conversation(db, {
+            **values,
+            'end_time': case((models.Conversation.status == 'closed', last_message_at),
+                             else_=models.Conversation.end_time),
+        }, models.Conversation.id == conversation_id)
+    if version is None:
+        current = await get_or_create_conversation(db, user_number)
+        conversation_id = current.id
+        version = await update_conversation(
+            db, {'last_message_at': last_message_at, **counters},
+            models.Conversation.id == conversation_id)
+
+    rows = [models.Message(
+        user_number=user_number,
+        content=content,
+        from_user=from_user,
+        business_type=business_type,
+        conversation_id=conversation_id,
+        timestamp=timestamp
+    ) for from_user, content, business_type, timestamp in messages]
+    db.add_all(rows)
+    if inbound_ids:
+        await db.flush()
+        await mark_inbound_persisted(
+            db, [(inbound_id, row.id) for inbound_id, row in zip(inbound_ids, rows)])
+    await db.commit()
+
+    conversation_cache.add_messages(
+        user_number, conversation_id, version,
+        [(from_user, content, timestamp) for from_user, content, _, timestamp in messages],
+        business_type=values.get('business_type'))
+    return conversation_id
+
+
+async def get_conversation(db: AsyncSession, conversation_id) -> Optional[models.Conversation]:
+    result = await db.execute(
+        select(models.Conversation).where(
+            models.Conversation.id == conversation_id)
+    )
+    return result.scalars().first()
+
+
+async def get_messages(db: AsyncSession, conversation_id) -> List[models.Message]:
+    result = await db.execute(
+        select(models.Message).where(
+            models.Message.conversation_id == conversation_id
+        ).order_by(models.Message.timestamp)
+    )
+    return list(result.scalars().all())
+
+
+async def get_recent_messages(db: AsyncSession, conversation_id, after=None, limit: int = 30) -> List[models.Message]:
+    """Últimas `limit` mensagens posteriores a `after`, em ordem cronológica"""
+    query = select(models.Message).where(
+        models.Message.conversation_id == conversation_id)
+    if after is not None:
+        query = query.where(models.Message.timestamp > after)
+    result = await db.execute(
+        query.order_by(desc(models.Message.timestamp)).limit(limit))
+    return list(reversed(result.scalars().all()))
+
+
+async def get_messages_after(db: AsyncSession, conversation_id, after=None, limit: int = 100) -> List[models.Message]:
+    """Primeiras `limit` mensagens posteriores a `after`, em ordem cronológica"""
+    query = select(models.Message).where(
+        models.Message.conversation_id == conversation_id)
+    if after is not None:
+        query = query.where(models.Message.timestamp > after)
+    result = await db.execute(
+        query.order_by(models.Message.timestamp).limit(limit))
+    return list(result.scalars().all())
+
+
+def add_llm_usage(conversation: models.Conversation, message_stats: dict):
+    """Soma o consumo da OpenAI da mensagem na conversa (UPDATE atômico)"""
+    for column in ('llm_calls', 'llm_seconds', 'prompt_tokens', 'completion_tokens', 'cached_tokens'):
+        if message_stats.get(column):
+            setattr(conversation, column, func.coalesce(
+                getattr(models.Conversation, column), 0) + message_stats[column])
@@ -1,54 +1,90 @@
 from datetime import datetime, timedelta, timezone
 import pytz
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_, func
+from sqlalchemy import desc, and_, case, func, text, update
+from sqlalchemy.dialects.postgresql import insert
 from app.db import models
+from app.core import analytics, conversation_cache
 from app.db.models import Conversation, Message
 from typing import Optional, List
+import os
 import uuid
 
 BRAZIL_TZ = pytz.timezone('America/Sao_Paulo')
 
+INACTIVITY_MINUTES = int(os.getenv('CONVERSATION_INACTIVITY_MINUTES', '60'))
 
-def close_inactive_conversations(db: Session, inactivity_minutes: int = 60):
+
+def close_inactive_conversations(db: Session, inactivity_minutes: int = INACTIVITY_MINUTES):
+    """
+    Encerra em um único UPDATE todas as conversas abertas sem mensagens
+    desde o corte de inatividade. O fim é a última mensagem, o mesmo que as
+    leituras já mostravam antes do job (effective_conversation_columns).
+    Retorna os IDs encerrados.
+    """
     cutoff_time = datetime.now(timezone.utc) - \
         timedelta(minutes=inactivity_minutes)
 
-    open_conversations = db.query(models.Conversation).filter(
-        models.Conversation.status == 'open'
-    ).all()
+    stmt = (
+        update(models.Conversation)
+        .where(
+            models.Conversation.status == 'open',
+            models.Conversation.last_message_at < cutoff_time
+        )
+        .values(status='closed', end_time=models.Conversation.last_message_at)
+        .returning(models.Conversation.id)
+        .execution_options(synchronize_session=False)
+    )
 
-    closed_count = 0
+    closed_ids = db.execute(stmt).scalars().all()
+    db.commit()
+    conversation_cache.invalidate_conversations(closed_ids)
 
-    for conversation in open_conversations:
-        last_message = db.query(models.Message).filter(
-            models.Message.conversation_id == conversation.id
-        ).order_by(desc(models.Message.timestamp)).first()
+    if closed_ids:
+        print(f"✅ Encerradas {len(closed_ids)} conversas inativas")
 
-        should_close = False
+    return closed_ids
 
-        if not last_message:
-            should_close = conversation.start_time < cutoff_time
-        else:
-            should_close = last_message.timestamp < cutoff_time
 
-        if should_close:
-            conversation.status = 'closed'
-            conversation.end_time = datetime.now(timezone.utc)
-            closed_count += 1
+def effective_conversation_columns(inactivity_minutes: int = INACTIVITY_MINUTES):
+    """
+    (status, end_time) como expressões SQL que já tratam como encerradas as
+    conversas abertas sem mensagens desde o corte de inatividade, para que
+    leituras fiquem corretas sem esperar o UPDATE do job de expiração.
+    """
+    cutoff_time = datetime.now(timezone.utc) - \
+        timedelta(minutes=inactivity_minutes)
+    expired = and_(
+        models.Conversation.status == 'open',
+        models.Conversation.last_message_at < cutoff_time
+    )
+    status = case((expired, 'closed'), else_=models.Conversation.status)
+    end_time = case(
+        (expired, models.Conversation.last_message_at),
+        else_=models.Conversation.end_time
+    )
+    return status, end_time
 
-    if closed_count > 0:
-        db.commit()
-        print(f"✅ Encerradas {closed_count} conversas inativas")
 
-    return closed_count
+def open_conversation_insert(user_number: str):
+    """
+    INSERT da conversa aberta do cliente que não falha se outro processo
+    criou a dele ao mesmo tempo (índice único parcial: user_number WHERE
+    status = 'open'). Devolve a conversa criada ou nenhuma linha.
+    """
+    return (
+        insert(models.Conversation)
+        .values(user_number=user_number, status='open', business_type='unknown')
+        .on_conflict_do_nothing(
+            index_elements=['user_number'],
+            # Literal (não parâmetro) para o Postgres reconhecer o índice parcial
+            index_where=text("status = 'open'"))
+        .returning(models.Conversation)
+    )
 
 
 def get_or_create_conversation(db: Session, user_number: str):
 
-    # Limpar conversas inativas a cada chamada
-    close_inactive_conversations(db)
-
     # Verificar se existe conversa aberta para este usuário
     last_conversation = db.query(models.Conversation).filter(
         models.Conversation.user_number == user_number,
@@ -56,44 +92,48 @@ def get_or_create_conversation(db: Session, user_number: str):
     ).order_by(desc(models.Conversation.start_time)).first()
 
     if last_conversation:
-        sixty_minutes_ago = datetime.now(timezone.utc) - timedelta(minutes=60)
-
-        last_message = db.query(models.Message).filter(
-            models.Message.conversation_id == last_conversation.id
-        ).order_by(desc(models.Message.timestamp)).first()
+        cutoff_time = datetime.now(timezone.utc) - \
+            timedelta(minutes=INACTIVITY_MINUTES)
 
-        if last_message and last_message.timestamp >= sixty_minutes_ago:
+        if last_conversation.last_message_at and last_conversation.last_message_at >= cutoff_time:
             return last_conversation
         else:
             # Esta conversa específica deve ser fechada
             last_conversation.status = 'closed'
-            last_conversation.end_time = datetime.now(timezone.utc)
+            # Mesmo fim que as leituras mostram (effective_conversation_columns)
+            last_conversation.end_time = last_conversation.last_message_at or \
+                datetime.now(timezone.utc)
             db.commit()
 
-    # Criar nova conversa
-    new_conversation = models.Conversation(
-        user_number=user_number,
-        status='open',
-        business_type='unknown'
-    )
-    db.add(new_conversation)
+    # Criar nova conversa (ou usar a que outro processo acabou de criar)
+    new_conversation = db.execute(
+        open_conversation_insert(user_number)).scalars().first()
     db.commit()
-    db.refresh(new_conversation)
+    if new_conversation is None:
+        new_conversation = db.query(models.Conversation).filter(
+            models.Conversation.user_number == user_number,
+            models.Conversation.status == 'open'
+        ).first()
     return new_conversation
 
 
 def create_message(db: Session, user_number: str, content: str, from_user=True, business_type='unknown'):
     conversation = get_or_create_conversation(db, user_number)
+    now = datetime.now(timezone.utc)
 
     db_message = models.Message(
         user_number=user_number,
         content=content,
         from_user=from_user,
         business_type=business_type,
-        conversation_id=conversation.id
+        conversation_id=conversation.id,
+        timestamp=now
     )
 
     db.add(db_message)
+    # Mesmo instante para a mensagem e para a última atividade da conversa
+    conversation.last_message_at = now
+    analytics.record_message(conversation, from_user, now)
     db.commit()
     db.refresh(db_message)
     return db_message
@@ -150,6 +190,27 @@ def get_conversation_by_id(db: Session, conversation_id: str) -> Optional[Conver
         return None
 
 
+def get_conversation_with_effective_state(db: Session, conversation_id: str):
+    """
+    Conversa pelo ID com o (status, end_time) efetivos, os mesmos de
+    /admin/conversations e da exportação em lote: (conversa, (status,
+    end_time)) ou None
+    """
+    try:
+        conversation_uuid = uuid.UUID(conversation_id) if isinstance(conversation_id, str) \
+            else conversation_id
+    except ValueError:
+        return None
+    status, end_time = effective_conversation_columns()
+    row = db.query(Conversation, status, end_time).filter(
+        Conversation.id == conversation_uuid
+    ).first()
+    if row is None:
+        return None
+    conversation, effective_status, effective_end_time = row
+    return conversation, (effective_status, effective_end_time)
+
+
 def get_messages_by_conversation_id(db: Session, conversation_id: str) -> List[Message]:
     """
     Busca todas as mensagens de uma conversa específica
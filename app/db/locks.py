@@ -0,0 +1,92 @@
+"""
+Advisory locks do Postgres para coordenar vários processos da API (workers
+do uvicorn/gunicorn ou containers). A chave é (classe, hashtext(nome)).
+
+As conexões dos líderes saem de um engine próprio sem pool (NullPool): uma
+por job liderado, fora de DB_POOL_SIZE/DB_MAX_OVERFLOW, sem tirar conexões
+das requisições.
+"""
+
+import threading
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.pool import NullPool
+from app.db.session import DATABASE_URL
+
+leader_engine = create_engine(DATABASE_URL, poolclass=NullPool)
+
+# Classes das chaves (primeiro inteiro do lock)
+INBOUND_USER_LOCK_CLASS = 24
+JOB_LOCK_CLASS = 25
+
+
+def lock_key(lock_class: int, name: str):
+    return lock_class, func.hashtext(name)
+
+
+class LeaderLock:
+    """
+    Lock de sessão mantido em uma conexão dedicada enquanto o processo
+    vive: só o processo que o detém roda o job. Se ele cair, a conexão fecha,
+    o Postgres libera o lock e o próximo processo que tentar assume.
+
+    acquire (na thread do job) e release (no desligamento) passam pelo mesmo
+    threading.Lock; depois do release o processo não assume mais o job.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.connection = None
+        self.closed = False
+        self.mutex = threading.Lock()
+
+    def acquire(self) -> bool:
+        """True se este processo é (ou acabou de virar) o líder do job"""
+        with self.mutex:
+            if self.closed:
+                return False
+            return self._acquire()
+
+    def _acquire(self) -> bool:
+        if self.connection is not None:
+            try:
+                # Conexão perdida (ex.: banco reiniciado) também perde o lock
+                self.connection.execute(select(1))
+                self.connection.commit()
+                return True
+            except Exception as e:
+                print(f"⚠️ Conexão do lock '{self.name}' perdida: {e}")
+                self._drop()
+
+        connection = leader_engine.connect()
+        try:
+            acquired = connection.execute(select(func.pg_try_advisory_lock(
+                *lock_key(JOB_LOCK_CLASS, self.name)))).scalar()
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        print(f"✅ Este processo assumiu o job '{self.name}'")
+        self.connection = connection
+        return True
+
+    def release(self):
+        """Libera o job para outro processo (desligamento)"""
+        with self.mutex:
+            self.closed = True
+            self._drop()
+
+    def _drop(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.execute(select(func.pg_advisory_unlock(
+                *lock_key(JOB_LOCK_CLASS, self.name))))
+            self.connection.commit()
+            self.connection.close()
+        except Exception:
+            # Conexão quebrada: o Postgres já liberou o lock
+            self.connection.invalidate()
+        self.connection = None
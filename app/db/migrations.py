@@ -0,0 +1,104 @@
+"""
+Migrações idempotentes para bancos criados antes das novas colunas/índices.
+Bancos novos já saem completos com models.Base.metadata.create_all.
+"""
+
+from sqlalchemy import text
+from app.db.session import engine
+
+MIGRATIONS = [
+    # last_message_at desnormalizado + índice de expiração
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMPTZ",
+    """
+    UPDATE conversations c
+    SET last_message_at = COALESCE(
+        (SELECT MAX(m.timestamp) FROM messages m WHERE m.conversation_id = c.id),
+        c.start_time
+    )
+    WHERE c.last_message_at IS NULL
+    """,
+    "ALTER TABLE conversations ALTER COLUMN last_message_at SET DEFAULT now()",
+    "CREATE INDEX IF NOT EXISTS ix_conversations_status_last_message_at "
+    "ON conversations (status, last_message_at)",
+    # Consumo de tokens por conversa
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS llm_calls INTEGER DEFAULT 0",
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS llm_seconds DOUBLE PRECISION DEFAULT 0",
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS prompt_tokens INTEGER DEFAULT 0",
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS completion_tokens INTEGER DEFAULT 0",
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS cached_tokens INTEGER DEFAULT 0",
+    # Resumo incremental do histórico
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary TEXT",
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summarized_until TIMESTAMPTZ",
+    # Período e paginação keyset de mensagens
+    "CREATE INDEX IF NOT EXISTS ix_messages_timestamp_id ON messages (timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS ix_conversations_start_time_id ON conversations (start_time, id)",
+    # Agregado por hora para os gráficos do dashboard
+    """
+    CREATE TABLE IF NOT EXISTS message_rollups (
+        hour TIMESTAMPTZ NOT NULL,
+        business_type VARCHAR NOT NULL,
+        from_user BOOLEAN NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, business_type, from_user)
+    )
+    """,
+    # Marca d'água do backup incremental
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT now()",
+    "CREATE INDEX IF NOT EXISTS ix_conversations_updated_at_id ON conversations (updated_at, id)",
+    # Contadores do analytics (backfill: python -m app.core.analytics --backfill)
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS user_message_count INTEGER DEFAULT 0",
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS bot_message_count INTEGER DEFAULT 0",
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS response_count INTEGER DEFAULT 0",
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS response_seconds DOUBLE PRECISION DEFAULT 0",
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS awaiting_reply_since TIMESTAMPTZ",
+    # Versão da linha conferida pelo cache de conversas
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0",
+    # Fila durável de mensagens recebidas (app/core/inbound_queue.py)
+    """
+    CREATE TABLE IF NOT EXISTS inbound_messages (
+        id BIGSERIAL PRIMARY KEY,
+        external_id VARCHAR UNIQUE,
+        user_number VARCHAR NOT NULL,
+        content TEXT NOT NULL,
+        status VARCHAR NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        locked_until TIMESTAMPTZ,
+        reply TEXT,
+        last_error TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        finished_at TIMESTAMPTZ
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_inbound_messages_active_id ON inbound_messages (id) "
+    "WHERE status IN ('pending', 'processing', 'replied')",
+    "CREATE INDEX IF NOT EXISTS ix_inbound_messages_active_user ON inbound_messages (user_number, id) "
+    "WHERE status IN ('pending', 'processing', 'replied')",
+    # Uma conversa aberta por cliente: encerra as duplicadas (fica a mais recente)
+    """
+    UPDATE conversations c
+    SET status = 'closed', end_time = COALESCE(c.last_message_at, now())
+    WHERE c.status = 'open' AND EXISTS (
+        SELECT 1 FROM conversations d
+        WHERE d.user_number = c.user_number AND d.status = 'open'
+          AND (d.start_time, d.id) > (c.start_time, c.id)
+    )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_conversations_open_user_number "
+    "ON conversations (user_number) WHERE status = 'open'",
+    # Fila durável: mensagem do cliente já gravada (novas tentativas não duplicam)
+    "ALTER TABLE inbound_messages ADD COLUMN IF NOT EXISTS message_id UUID",
+    # Agregado por hora: conversas com mensagens desde o último recálculo
+    "CREATE INDEX IF NOT EXISTS ix_conversations_last_message_at ON conversations (last_message_at)",
+]
+
+
+def apply_migrations(bind=engine):
+    with bind.begin() as conn:
+        for statement in MIGRATIONS:
+            conn.execute(text(statement))
+    print(f"✅ {len(MIGRATIONS)} migrações aplicadas")
+
+
+if __name__ == '__main__':
+    apply_migrations()
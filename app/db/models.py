@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, func, ForeignKey, Boolean, Float
+from sqlalchemy import Column, String, Text, DateTime, func, ForeignKey, Boolean, Float, Integer, BigInteger, Index, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import uuid
@@ -19,8 +19,48 @@ class Conversation(Base):
     sentiment = Column(String, nullable=True)
     sentiment_score = Column(Float, nullable=True)  # -1.0 a 1.0
     last_sentiment_update = Column(DateTime(timezone=True), nullable=True)
+    # Desnormalizado: horário da última mensagem, mantido em create_message
+    last_message_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Resumo incremental das mensagens fora da janela de histórico
+    summary = Column(Text, nullable=True)
+    summarized_until = Column(DateTime(timezone=True), nullable=True)
+    # Consumo acumulado da OpenAI na conversa
+    llm_calls = Column(Integer, default=0)
+    llm_seconds = Column(Float, default=0.0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)
+    # Contadores do analytics (app/core/analytics.py)
+    user_message_count = Column(Integer, default=0)
+    bot_message_count = Column(Integer, default=0)
+    response_count = Column(Integer, default=0)
+    response_seconds = Column(Float, default=0.0)
+    awaiting_reply_since = Column(DateTime(timezone=True), nullable=True)
+    # Última alteração da linha (marca d'água do backup incremental)
+    updated_at = Column(DateTime(timezone=True),
+                        server_default=func.now(), onupdate=func.now())
+    # Incrementada em todo UPDATE: o cache de conversas confere se outro
+    # processo gravou desde a última leitura
+    version = Column(Integer, nullable=False, server_default='0',
+                     onupdate=text('version + 1'))
     messages = relationship('Message', back_populates='conversation')
 
+    __table_args__ = (
+        Index('ix_conversations_status_last_message_at',
+              'status', 'last_message_at'),
+        # Paginação keyset de /admin/conversations
+        Index('ix_conversations_start_time_id', 'start_time', 'id'),
+        # Backup incremental (scripts/backup.py)
+        Index('ix_conversations_updated_at_id', 'updated_at', 'id'),
+        # Conversas ativas desde o último recálculo do agregado (rollups)
+        Index('ix_conversations_last_message_at', 'last_message_at'),
+        # Uma conversa aberta por cliente, mesmo com vários processos criando
+        Index('ux_conversations_open_user_number', 'user_number', unique=True,
+              postgresql_where=text("status = 'open'")),
+    )
+    # updated_at e version voltam no RETURNING do próprio UPDATE
+    __mapper_args__ = {'eager_defaults': True}
+
 
 class Message(Base):
     __tablename__ = 'messages'
@@ -35,3 +75,49 @@ class Message(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
     conversation = relationship('Conversation', back_populates='messages')
+
+    __table_args__ = (
+        # Filtro por período e paginação keyset de /admin/messages/all
+        Index('ix_messages_timestamp_id', 'timestamp', 'id'),
+    )
+
+
+class MessageRollup(Base):
+    """Contagem de mensagens por hora (UTC), tipo de negócio da conversa e direção"""
+    __tablename__ = 'message_rollups'
+
+    hour = Column(DateTime(timezone=True), primary_key=True)
+    business_type = Column(String, primary_key=True)
+    from_user = Column(Boolean, primary_key=True)
+    message_count = Column(Integer, nullable=False, default=0)
+
+
+class InboundMessage(Base):
+    """Fila durável das mensagens recebidas do WhatsApp (app/core/inbound_queue.py)"""
+    __tablename__ = 'inbound_messages'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    # Id da mensagem no WhatsApp: reenvios do bridge não duplicam a mensagem
+    external_id = Column(String, nullable=True, unique=True)
+    user_number = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    # 'pending', 'processing', 'replied', 'done', 'dead'
+    status = Column(String, nullable=False, server_default='pending')
+    attempts = Column(Integer, nullable=False, server_default='0')
+    available_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    reply = Column(Text, nullable=True)
+    # Mensagem gravada na conversa (na mesma transação): uma nova tentativa
+    # não grava de novo. Sem FK: a retenção pode apagar a mensagem antes
+    message_id = Column(UUID(as_uuid=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Só as linhas ainda na fila: o índice não cresce com o histórico
+        Index('ix_inbound_messages_active_id', 'id',
+              postgresql_where=text("status IN ('pending', 'processing', 'replied')")),
+        Index('ix_inbound_messages_active_user', 'user_number', 'id',
+              postgresql_where=text("status IN ('pending', 'processing', 'replied')")),
+    )
@@ -0,0 +1,61 @@
+"""
+Agregado de mensagens por hora para os gráficos do dashboard.
+
+O tipo de negócio de uma conversa muda depois que as primeiras mensagens já
+foram gravadas (unknown -> delivery, por exemplo), então o agregado não é
+incrementado no insert: um job periódico recalcula só as horas que ainda
+podem mudar, a partir do início das conversas ativas desde o último
+recálculo. Para reconstruir tudo: python -m app.db.rollups --full
+"""
+
+import sys
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from app.db import models
+
+
+def utc_hour(column):
+    """Início da hora em UTC (independe do fuso da sessão do banco)"""
+    return func.timezone('UTC', func.date_trunc('hour', func.timezone('UTC', column)))
+
+
+def refresh_message_rollups(db: Session, full: bool = False):
+    """Recalcula as horas pendentes; retorna a hora inicial recalculada (ou None)"""
+    latest = db.query(func.max(models.MessageRollup.hour)).scalar()
+
+    since = None
+    if latest is not None and not full:
+        # Conversas com mensagens desde o último recálculo podem ter mudado
+        # de tipo: refaz desde a primeira hora delas
+        since = db.query(func.min(utc_hour(models.Conversation.start_time))).filter(
+            models.Conversation.last_message_at >= latest
+        ).scalar()
+        since = min(since, latest) if since is not None else latest
+
+    hour = utc_hour(models.Message.timestamp)
+    business_type = func.coalesce(models.Conversation.business_type, 'unknown')
+    from_user = func.coalesce(models.Message.from_user, True)
+    source = select(hour, business_type, from_user, func.count()).join(
+        models.Conversation, models.Message.conversation_id == models.Conversation.id
+    ).where(
+        models.Message.timestamp.is_not(None)
+    ).group_by(hour, business_type, from_user)
+
+    clear = delete(models.MessageRollup)
+    if since is not None:
+        source = source.where(models.Message.timestamp >= since)
+        clear = clear.where(models.MessageRollup.hour >= since)
+
+    db.execute(clear)
+    db.execute(insert(models.MessageRollup).from_select(
+        ['hour', 'business_type', 'from_user', 'message_count'], source))
+    db.commit()
+    return since
+
+
+if __name__ == '__main__':
+    from app.db.session import SessionLocal
+
+    with SessionLocal() as session:
+        refresh_message_rollups(session, full='--full' in sys.argv)
+    print("✅ Agregado de mensagens por hora atualizado")
@@ -1,9 +1,90 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from app.core import metrics
 import os
+import time
 
 DATABASE_URL = os.getenv('DATABASE_URL')
 
-engine = create_engine(DATABASE_URL)
+
+def to_async_url(url: str) -> str:
+    """Troca o driver síncrono pelo asyncpg mantendo o restante da URL"""
+    scheme, sep, rest = url.partition('://')
+    if scheme in ('postgres', 'postgresql', 'postgresql+psycopg2'):
+        scheme = 'postgresql+asyncpg'
+    return f"{scheme}{sep}{rest}"
+
+
+ASYNC_DATABASE_URL = os.getenv(
+    'ASYNC_DATABASE_URL', to_async_url(DATABASE_URL))
+
+# Dimensionamento do pool (valem para os dois engines, cada um com o seu pool)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+
+
+class TimedPoolMixin:
+    """Mede quanto cada checkout esperou por uma conexão livre"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            metrics.record_pool_wait(
+                self.logging_name, time.perf_counter() - started, timed_out=True)
+            raise
+        metrics.record_pool_wait(
+            self.logging_name, time.perf_counter() - started, checked_out=self.checkedout())
+        return connection
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(name):
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'pool_logging_name': name,
+    }
+
+
+engine = create_engine(
+    DATABASE_URL, poolclass=TimedQueuePool, **pool_options('sync'))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, poolclass=TimedAsyncQueuePool, **pool_options('async'))
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
+
+
+def pool_status():
+    """Estado atual de cada pool somado ao histograma de espera por conexão"""
+    status = {}
+    for name, pool in (('sync', engine.pool), ('async', async_engine.sync_engine.pool)):
+        status[name] = {
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': DB_MAX_OVERFLOW,
+            **metrics.pool_wait_snapshot(name),
+        }
+    return status
@@ -413,6 +413,8 @@ TRANSLATIONS = {
     "delivery": "Delivery",
     "mecanica": "Mecânica",
     "farmacia": "Farmácia",
+    "mechanic": "Mecânica",
+    "pharmacy": "Farmácia",
     "unknown": "Indefinido",
     "undefined": "Indefinido",
 
@@ -446,52 +448,83 @@ def translate_term(term):
 # Cache para performance
 
 
+# Colunas pedidas à API em cada uso (fields=)
+LIST_FIELDS = "id,user_number,start_time,end_time,business_type,status,needs_human,sentiment,sentiment_score"
+CONVERSATIONS_PAGE_SIZE = 50
+
+
 @st.cache_data(ttl=60)
-def fetch_conversations(params=None):
-    """Busca conversas da API"""
+def fetch_conversation_page(params=None, cursor=None, fields=LIST_FIELDS, limit=CONVERSATIONS_PAGE_SIZE,
+                            include_stats=False):
+    """Busca uma página de conversas da API (mais recentes primeiro)"""
+    page_params = {**(params or {}), "fields": fields, "limit": limit}
+    if include_stats:
+        page_params["include_stats"] = "true"
+    if cursor:
+        page_params["cursor"] = cursor
     try:
         response = requests.get(
-            f"{API_BASE_URL}/admin/conversations", params=params or {})
+            f"{API_BASE_URL}/admin/conversations", params=page_params)
         response.raise_for_status()
         return response.json()
     except Exception as e:
         st.error(f"Erro ao carregar conversas: {e}")
-        return []
+        return {"conversations": [], "next_cursor": None}
 
 
 @st.cache_data(ttl=60)
-def fetch_messages(conversation_id):
-    """Busca mensagens de uma conversa"""
+def fetch_analytics_summary(params=None):
+    """Resumo do dashboard já agregado no servidor"""
     try:
-        response = requests.get(f"{API_BASE_URL}/admin/messages",
-                                params={"conversation_id": conversation_id})
+        response = requests.get(
+            f"{API_BASE_URL}/admin/analytics/summary", params=params)
         response.raise_for_status()
         return response.json()
+    except Exception as e:
+        st.error(f"Erro ao carregar resumo: {e}")
+        return {"total": 0}
+
+
+@st.cache_data(ttl=60)
+def fetch_messages_batch(conversation_ids):
+    """Busca as mensagens de várias conversas em uma chamada ({id: [mensagens]})"""
+    if not conversation_ids:
+        return {}
+    try:
+        response = requests.get(f"{API_BASE_URL}/admin/messages",
+                                params={"conversation_ids": ",".join(conversation_ids)})
+        response.raise_for_status()
+        return response.json()["messages"]
     except Exception as e:
         st.error(f"Erro ao carregar mensagens: {e}")
-        return []
+        return {}
 
 
 @st.cache_data(ttl=60)
-def fetch_all_messages(params=None):
-    """Busca todas as mensagens para análise temporal - CORRIGIDO"""
+def fetch_message_series(params=None, granularity="hour_of_day"):
+    """Série de mensagens já agrupada no horário do Brasil (agregado por hora)"""
     try:
         response = requests.get(
-            f"{API_BASE_URL}/admin/messages/all", params=params or {})
+            f"{API_BASE_URL}/admin/reports/messages",
+            params={**(params or {}), "granularity": granularity})
         response.raise_for_status()
-        return response.json()
+        return response.json().get("series", [])
     except Exception as e:
-        # Se não existir endpoint específico, buscar de todas as conversas
-        conversations = fetch_conversations(params)
-        all_messages = []
-        for conv in conversations:
-            messages = fetch_messages(conv.get('id'))
-            # CORREÇÃO: Adicionar business_type da conversa às mensagens
-            for msg in messages:
-                msg['conversation_business_type'] = conv.get(
-                    'business_type', 'unknown')
-            all_messages.extend(messages)
-        return all_messages
+        st.error(f"Erro ao carregar série de mensagens: {e}")
+        return []
+
+
+def brazil_period_params(date_range):
+    """Converte o período selecionado (datas do Brasil) em start/end_date UTC"""
+    params = {}
+    if len(date_range) == 2:
+        start_date_brazil = BRAZIL_TZ.localize(
+            datetime.combine(date_range[0], datetime.min.time()))
+        end_date_brazil = BRAZIL_TZ.localize(
+            datetime.combine(date_range[1], datetime.max.time()))
+        params["start_date"] = start_date_brazil.astimezone(UTC).isoformat()
+        params["end_date"] = end_date_brazil.astimezone(UTC).isoformat()
+    return params
 
 
 def format_timestamp(ts):
@@ -584,13 +617,24 @@ def calculate_conversation_duration(start_time, end_time):
         return "Não Informado"
 
 
-def render_conversation_integrated(conv, messages):
-    """Renderiza conversa com UX integrada e botões organizados à esquerda"""
+def render_conversation_integrated(conv, messages=None):
+    """Renderiza conversa com UX integrada e botões organizados à esquerda
+
+    As contagens vêm de message_stats (calculadas na API); messages=None
+    quando as mensagens da página ainda não foram carregadas.
+    """
 
-    # Calcular estatísticas da conversa
-    total_messages = len(messages)
-    user_messages = len([m for m in messages if m.get('from_user', True)])
-    bot_messages = total_messages - user_messages
+    # Estatísticas da conversa
+    stats = conv.get('message_stats')
+    if stats:
+        total_messages = stats.get('total', 0)
+        user_messages = stats.get('from_user', 0)
+        bot_messages = stats.get('from_bot', 0)
+    else:
+        total_messages = len(messages or [])
+        user_messages = len(
+            [m for m in messages or [] if m.get('from_user', True)])
+        bot_messages = total_messages - user_messages
     duration = calculate_conversation_duration(
         conv.get('start_time'), conv.get('end_time'))
 
@@ -741,7 +785,9 @@ def render_conversation_integrated(conv, messages):
         st.markdown("---")
 
         # Mensagens (resto da função continua igual)
-        if messages:
+        if messages is None:
+            st.info("Marque \"Carregar mensagens das conversas\" acima da lista para ver as mensagens")
+        elif messages:
             render_messages(messages)
         else:
             st.info("Nenhuma mensagem encontrada para esta conversa")
@@ -776,38 +822,22 @@ def render_messages(messages):
         """, unsafe_allow_html=True)
 
 
-def render_hourly_messages_chart(conversations, date_range):
+def render_hourly_messages_chart(date_range):
     """Renderiza gráfico de mensagens recebidas por hora, separado por business_type - CORRIGIDO"""
 
-    # Buscar todas as mensagens do período
-    params = {}
-    if len(date_range) == 2:
-        params["start_date"] = date_range[0].isoformat()
-        params["end_date"] = date_range[1].isoformat()
+    # Série já agrupada por hora do dia (Brasil) e tipo de negócio
+    series = fetch_message_series(
+        brazil_period_params(date_range), granularity="hour_of_day")
 
-    all_messages = fetch_all_messages(params)
-
-    if not all_messages:
+    if not series:
         st.info("Nenhuma mensagem encontrada para o período selecionado")
         return
 
-    # Organizar dados por hora e business_type - CORRIGIDO
     hourly_data = defaultdict(lambda: defaultdict(int))
-
-    for msg in all_messages:
-        try:
-            # Extrair hora da mensagem
-            timestamp = msg.get('timestamp')
-            if timestamp:
-                hour_brazil = get_hour_brazil(timestamp)
-                if hour_brazil is not None:
-                    business_type = msg.get(
-                        'conversation_business_type') or 'unknown'
-                    business_type_display = translate_term(business_type)
-                    hourly_data[business_type_display][hour_brazil] += 1
-        except Exception as e:
-            # Debug: mostrar erro se necessário
-            continue
+    for point in series:
+        business_type_display = translate_term(
+            point.get('business_type') or 'unknown')
+        hourly_data[business_type_display][point['bucket']] += point['messages']
 
     if not hourly_data:
         st.info("Não foi possível processar os dados de mensagens por hora")
@@ -899,75 +929,86 @@ def render_hourly_messages_chart(conversations, date_range):
             st.metric("📈 Mensagens no Pico", f"{peak_count}")
 
 
-def render_simple_analytics(conversations):
-    """Renderiza analytics simples baseados nos dados reais"""
+def format_seconds(seconds):
+    """Duração legível (ex.: 45s, 3min 20s, 1h 05min)"""
+    if seconds is None:
+        return "-"
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}min {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}min"
+
+
+def render_metric_card(icon, value, label):
+    st.markdown(f"""
+    <div class="metric-card">
+        <div class="metric-icon">{icon}</div>
+        <div class="metric-value">{value}</div>
+        <div class="metric-label">{label}</div>
+    </div>
+    """, unsafe_allow_html=True)
 
-    if not conversations:
+
+def style_chart(fig, **layout):
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font_family="Inter",
+        height=300,
+        **layout
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+
+def render_simple_analytics(summary):
+    """Renderiza o resumo agregado no servidor (/admin/analytics/summary)"""
+
+    if not summary.get('total'):
         st.warning("Nenhuma conversa encontrada para análise")
         return
 
-    # Calcular métricas básicas
-    total_conversations = len(conversations)
-    open_conversations = len(
-        [c for c in conversations if c.get('status') == 'open'])
-    closed_conversations = len(
-        [c for c in conversations if c.get('status') == 'closed'])
-    needs_human = len(
-        [c for c in conversations if c.get('needs_human', False)])
-
-    # Distribuição por business_type
-    business_types = {}
-    for conv in conversations:
-        bt = conv.get('business_type', 'unknown')
-        business_types[bt] = business_types.get(bt, 0) + 1
+    by_status = summary.get('by_status', {})
+    business_types = summary.get('by_business_type', {})
+    open_conversations = by_status.get('open', 0)
+    closed_conversations = by_status.get('closed', 0)
+    latency = summary.get('response_latency', {})
 
     # KPIs principais
     col1, col2, col3, col4 = st.columns(4)
-
     with col1:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-icon">💬</div>
-            <div class="metric-value">{total_conversations}</div>
-            <div class="metric-label">Total Conversas</div>
-        </div>
-        """, unsafe_allow_html=True)
-
+        render_metric_card("💬", summary['total'], "Total Conversas")
     with col2:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-icon">🟢</div>
-            <div class="metric-value">{open_conversations}</div>
-            <div class="metric-label">Conversas Abertas</div>
-        </div>
-        """, unsafe_allow_html=True)
-
+        render_metric_card("🟢", open_conversations, "Conversas Abertas")
     with col3:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-icon">✅</div>
-            <div class="metric-value">{closed_conversations}</div>
-            <div class="metric-label">Conversas Fechadas</div>
-        </div>
-        """, unsafe_allow_html=True)
+        render_metric_card("✅", closed_conversations, "Conversas Fechadas")
+    with col4:
+        render_metric_card("🆘", summary.get('needs_human', 0), "Precisam Humano")
 
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        render_metric_card(
+            "📈", f"{summary.get('needs_human_rate', 0):.1%}", "Taxa de Atendimento Humano")
+    with col2:
+        render_metric_card(
+            "⏱️", format_seconds(latency.get('avg_seconds')), "Tempo Médio de Resposta")
+    with col3:
+        render_metric_card(
+            "🙋", summary.get('messages', {}).get('from_user', 0), "Mensagens de Clientes")
     with col4:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-icon">🆘</div>
-            <div class="metric-value">{needs_human}</div>
-            <div class="metric-label">Precisam Humano</div>
-        </div>
-        """, unsafe_allow_html=True)
+        render_metric_card(
+            "🤖", summary.get('messages', {}).get('from_bot', 0), "Mensagens do Bot")
 
     st.markdown("<br>", unsafe_allow_html=True)
 
-    # Gráficos simples se houver dados suficientes
-    if len(business_types) > 1:
-        col1, col2 = st.columns(2)
+    col1, col2 = st.columns(2)
 
-        with col1:
-            # Gráfico de distribuição por tipo de negócio
+    with col1:
+        # Gráfico de distribuição por tipo de negócio
+        if len(business_types) > 1:
             fig = px.pie(
                 values=list(business_types.values()),
                 names=[translate_term(bt) for bt in business_types.keys()],
@@ -975,35 +1016,51 @@ def render_simple_analytics(conversations):
                 color_discrete_sequence=['#667eea',
                                          '#764ba2', '#28a745', '#ffc107']
             )
-            fig.update_layout(
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                font_family="Inter",
-                height=300
+            style_chart(fig)
+
+    with col2:
+        # Gráfico de status
+        status_data = {'Abertas': open_conversations,
+                       'Fechadas': closed_conversations}
+        if any(status_data.values()):
+            fig = px.bar(
+                x=list(status_data.keys()),
+                y=list(status_data.values()),
+                title="Status das Conversas",
+                color=list(status_data.keys()),
+                color_discrete_map={
+                    'Abertas': '#28a745', 'Fechadas': '#6c757d'}
             )
-            st.plotly_chart(fig, use_container_width=True)
+            style_chart(fig, showlegend=False)
 
-        with col2:
-            # Gráfico de status
-            status_data = {'Abertas': open_conversations,
-                           'Fechadas': closed_conversations}
-            if any(status_data.values()):
-                fig = px.bar(
-                    x=list(status_data.keys()),
-                    y=list(status_data.values()),
-                    title="Status das Conversas",
-                    color=list(status_data.keys()),
-                    color_discrete_map={
-                        'Abertas': '#28a745', 'Fechadas': '#6c757d'}
-                )
-                fig.update_layout(
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    font_family="Inter",
-                    showlegend=False,
-                    height=300
-                )
-                st.plotly_chart(fig, use_container_width=True)
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Gráfico de sentimento
+        sentiments = summary.get('by_sentiment', {})
+        if sentiments:
+            fig = px.bar(
+                x=[translate_term(s) for s in sentiments.keys()],
+                y=list(sentiments.values()),
+                title="Sentimento das Conversas",
+                color=list(sentiments.keys()),
+                color_discrete_map={
+                    'POSITIVO': '#28a745', 'NEUTRO': '#ffc107',
+                    'NEGATIVO': '#dc3545', 'none': '#6c757d'}
+            )
+            style_chart(fig, showlegend=False, xaxis_title="", yaxis_title="Conversas")
+
+    with col2:
+        # Distribuição da duração das conversas
+        durations = summary.get('duration_distribution', [])
+        if any(d['conversations'] for d in durations):
+            fig = px.bar(
+                x=[d['bucket'] for d in durations],
+                y=[d['conversations'] for d in durations],
+                title="Duração das Conversas",
+                color_discrete_sequence=['#667eea']
+            )
+            style_chart(fig, xaxis_title="", yaxis_title="Conversas")
 
 
 def main():
@@ -1034,7 +1091,7 @@ def main():
 
         # Filtro por tipo de negócio (baseado no modelo)
         business_options = ["Todos", "delivery",
-                            "mecanica", "farmacia", "unknown"]
+                            "mechanic", "pharmacy", "unknown"]
         business_labels = ["Todos", "Delivery",
                            "Mecânica", "Farmácia", "Indefinido"]
         business_selected = st.selectbox("🏢 Tipo de Negócio", business_labels)
@@ -1102,85 +1159,81 @@ def main():
         params["start_date"] = start_date_utc.isoformat()
         params["end_date"] = end_date_utc.isoformat()
 
-    # Carregar conversas
-    with st.spinner("Carregando conversas..."):
-        conversations = fetch_conversations(params)
+    # Resumo agregado no servidor
+    with st.spinner("Carregando resumo..."):
+        summary = fetch_analytics_summary(params)
 
-    if not conversations:
+    if not summary.get('total'):
         st.info("Nenhuma conversa encontrada com os filtros aplicados")
         return
 
     # Analytics simples
     st.subheader("📊 Resumo Geral")
-    render_simple_analytics(conversations)
+    render_simple_analytics(summary)
 
     st.markdown("---")
 
     # Gráfico de mensagens por hora
     st.subheader("📈 Análise Temporal")
-    render_hourly_messages_chart(conversations, date_range)
+    render_hourly_messages_chart(date_range)
 
     st.markdown("---")
 
-    render_daily_messages_chart(conversations, date_range)
+    render_daily_messages_chart(date_range)
 
     st.markdown("---")
 
-    # Lista de conversas
-    st.subheader(f"💬 Conversas ({len(conversations)})")
-
-    def get_conversation_sort_time(conv):
-        """Retorna timestamp para ordenação"""
-        start_time = conv.get('start_time')
-        if start_time:
-            brazil_time = convert_utc_to_brazil(start_time)
-            return brazil_time if brazil_time else datetime.min.replace(tzinfo=BRAZIL_TZ)
-        return datetime.min.replace(tzinfo=BRAZIL_TZ)
-
-    conversations_sorted = sorted(
-        conversations, key=get_conversation_sort_time, reverse=True)
+    # Lista de conversas, paginada (mais recentes primeiro)
+    if st.session_state.get("conversation_filters") != params:
+        st.session_state["conversation_filters"] = params
+        st.session_state["conversation_pages"] = 1
+
+    listed, pages, cursor = [], [], None
+    for _ in range(st.session_state["conversation_pages"]):
+        page = fetch_conversation_page(params, cursor, include_stats=True)
+        listed.extend(page["conversations"])
+        pages.append(tuple(conv["id"] for conv in page["conversations"]))
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
+
+    st.subheader(f"💬 Conversas ({len(listed)} de {summary['total']})")
+
+    # Mensagens sob demanda: uma chamada por página de conversas
+    messages_by_conversation = None
+    if st.checkbox("💬 Carregar mensagens das conversas", value=False):
+        messages_by_conversation = {}
+        for ids in pages:
+            messages_by_conversation.update(fetch_messages_batch(ids))
 
     # Renderizar cada conversa com UX integrada
-    for conv in conversations_sorted:
-        messages = fetch_messages(conv.get('id'))
+    for conv in listed:
+        messages = None
+        if messages_by_conversation is not None:
+            messages = messages_by_conversation.get(conv.get('id'), [])
         render_conversation_integrated(conv, messages)
 
+    if cursor and st.button("⬇️ Carregar mais conversas"):
+        st.session_state["conversation_pages"] += 1
+        st.rerun()
 
-def render_daily_messages_chart(conversations, date_range):
-    """Renderiza gráfico de mensagens por dia - NOVO"""
 
-    params = {}
-    if len(date_range) == 2:
-        start_date_brazil = datetime.combine(
-            date_range[0], datetime.min.time())
-        end_date_brazil = datetime.combine(date_range[1], datetime.max.time())
-        start_date_brazil = BRAZIL_TZ.localize(start_date_brazil)
-        end_date_brazil = BRAZIL_TZ.localize(end_date_brazil)
-        start_date_utc = start_date_brazil.astimezone(UTC)
-        end_date_utc = end_date_brazil.astimezone(UTC)
-        params["start_date"] = start_date_utc.isoformat()
-        params["end_date"] = end_date_utc.isoformat()
+def render_daily_messages_chart(date_range):
+    """Renderiza gráfico de mensagens por dia - NOVO"""
 
-    all_messages = fetch_all_messages(params)
+    # Série já agrupada por dia (Brasil) e tipo de negócio
+    series = fetch_message_series(
+        brazil_period_params(date_range), granularity="day")
 
-    if not all_messages:
+    if not series:
         return
 
-    # ✅ Organizar dados por dia no timezone Brasil
     daily_data = defaultdict(lambda: defaultdict(int))
-
-    for msg in all_messages:
-        try:
-            timestamp = msg.get('timestamp')
-            if timestamp:
-                date_brazil = get_date_brazil(timestamp)
-                if date_brazil:
-                    business_type = msg.get(
-                        'conversation_business_type') or 'unknown'
-                    business_type_display = translate_term(business_type)
-                    daily_data[business_type_display][date_brazil] += 1
-        except Exception:
-            continue
+    for point in series:
+        business_type_display = translate_term(
+            point.get('business_type') or 'unknown')
+        date_brazil = datetime.fromisoformat(point['bucket']).date()
+        daily_data[business_type_display][date_brazil] += point['messages']
 
     if not daily_data:
         return
@@ -2,6 +2,7 @@ require("dotenv").config();
 const venom = require("venom-bot");
 const axios = require("axios");
 const fs = require("fs");
+const express = require("express");
 
 // Função para limpar sessões antigas
 function clearOldSessions() {
@@ -80,6 +81,51 @@ venom
     process.exit(1);
   });
 
+// Reenvia quando a API está fora do ar (reinício); com a fila durável o
+// message_id evita mensagem duplicada
+async function postWithRetry(url, payload, attempts = 5) {
+  for (let attempt = 1; ; attempt++) {
+    try {
+      return await httpClient.post(url, payload);
+    } catch (error) {
+      const unreachable = !error.response || error.response.status >= 502;
+      if (!unreachable || attempt >= attempts) throw error;
+      console.log(`🔁 API indisponível, nova tentativa em ${attempt}s...`);
+      await new Promise((resolve) => setTimeout(resolve, attempt * 1000));
+    }
+  }
+}
+
+// Respostas geradas pelos workers da fila (INBOUND_DELIVERY_URL na API)
+function startDeliveryServer(client) {
+  const app = express();
+  app.use(express.json());
+
+  app.post("/send-message", async (req, res) => {
+    const { number, message } = req.body;
+    if (!number || !message) {
+      return res
+        .status(400)
+        .json({ error: "Número e mensagem são obrigatórios." });
+    }
+    try {
+      const to = number.includes("@c.us") ? number : `${number}@c.us`;
+      await client.sendText(to, message);
+      console.log(`📤 Resposta da fila enviada para ${number}`);
+      return res.status(200).json({ status: "Mensagem enviada com sucesso!" });
+    } catch (error) {
+      console.error("❌ Erro ao enviar resposta da fila:", error);
+      return res
+        .status(500)
+        .json({ error: "Erro ao enviar mensagem via WhatsApp." });
+    }
+  });
+
+  app.listen(process.env.BRIDGE_PORT, () => {
+    console.log(`✅ Entrega de respostas em :${process.env.BRIDGE_PORT}/send-message`);
+  });
+}
+
 function validateApiResponse(data) {
   if (!data) {
     throw new Error("Resposta vazia da API");
@@ -93,9 +139,80 @@ function validateApiResponse(data) {
   return true;
 }
 
+// Lê o stream SSE do backend e envia cada frase assim que chega
+async function processWithStreaming(client, to, payload) {
+  const startedAt = Date.now();
+  let firstSentenceAt = null;
+  let sentAny = false;
+
+  const response = await httpClient.post(
+    process.env.BACKEND_STREAM_URL,
+    payload,
+    { responseType: "stream" }
+  );
+
+  let buffer = "";
+  let done = null;
+
+  for await (const chunk of response.data) {
+    buffer += chunk.toString("utf8");
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      rawEvent.split("\n").forEach((line) => {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        if (line.startsWith("data:")) data += line.slice(5).trim();
+      });
+      if (!data) continue;
+      const parsed = JSON.parse(data);
+
+      if (event === "sentence" && parsed.text) {
+        if (firstSentenceAt === null) {
+          firstSentenceAt = Date.now();
+        }
+        await client.sendText(to, parsed.text);
+        sentAny = true;
+      } else if (event === "done") {
+        done = parsed;
+      }
+    }
+  }
+
+  // Mensagem respondida junto com outra da mesma rajada
+  if (done && done.merged) {
+    console.log("🔗 Mensagem respondida junto com a anterior");
+    return;
+  }
+
+  if (done && !sentAny) {
+    validateApiResponse(done);
+    await client.sendText(to, done.reply);
+    firstSentenceAt = firstSentenceAt || Date.now();
+  }
+
+  if (!done && !sentAny) {
+    throw new Error("Stream encerrado sem resposta");
+  }
+
+  console.log(
+    `⏱️ Primeira frase em ${(firstSentenceAt || Date.now()) - startedAt}ms, ` +
+      `total ${Date.now() - startedAt}ms ` +
+      `(backend: ${done ? done.ttfb_ms : "-"}ms / ${done ? done.total_ms : "-"}ms)`
+  );
+}
+
 function start(client) {
   console.log("✅ Bot conectado com sucesso!");
 
+  if (process.env.BRIDGE_PORT) {
+    startDeliveryServer(client);
+  }
+
   client.onStateChange((state) => {
     console.log("Estado do cliente:", state);
     if (state === "CONFLICT" || state === "UNPAIRED") {
@@ -126,17 +243,36 @@ function start(client) {
       const payload = {
         user_number: userNumber,
         message: userMessage,
+        message_id: message.id,
       };
 
       console.log("🔄 Enviando para API:", payload);
 
-      const response = await httpClient.post(
+      if (process.env.BACKEND_STREAM_URL) {
+        await processWithStreaming(client, message.from, payload);
+        console.log("📤 Resposta enviada com sucesso (streaming)");
+        return;
+      }
+
+      const response = await postWithRetry(
         process.env.BACKEND_API_URL,
         payload
       );
 
       console.log("📥 Resposta da API:", response.data);
 
+      // Fila durável: a resposta chega depois em /send-message
+      if (response.data && response.data.queued) {
+        console.log("📬 Mensagem na fila da API");
+        return;
+      }
+
+      // Mensagem respondida junto com outra da mesma rajada
+      if (response.data && response.data.merged) {
+        console.log("🔗 Mensagem respondida junto com a anterior");
+        return;
+      }
+
       validateApiResponse(response.data);
 
       const reply = response.data.reply;
@@ -1,7 +1,25 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.api import webhook, admin_api
+from app.core import scheduler, pdf_reports
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    expiry_task = asyncio.create_task(scheduler.expiry_loop())
+    rollup_task = asyncio.create_task(scheduler.rollup_loop())
+    training_task = asyncio.create_task(
+        asyncio.to_thread(scheduler.train_business_classifier))
+    yield
+    expiry_task.cancel()
+    rollup_task.cancel()
+    training_task.cancel()
+    scheduler.release_locks()
+    pdf_reports.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(webhook.router)
 app.include_router(admin_api.router)
@@ -0,0 +1,296 @@
+"""
+Backup incremental de conversations e messages.
+
+backup: exporta só as linhas novas ou alteradas desde a última marca
+d'água (conversations por updated_at, messages por timestamp), lidas com
+cursor do lado do servidor e gravadas em arquivos JSONL gzip de até
+--chunk-rows linhas. Cada execução gera uma pasta <dir>/<AAAAMMDDTHHMMSS>
+com manifest.json; a marca d'água fica em <dir>/watermark.json e só avança
+quando a execução termina. Linhas dos últimos --safety-lag segundos ficam
+para a próxima execução (transações ainda abertas podem gravar now()
+anterior ao commit). As conversas referenciadas pelas mensagens exportadas
+entram na mesma execução mesmo se o updated_at já passou do limite (a
+conversa recebeu outra mensagem depois): sem isso o restore num banco vazio
+quebraria a FK messages.conversation_id. Elas não avançam a marca d'água e
+saem de novo na execução seguinte, com a versão mais nova.
+
+restore: aplica as execuções em ordem com COPY para uma tabela temporária
+e upsert por id (uma conversa alterada substitui a versão anterior). Use
+DATABASE_URL para apontar o banco de destino.
+
+    python scripts/backup.py backup --dir backups
+    python scripts/backup.py restore --dir backups
+    python scripts/backup.py restore --dir backups --since 20250101T000000
+
+message_rollups não entra no backup: depois do restore rode
+python -m app.db.rollups --full
+"""
+
+import argparse
+import gzip
+import json
+import os
+import resource
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import func, select, text  # noqa: E402
+from app.db.session import SessionLocal, engine  # noqa: E402
+from app.db import models  # noqa: E402
+
+# Ordem importa no restore: messages referencia conversations
+TABLES = {
+    'conversations': (models.Conversation.__table__, 'updated_at'),
+    'messages': (models.Message.__table__, 'timestamp'),
+}
+# tabela -> (tabela que a referencia, coluna da FK)
+REFERENCED_BY = {
+    'conversations': ('messages', 'conversation_id'),
+}
+
+WATERMARK_FILE = 'watermark.json'
+MANIFEST_FILE = 'manifest.json'
+
+
+def peak_memory_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_watermarks(backup_dir):
+    path = os.path.join(backup_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def range_condition(alias, column, watermark, prefix):
+    """Condição SQL (e parâmetros) das linhas de (watermark, upper] da tabela"""
+    where = f"{alias}.{column} <= :upper"
+    params = {}
+    if watermark:
+        where += (f" AND ({alias}.{column}, {alias}.id) > "
+                  f"(CAST(:{prefix}value AS timestamptz), CAST(:{prefix}id AS uuid))")
+        params = {f'{prefix}value': watermark['value'], f'{prefix}id': watermark['id']}
+    return where, params
+
+
+def export_table(db, name, run_dir, watermarks, upper, args):
+    """
+    Exporta as linhas de (watermark, upper] e as referenciadas pelas linhas
+    exportadas de REFERENCED_BY; retorna o resumo para o manifest
+    """
+    table, column = TABLES[name]
+    columns = [c.name for c in table.columns]
+    watermark = watermarks.get(name)
+
+    where, params = range_condition('t', column, watermark, '')
+    params['upper'] = upper
+    if name in REFERENCED_BY:
+        # Depois do limite, só as que as linhas da outra tabela nesta execução usam
+        child, foreign_key = REFERENCED_BY[name]
+        child_where, child_params = range_condition(
+            'c', TABLES[child][1], watermarks.get(child), 'child_')
+        where = (f"({where}) OR (t.{column} > :upper AND t.id IN "
+                 f"(SELECT c.{foreign_key} FROM {child} c WHERE {child_where}))")
+        params.update(child_params)
+
+    # O próprio Postgres serializa a linha em JSON: o Python só grava texto.
+    # As referenciadas (depois do limite) vêm por último e não movem a marca d'água
+    statement = text(
+        f"SELECT row_to_json(t)::text AS line, t.{column} <= :upper AS in_range "
+        f"FROM {name} t WHERE {where} ORDER BY t.{column}, t.id"
+    ).execution_options(stream_results=True, max_row_buffer=args.batch)
+
+    files, rows, referenced, file_rows, output, last_line = [], 0, 0, 0, None, None
+    started = time.perf_counter()
+    try:
+        for partition in db.execute(statement, params).partitions(args.batch):
+            for row in partition:
+                if output is None or file_rows >= args.chunk_rows:
+                    if output:
+                        output.close()
+                    filename = f"{name}-{len(files) + 1:05d}.jsonl.gz"
+                    files.append(filename)
+                    output = gzip.open(os.path.join(run_dir, filename), 'wt',
+                                       encoding='utf-8', compresslevel=args.compresslevel)
+                    file_rows = 0
+                output.write(row.line)
+                output.write('\n')
+                file_rows += 1
+                if row.in_range:
+                    last_line = row.line
+                else:
+                    referenced += 1
+            rows += len(partition)
+    finally:
+        if output:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"📊 {name}: {rows} linhas em {len(files)} arquivo(s), {elapsed:.1f}s "
+          f"({rows / elapsed if elapsed else 0:,.0f} linhas/s)"
+          + (f", {referenced} depois do limite referenciadas" if referenced else ""))
+
+    new_watermark = watermark
+    if last_line is not None:
+        last = json.loads(last_line)
+        new_watermark = {'value': last[column], 'id': last['id']}
+    return {'columns': columns, 'files': files, 'rows': rows, 'referenced': referenced,
+            'from': watermark, 'to': new_watermark}
+
+
+def run_backup(args):
+    os.makedirs(args.dir, exist_ok=True)
+    watermarks = read_watermarks(args.dir)
+
+    with SessionLocal() as db:
+        # Um snapshot para as duas tabelas: as conversas referenciadas e as
+        # mensagens exportadas são lidas do mesmo estado do banco
+        db.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+        # Mesmo relógio do banco que grava os timestamps
+        upper = db.execute(select(func.now())).scalar() - timedelta(seconds=args.safety_lag)
+        run_name = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        run_dir = os.path.join(args.dir, run_name)
+        os.makedirs(run_dir)
+
+        manifest = {'run': run_name, 'upper_bound': upper.isoformat(), 'tables': {}}
+        for name in TABLES:
+            manifest['tables'][name] = export_table(
+                db, name, run_dir, watermarks, upper, args)
+
+    write_json(os.path.join(run_dir, MANIFEST_FILE), manifest)
+    write_json(os.path.join(args.dir, WATERMARK_FILE),
+               {name: table['to'] for name, table in manifest['tables'].items()})
+    print(f"✅ Backup {run_name} concluído (pico de memória {peak_memory_mb():.0f}MB)")
+
+
+def csv_field(value):
+    """Campo no formato CSV do COPY: vazio sem aspas é NULL"""
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class JsonlCopySource:
+    """Arquivo JSONL gzip lido como CSV sob demanda pelo COPY FROM STDIN"""
+
+    def __init__(self, path, columns):
+        self.lines = gzip.open(path, 'rt', encoding='utf-8')
+        self.columns = columns
+        self.buffer = ''
+        self.rows = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = self.lines.readline()
+            if not line:
+                break
+            record = json.loads(line)
+            self.buffer += ','.join(csv_field(record.get(c)) for c in self.columns) + '\n'
+            self.rows += 1
+        if size < 0:
+            data, self.buffer = self.buffer, ''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def close(self):
+        self.lines.close()
+
+
+def restore_file(connection, name, columns, path):
+    """COPY de um arquivo para tabela temporária e upsert na tabela real"""
+    column_list = ', '.join(columns)
+    updates = ', '.join(f"{c} = EXCLUDED.{c}" for c in columns if c != 'id')
+    source = JsonlCopySource(path, columns)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE restore_stage (LIKE {name} INCLUDING DEFAULTS) ON COMMIT DROP")
+            cursor.copy_expert(
+                f"COPY restore_stage ({column_list}) FROM STDIN WITH (FORMAT csv)", source)
+            cursor.execute(
+                f"INSERT INTO {name} ({column_list}) SELECT {column_list} FROM restore_stage "
+                f"ON CONFLICT (id) DO UPDATE SET {updates}")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        source.close()
+    return source.rows
+
+
+def run_restore(args):
+    runs = sorted(entry for entry in os.listdir(args.dir)
+                  if os.path.exists(os.path.join(args.dir, entry, MANIFEST_FILE))
+                  and (not args.since or entry >= args.since))
+    if not runs:
+        print(f"❌ Nenhum backup encontrado em {args.dir}")
+        sys.exit(1)
+
+    connection = engine.raw_connection()
+    try:
+        totals = {name: [0, 0.0] for name in TABLES}
+        for run_name in runs:
+            with open(os.path.join(args.dir, run_name, MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+            for name in TABLES:
+                table = manifest['tables'][name]
+                for filename in table['files']:
+                    started = time.perf_counter()
+                    rows = restore_file(connection, name, table['columns'],
+                                        os.path.join(args.dir, run_name, filename))
+                    totals[name][0] += rows
+                    totals[name][1] += time.perf_counter() - started
+            print(f"✅ Backup {run_name} restaurado")
+    finally:
+        connection.close()
+
+    for name, (rows, elapsed) in totals.items():
+        print(f"📊 {name}: {rows} linhas em {elapsed:.1f}s "
+              f"({rows / elapsed if elapsed else 0:,.0f} linhas/s)")
+    print(f"📊 Pico de memória: {peak_memory_mb():.0f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backup = subparsers.add_parser('backup', help='exporta as linhas novas/alteradas')
+    backup.add_argument('--dir', default='backups')
+    backup.add_argument('--chunk-rows', type=int, default=1_000_000,
+                        help='linhas por arquivo')
+    backup.add_argument('--batch', type=int, default=10_000,
+                        help='linhas lidas do cursor por vez')
+    backup.add_argument('--compresslevel', type=int, default=6,
+                        help='nível do gzip (1 = mais rápido, 9 = menor)')
+    backup.add_argument('--safety-lag', type=int, default=300,
+                        help='segundos mais recentes deixados para a próxima execução')
+
+    restore = subparsers.add_parser('restore', help='aplica os backups com COPY')
+    restore.add_argument('--dir', default='backups')
+    restore.add_argument('--since', help='aplica só as execuções a partir desta (ex.: 20250101T000000)')
+
+    args = parser.parse_args()
+    if args.command == 'backup':
+        run_backup(args)
+    else:
+        run_restore(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Benchmark e conferência do analytics (app/core/analytics.py).
+
+1. Grava --checked conversas mensagem a mensagem por crud.create_message
+   (contadores incrementais) e confere que o backfill vetorizado e uma
+   referência em Python puro chegam nos mesmos valores.
+2. Cria --conversations conversas com --messages mensagens cada e mede o
+   backfill (mensagens/s).
+3. Com a API rodando, compara /admin/analytics/summary com o caminho
+   antigo (todas as conversas do filtro baixadas e contadas no dashboard).
+
+Remove os dados ao final.
+
+    python scripts/bench_analytics.py --conversations 20000 --messages 20
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import text  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+from app.db import crud, models  # noqa: E402
+from app.core import analytics  # noqa: E402
+
+PREFIX = 'bench-analytics-'
+BUSINESS_TYPE = 'bench-analytics'
+COUNTERS = analytics.COUNTER_COLUMNS
+
+
+def reference_counters(messages):
+    """Mesmas regras do analytics, mensagem a mensagem"""
+    counters = dict.fromkeys(COUNTERS[:3], 0)
+    counters.update(response_seconds=0.0, awaiting_reply_since=None)
+    for from_user, timestamp in messages:
+        if from_user:
+            counters['user_message_count'] += 1
+            counters['awaiting_reply_since'] = counters['awaiting_reply_since'] or timestamp
+            continue
+        counters['bot_message_count'] += 1
+        if counters['awaiting_reply_since']:
+            counters['response_count'] += 1
+            counters['response_seconds'] += (
+                timestamp - counters['awaiting_reply_since']).total_seconds()
+        counters['awaiting_reply_since'] = None
+    return counters
+
+
+def read_counters(db):
+    rows = db.query(models.Conversation).filter(
+        models.Conversation.user_number.like(f'{PREFIX}%')).all()
+    return {str(row.id): {c: getattr(row, c) for c in COUNTERS} for row in rows}
+
+
+def same(a, b):
+    for column in COUNTERS:
+        x, y = a[column], b[column]
+        if isinstance(x, float) or isinstance(y, float):
+            if not math.isclose(x or 0, y or 0, abs_tol=1e-3):
+                return False
+        elif x != y:
+            return False
+    return True
+
+
+def check_incremental(db, conversations):
+    """Contadores incrementais x backfill x referência"""
+    random.seed(7)
+    clock = [datetime(2025, 1, 1, tzinfo=timezone.utc)]
+
+    class FakeDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            clock[0] += timedelta(seconds=random.randint(1, 120))
+            return clock[0]
+
+    expected = {}
+    with mock.patch.object(crud, 'datetime', FakeDatetime):
+        for n in range(conversations):
+            user_number, sent = f'{PREFIX}check-{n}', []
+            # Sequências com respostas seguidas do bot e clientes sem resposta
+            for _ in range(random.randint(1, 12)):
+                from_user = random.random() < 0.6
+                message = crud.create_message(db, user_number, 'Oi', from_user=from_user,
+                                              business_type=BUSINESS_TYPE)
+                sent.append((from_user, message.timestamp))
+            expected[str(message.conversation_id)] = reference_counters(sent)
+
+    incremental = read_counters(db)
+    db.expire_all()
+    analytics.backfill(db)
+    recomputed = read_counters(db)
+
+    mismatches = [cid for cid, counters in expected.items()
+                  if not same(counters, incremental[cid]) or not same(counters, recomputed[cid])]
+    if mismatches:
+        cid = mismatches[0]
+        print(f"❌ Contadores divergentes em {len(mismatches)} conversas. Ex.: {cid}\n"
+              f"   referência  {expected[cid]}\n   incremental {incremental[cid]}\n"
+              f"   backfill    {recomputed[cid]}")
+        sys.exit(1)
+    print(f"✅ {len(expected)} conversas: incremental = backfill = referência")
+
+
+def seed(db, conversations, messages):
+    db.execute(text("""
+        INSERT INTO conversations (id, user_number, start_time, last_message_at, business_type, status)
+        SELECT gen_random_uuid(), :prefix || n, now() - interval '1 day',
+               now() - interval '1 day' + (n % 7200 || ' seconds')::interval, :business_type, 'closed'
+        FROM generate_series(1, :total) AS n
+    """), {'prefix': PREFIX, 'total': conversations, 'business_type': BUSINESS_TYPE})
+    db.execute(text("""
+        INSERT INTO messages (id, conversation_id, user_number, content, from_user, business_type, timestamp)
+        SELECT gen_random_uuid(), c.id, c.user_number, 'Mensagem ' || n,
+               random() < 0.6, :business_type, now() - interval '1 day' + (n * 30 || ' seconds')::interval
+        FROM conversations c, generate_series(1, :total) AS n
+        WHERE c.business_type = :business_type
+    """), {'total': messages, 'business_type': BUSINESS_TYPE})
+    db.commit()
+
+
+def cleanup(db):
+    db.execute(text("""
+        DELETE FROM messages WHERE conversation_id IN
+            (SELECT id FROM conversations WHERE user_number LIKE :like)
+    """), {'like': f'{PREFIX}%'})
+    db.execute(text("DELETE FROM conversations WHERE user_number LIKE :like"),
+               {'like': f'{PREFIX}%'})
+    db.commit()
+
+
+def old_summary(client):
+    """Caminho antigo: todas as conversas do filtro, paginadas, contadas no cliente"""
+    conversations, params = [], {'business_type': BUSINESS_TYPE,
+                                 'fields': 'status,needs_human,business_type', 'limit': 1000}
+    while True:
+        page = client.get('/admin/conversations', params=params).json()
+        conversations.extend(page['conversations'])
+        if not page.get('next_cursor'):
+            break
+        params['cursor'] = page['next_cursor']
+    return {
+        'total': len(conversations),
+        'open': sum(1 for c in conversations if c['status'] == 'open'),
+        'needs_human': sum(1 for c in conversations if c['needs_human']),
+    }
+
+
+def timed(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return result, sorted(timings)[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--checked', type=int, default=200)
+    parser.add_argument('--conversations', type=int, default=20000)
+    parser.add_argument('--messages', type=int, default=20)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        cleanup(db)
+        check_incremental(db, args.checked)
+        cleanup(db)
+
+        seed(db, args.conversations, args.messages)
+        started = time.perf_counter()
+        conversations, messages = analytics.backfill(db)
+        elapsed = time.perf_counter() - started
+        print(f"📊 Backfill: {conversations} conversas, {messages} mensagens em {elapsed:.2f}s "
+              f"({messages / elapsed:,.0f} mensagens/s)")
+
+        with httpx.Client(base_url=args.url, timeout=300) as client:
+            old, old_time = timed(lambda: old_summary(client))
+            new, new_time = timed(lambda: client.get(
+                '/admin/analytics/summary', params={'business_type': BUSINESS_TYPE}).json())
+        print(f"📊 Resumo antigo (todas as conversas): {old_time * 1000:.0f}ms | "
+              f"/admin/analytics/summary: {new_time * 1000:.0f}ms")
+        if new['total'] != old['total'] or new['needs_human'] != old['needs_human'] \
+                or new['by_status'].get('open', 0) != old['open']:
+            print(f"❌ Resumos divergentes: {old} x {new}")
+            sys.exit(1)
+        print(f"✅ Mesmos totais ({new['total']} conversas, "
+              f"tempo médio de resposta {new['response_latency']['avg_seconds']:.0f}s)")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
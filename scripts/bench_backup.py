@@ -0,0 +1,175 @@
+"""
+Benchmark do backup incremental e do restore (scripts/backup.py) em dois
+bancos temporários criados no mesmo servidor do DATABASE_URL: origem com
+--conversations conversas e --messages mensagens, destino vazio.
+
+Além do volume, semeia o caso da FK entre as marcas d'água: uma conversa
+com uma mensagem antiga (dentro do backup) e updated_at recente (dentro do
+--safety-lag, porque recebeu outra mensagem depois). O restore no banco
+vazio precisa aplicar a mensagem sem falhar, e a execução seguinte (sem
+lag) traz a versão nova da conversa. Remove os bancos ao final.
+
+    python scripts/bench_backup.py --conversations 10000 --messages 1000000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.engine import make_url  # noqa: E402
+from app.db.session import DATABASE_URL  # noqa: E402
+from app.db import models  # noqa: E402
+
+SOURCE_DB = 'bench_backup_source'
+TARGET_DB = 'bench_backup_target'
+SAFETY_LAG = 300
+EDGE_USER = 'bench-backup-fk'
+
+
+def database_url(name):
+    return make_url(DATABASE_URL).set(database=name).render_as_string(hide_password=False)
+
+
+def recreate_databases(admin):
+    with admin.connect() as connection:
+        for name in (SOURCE_DB, TARGET_DB):
+            connection.execute(text(f"DROP DATABASE IF EXISTS {name}"))
+            connection.execute(text(f"CREATE DATABASE {name}"))
+    for name in (SOURCE_DB, TARGET_DB):
+        engine = create_engine(database_url(name))
+        models.Base.metadata.create_all(engine)
+        engine.dispose()
+
+
+def drop_databases(admin):
+    with admin.connect() as connection:
+        for name in (SOURCE_DB, TARGET_DB):
+            connection.execute(text(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)"))
+
+
+def seed(source, conversations, messages):
+    """Volume antigo mais a conversa do caso da FK (mensagem antiga, updated_at recente)"""
+    with source.begin() as connection:
+        connection.execute(text("""
+            INSERT INTO conversations (id, user_number, start_time, last_message_at, updated_at,
+                                       business_type, status)
+            SELECT gen_random_uuid(), 'bench-backup-' || n, now() - interval '2 days',
+                   now() - interval '1 day', now() - interval '1 day', 'delivery', 'closed'
+            FROM generate_series(0, :total - 1) AS n
+        """), {'total': conversations})
+        connection.execute(text("""
+            INSERT INTO messages (id, conversation_id, user_number, content, from_user,
+                                  business_type, timestamp)
+            SELECT gen_random_uuid(), c.id, c.user_number, 'Mensagem ' || n || ', com "aspas"',
+                   n % 2 = 0, 'delivery', now() - interval '1 day' - (n || ' milliseconds')::interval
+            FROM generate_series(0, :total - 1) AS n
+            JOIN (SELECT id, user_number, row_number() OVER () - 1 AS i FROM conversations) c
+              ON c.i = n % :conversations
+        """), {'total': messages, 'conversations': conversations})
+        # Criada em T0 (mensagem exportada); outra mensagem em T0+300s levou o
+        # updated_at para depois do limite do backup (now() - SAFETY_LAG)
+        connection.execute(text("""
+            WITH conversation AS (
+                INSERT INTO conversations (id, user_number, start_time, last_message_at,
+                                           updated_at, business_type, status)
+                VALUES (gen_random_uuid(), :user, now() - interval '400 seconds',
+                        now() - interval '100 seconds', now() - interval '100 seconds',
+                        'delivery', 'open')
+                RETURNING id
+            )
+            INSERT INTO messages (id, conversation_id, user_number, content, from_user,
+                                  business_type, timestamp)
+            SELECT gen_random_uuid(), id, :user, texto, from_user, 'delivery', now() - atraso
+            FROM conversation, (VALUES ('Quero uma pizza', true, interval '400 seconds'),
+                                       ('De calabresa', true, interval '100 seconds')) AS m
+                                (texto, from_user, atraso)
+        """), {'user': EDGE_USER})
+
+
+def run(command, url, backup_dir, *extra):
+    """Roda backup.py; devolve (segundos, saída) ou encerra com a saída do erro"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, os.path.join(os.path.dirname(__file__), 'backup.py'),
+         command, '--dir', backup_dir, *extra],
+        env={**os.environ, 'DATABASE_URL': url}, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        print(f"❌ {command} falhou:\n{result.stdout}{result.stderr[-2000:]}")
+        return elapsed, None
+    return elapsed, result.stdout
+
+
+def counts(engine):
+    with engine.connect() as connection:
+        return connection.execute(text("""
+            SELECT (SELECT count(*) FROM conversations), (SELECT count(*) FROM messages),
+                   (SELECT count(*) FROM messages WHERE user_number = :user),
+                   (SELECT updated_at FROM conversations WHERE user_number = :user)
+        """), {'user': EDGE_USER}).one()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--conversations', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=100000)
+    args = parser.parse_args()
+
+    admin = create_engine(DATABASE_URL, isolation_level='AUTOCOMMIT')
+    source = target = None
+    ok = False
+    try:
+        recreate_databases(admin)
+        source = create_engine(database_url(SOURCE_DB))
+        target = create_engine(database_url(TARGET_DB))
+        seed(source, args.conversations, args.messages)
+
+        with tempfile.TemporaryDirectory() as backup_dir:
+            steps = [('backup', source, ['--safety-lag', str(SAFETY_LAG)]),
+                     ('restore', target, []),
+                     # Execução seguinte sem lag: traz a mensagem nova e a conversa atual
+                     ('backup', source, ['--safety-lag', '0']),
+                     ('restore', target, [])]
+            for step, (command, engine, extra) in enumerate(steps):
+                if command == 'backup' and step:
+                    # Pastas por segundo: a segunda execução não pode ter o mesmo nome
+                    time.sleep(1)
+                elapsed, output = run(command, engine.url.render_as_string(hide_password=False),
+                                      backup_dir, *extra)
+                if output is None:
+                    return
+                print(f"📊 {command} {step // 2 + 1}: {elapsed:.1f}s")
+                print('\n'.join(f"   {line}" for line in output.splitlines()
+                                if line.startswith('📊')))
+                if step == 1:
+                    _, _, edge_messages, _ = counts(target)
+                    if edge_messages != 1:
+                        print(f"❌ Primeira execução: {edge_messages} mensagens da conversa "
+                              f"do caso da FK no destino (esperado 1)")
+                        return
+
+        expected, restored = counts(source), counts(target)
+        if restored != expected:
+            print(f"❌ Destino diferente da origem: origem {expected}, destino {restored}")
+            return
+        ok = True
+        print(f"✅ Restore num banco vazio: {restored[0]} conversas e {restored[1]} mensagens, "
+              f"incluindo a mensagem cuja conversa tinha updated_at depois do limite")
+    finally:
+        for engine in (source, target):
+            if engine is not None:
+                engine.dispose()
+        drop_databases(admin)
+        admin.dispose()
+        if not ok:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark da exportação em lote (/admin/conversations/export/zip) contra o
+caminho antigo, um download por conversa em sequência.
+
+Cria --conversations conversas com --messages mensagens cada, marcadas com
+um business_type próprio para o filtro, baixa o ZIP em streaming (tempo
+até o primeiro byte, tempo total, pico de memória da API com --pid) e
+confere o arquivo (entradas e CRC). Remove os dados ao final.
+
+Com a API rodando:
+
+    python scripts/bench_bulk_export.py --conversations 500 --messages 40 --formats csv,pdf
+"""
+
+import argparse
+import io
+import os
+import sys
+import threading
+import time
+import zipfile
+
+import httpx
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import text  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+
+PREFIX = 'bench-zip-'
+BUSINESS_TYPE = 'bench-zip'
+
+
+def seed(db, conversations, messages):
+    db.execute(text("""
+        INSERT INTO conversations (id, user_number, start_time, last_message_at, business_type, status)
+        SELECT gen_random_uuid(), :prefix || n, now() - interval '1 day', now(), :business_type, 'closed'
+        FROM generate_series(1, :total) AS n
+    """), {'prefix': PREFIX, 'total': conversations, 'business_type': BUSINESS_TYPE})
+    db.execute(text("""
+        INSERT INTO messages (id, conversation_id, user_number, content, from_user, business_type, timestamp)
+        SELECT gen_random_uuid(), c.id, c.user_number,
+               'Mensagem ' || n || ': qual o prazo de entrega para o centro?',
+               n % 2 = 0, :business_type, now() - interval '1 day' + (n || ' seconds')::interval
+        FROM conversations c, generate_series(1, :total) AS n
+        WHERE c.business_type = :business_type
+    """), {'total': messages, 'business_type': BUSINESS_TYPE})
+    db.commit()
+    return [str(row[0]) for row in db.execute(text(
+        "SELECT id FROM conversations WHERE business_type = :business_type"),
+        {'business_type': BUSINESS_TYPE})]
+
+
+def cleanup(db):
+    db.execute(text("""
+        DELETE FROM messages WHERE conversation_id IN
+            (SELECT id FROM conversations WHERE business_type = :business_type)
+    """), {'business_type': BUSINESS_TYPE})
+    db.execute(text("DELETE FROM conversations WHERE business_type = :business_type"),
+               {'business_type': BUSINESS_TYPE})
+    db.commit()
+
+
+def sequential(url, ids, kinds):
+    """Caminho antigo: um download por conversa e formato"""
+    started, size = time.perf_counter(), 0
+    with httpx.Client(base_url=url, timeout=300) as client:
+        for conversation_id in ids:
+            for kind in kinds:
+                response = client.get(f'/admin/conversations/{conversation_id}/download/{kind}')
+                response.raise_for_status()
+                size += len(response.content)
+    return time.perf_counter() - started, size
+
+
+def bulk(url, formats, pid):
+    process = psutil.Process(pid) if pid else None
+    peak, done = [process.memory_info().rss if process else 0], threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], process.memory_info().rss)
+            time.sleep(0.05)
+
+    if process:
+        threading.Thread(target=sample, daemon=True).start()
+
+    data, first_byte = io.BytesIO(), None
+    started = time.perf_counter()
+    params = {'business_type': BUSINESS_TYPE, 'formats': formats}
+    with httpx.stream('GET', f'{url}/admin/conversations/export/zip',
+                      params=params, timeout=None) as response:
+        response.raise_for_status()
+        for chunk in response.iter_bytes():
+            if chunk and first_byte is None:
+                first_byte = time.perf_counter() - started
+            data.write(chunk)
+    elapsed = time.perf_counter() - started
+    done.set()
+    return elapsed, first_byte, data, peak[0] / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--conversations', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=40)
+    parser.add_argument('--formats', default='csv')
+    parser.add_argument('--sequential-sample', type=int, default=100,
+                        help='conversas baixadas uma a uma para estimar o caminho antigo')
+    parser.add_argument('--pid', type=int, default=0, help='PID da API para medir memória')
+    args = parser.parse_args()
+    kinds = args.formats.split(',')
+
+    db = SessionLocal()
+    try:
+        ids = seed(db, args.conversations, args.messages)
+
+        sample = ids[:args.sequential_sample]
+        elapsed, _ = sequential(args.url, sample, kinds)
+        estimate = elapsed / len(sample) * len(ids)
+        print(f"📊 Um download por conversa: {len(sample)} conversas em {elapsed:.2f}s "
+              f"(estimado para {len(ids)}: {estimate:.1f}s, {len(ids) * len(kinds)} requisições)")
+
+        elapsed, first_byte, data, peak = bulk(args.url, args.formats, args.pid)
+        with zipfile.ZipFile(data) as archive:
+            names = archive.namelist()
+            bad = archive.testzip()
+        errors = [name for name in names if name.endswith('.erro.txt')]
+        memory = f" | pico RSS da API {peak:.0f}MB" if args.pid else ''
+        print(f"📊 ZIP em lote: {len(names)} arquivos, {data.tell() / 1024 / 1024:.1f}MB em {elapsed:.2f}s "
+              f"(1º byte em {first_byte:.2f}s){memory}")
+        if bad or errors or len(names) != len(ids) * len(kinds):
+            print(f"❌ ZIP inconsistente: CRC {bad}, erros {errors[:3]}")
+            sys.exit(1)
+        print("✅ ZIP completo e íntegro")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Consultas por mensagem do webhook com e sem o cache de conversas.
+
+Processa --users clientes com --messages mensagens cada, no próprio
+processo (mesmo caminho do /webhook), e conta os comandos SQL enviados ao
+banco por mensagem. Depois confere a invalidação por versão: uma mensagem
+gravada "por outro worker" (sessão síncrona, fora do cache) precisa
+aparecer no histórico da próxima resposta. Remove os dados ao final.
+
+Com o servidor falso da OpenAI rodando (scripts/fake_openai_server.py):
+
+    OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=x \\
+        python scripts/bench_conversation_cache.py --users 50 --messages 10
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import event, text  # noqa: E402
+from app.db.session import AsyncSessionLocal, SessionLocal, async_engine  # noqa: E402
+from app.db import async_crud, crud  # noqa: E402
+from app.core import conversation_cache, history, message_handler  # noqa: E402
+
+PREFIX = 'bench-cache-'
+
+statements = Counter()
+
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    verb = statement.lstrip().split(None, 1)[0].upper()
+    statements[verb] += 1
+
+
+async def handle(user_number, content):
+    """Mesmo caminho do POST /webhook"""
+    async with AsyncSessionLocal() as db:
+        await message_handler.process_message(db, user_number, content)
+
+
+async def run(users, messages, label):
+    conversation_cache.clear()
+    statements.clear()
+    started = time.perf_counter()
+    for turn in range(messages):
+        if turn == 1:
+            first = Counter(statements)
+        for n in range(users):
+            await handle(f'{PREFIX}{label}-{n}', f'Mensagem {turn}: quais sabores de pizza?')
+    elapsed = time.perf_counter() - started
+
+    # 1ª mensagem de cada cliente (conversa nova) e as seguintes, em regime
+    for name, counts, total in (('1ª mensagem', first, users),
+                                ('seguintes', statements - first, users * (messages - 1))):
+        writes = (counts['UPDATE'] + counts['INSERT']) / total
+        print(f"📊 {label} | {name}: {counts['SELECT'] / total:.2f} SELECT e "
+              f"{writes:.2f} UPDATE/INSERT por mensagem")
+    print(f"📊 {label}: {users * messages} mensagens em {elapsed:.1f}s")
+
+
+async def check_conflict():
+    """Mensagem gravada por outro worker invalida o cache pela versão"""
+    user_number = f'{PREFIX}conflict'
+    conversation_cache.clear()
+    await handle(user_number, 'Quero uma pizza')
+    await handle(user_number, 'De calabresa')
+
+    with SessionLocal() as db:
+        crud.create_message(db, user_number, 'Mensagem gravada por outro worker')
+
+    conflicts = conversation_cache.cache_stats['conflicts']
+    await handle(user_number, 'Pode entregar?')
+    async with AsyncSessionLocal() as db:
+        conversation, _ = await async_crud.load_conversation_state(
+            db, user_number, conversation_cache.get(user_number)['conversation_id'],
+            limit=history.HISTORY_FETCH_LIMIT)
+        from_db = [m.content for m in await async_crud.get_recent_messages(
+            db, conversation.id, after=conversation.summarized_until,
+            limit=history.HISTORY_FETCH_LIMIT)]
+    cached = [content for _, content, _ in conversation_cache.get(user_number)['messages']]
+
+    if conversation_cache.cache_stats['conflicts'] == conflicts or cached != from_db \
+            or 'Mensagem gravada por outro worker' not in cached:
+        print(f"❌ Cache divergente do banco:\n   cache {cached}\n   banco {from_db}")
+        sys.exit(1)
+    print(f"✅ Gravação de outro worker detectada pela versão; janela em cache = banco "
+          f"({len(cached)} mensagens)")
+
+
+def cleanup():
+    with SessionLocal() as db:
+        db.execute(text("""
+            DELETE FROM messages WHERE conversation_id IN
+                (SELECT id FROM conversations WHERE user_number LIKE :like)
+        """), {'like': f'{PREFIX}%'})
+        db.execute(text("DELETE FROM conversations WHERE user_number LIKE :like"),
+                   {'like': f'{PREFIX}%'})
+        db.commit()
+
+
+async def main(args):
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', count_statement)
+    # Sem resumos em segundo plano durante a medição
+    history.HISTORY_SUMMARY_BATCH = 10 ** 6
+
+    size = conversation_cache.CONVERSATION_CACHE_SIZE
+    conversation_cache.CONVERSATION_CACHE_SIZE = 0
+    await run(args.users, args.messages, 'sem-cache')
+    conversation_cache.CONVERSATION_CACHE_SIZE = size
+    await run(args.users, args.messages, 'com-cache')
+    print(f"📊 Cache: {conversation_cache.snapshot()}")
+
+    await check_conflict()
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=10)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    finally:
+        cleanup()
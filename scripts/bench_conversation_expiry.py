@@ -0,0 +1,108 @@
+"""
+Benchmark do caminho de banco do /webhook com muitas conversas abertas.
+
+Compara a varredura antiga (N+1 a cada mensagem) com o caminho atual
+(expiração em lote fora da requisição). Usa o DATABASE_URL configurado e
+remove os dados gerados ao final.
+
+    python scripts/bench_conversation_expiry.py --conversations 10000 --requests 200
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import desc  # noqa: E402
+from app.db.session import SessionLocal, engine  # noqa: E402
+from app.db import crud, models  # noqa: E402
+
+PREFIX = 'bench-expiry-'
+
+
+def legacy_close_inactive_conversations(db, inactivity_minutes=60):
+    """Reprodução da varredura anterior: uma consulta por conversa aberta"""
+    cutoff_time = datetime.now(timezone.utc) - \
+        timedelta(minutes=inactivity_minutes)
+    open_conversations = db.query(models.Conversation).filter(
+        models.Conversation.status == 'open'
+    ).all()
+    for conversation in open_conversations:
+        last_message = db.query(models.Message).filter(
+            models.Message.conversation_id == conversation.id
+        ).order_by(desc(models.Message.timestamp)).first()
+        if last_message and last_message.timestamp < cutoff_time:
+            conversation.status = 'closed'
+    db.commit()
+
+
+def seed(db, total):
+    now = datetime.now(timezone.utc)
+    db.bulk_insert_mappings(models.Conversation, [
+        {
+            'user_number': f'{PREFIX}{i}',
+            'status': 'open',
+            'business_type': 'unknown',
+            'last_message_at': now,
+        }
+        for i in range(total)
+    ])
+    db.commit()
+
+
+def cleanup(db):
+    ids = db.query(models.Conversation.id).filter(
+        models.Conversation.user_number.like(f'{PREFIX}%'))
+    db.query(models.Message).filter(
+        models.Message.conversation_id.in_(ids)
+    ).delete(synchronize_session=False)
+    db.query(models.Conversation).filter(
+        models.Conversation.user_number.like(f'{PREFIX}%')
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def measure(db, requests, legacy):
+    latencies = []
+    for i in range(requests):
+        started = time.perf_counter()
+        if legacy:
+            legacy_close_inactive_conversations(db)
+        crud.create_message(db, f'{PREFIX}{i}', 'Oi, tudo bem?')
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{label:<10} p50={statistics.median(latencies):8.2f}ms "
+          f"p99={p99:8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--conversations', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        cleanup(db)
+        seed(db, args.conversations)
+        print(f"📊 {args.conversations} conversas abertas, "
+              f"{args.requests} mensagens por cenário")
+        report('antes', measure(db, args.requests, legacy=True))
+        report('depois', measure(db, args.requests, legacy=False))
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
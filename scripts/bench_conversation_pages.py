@@ -0,0 +1,98 @@
+"""
+Benchmark de /admin/conversations conforme a tabela cresce: primeira página,
+página profunda (cursor perto do fim), total estimado e total exato.
+
+Com a API rodando, cria as conversas de benchmark em etapas (total acumulado)
+e remove tudo ao final:
+
+    python scripts/bench_conversation_pages.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import text  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+from app.api.admin_api import encode_cursor  # noqa: E402
+
+PREFIX = 'bench-pages-'
+LIST_FIELDS = 'id,user_number,start_time,end_time,business_type,status,needs_human,sentiment'
+
+
+def seed_until(db, total):
+    current = db.execute(text(
+        "SELECT count(*) FROM conversations WHERE user_number LIKE :prefix"),
+        {'prefix': f'{PREFIX}%'}).scalar()
+    if current >= total:
+        return
+    db.execute(text("""
+        INSERT INTO conversations (id, user_number, start_time, last_message_at,
+                                   business_type, status, needs_human)
+        SELECT gen_random_uuid(), :prefix || n,
+               now() - (n || ' seconds')::interval, now() - (n || ' seconds')::interval,
+               (ARRAY['delivery', 'mechanic', 'pharmacy', 'unknown'])[1 + n % 4],
+               'closed', n % 10 = 0
+        FROM generate_series(:start, :stop) AS n
+    """), {'prefix': PREFIX, 'start': current, 'stop': total - 1})
+    db.execute(text("ANALYZE conversations"))
+    db.commit()
+
+
+def deep_cursor(db, total):
+    row = db.execute(text("""
+        SELECT start_time, id FROM conversations ORDER BY start_time DESC, id DESC
+        OFFSET :offset LIMIT 1
+    """), {'offset': int(total * 0.9)}).first()
+    return encode_cursor(row.start_time, row.id)
+
+
+def timed(client, url, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        client.get(f'{url}/admin/conversations', params=params).raise_for_status()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--keep', action='store_true', help='não remover os dados')
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        with httpx.Client(timeout=300) as client:
+            for size in args.sizes:
+                seed_until(db, size)
+                cursor = deep_cursor(db, size)
+                base = {'fields': LIST_FIELDS, 'limit': 50}
+                first = timed(client, args.url, base, args.repeat)
+                deep = timed(client, args.url, {**base, 'cursor': cursor}, args.repeat)
+                estimate = timed(client, args.url, {**base, 'count': 'estimate',
+                                                    'business_type': 'delivery'}, args.repeat)
+                exact = timed(client, args.url, {**base, 'count': 'exact',
+                                                 'business_type': 'delivery'}, args.repeat)
+                print(f"📊 {size:>9} conversas | 1ª página {first:7.1f}ms | "
+                      f"página profunda {deep:7.1f}ms | total estimado {estimate:7.1f}ms | "
+                      f"total exato {exact:8.1f}ms")
+    finally:
+        if not args.keep:
+            db.execute(text("DELETE FROM conversations WHERE user_number LIKE :prefix"),
+                       {'prefix': f'{PREFIX}%'})
+            db.commit()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark da exportação CSV em streaming: cria uma conversa grande e um
+volume de mensagens no período, baixa /admin/conversations/{id}/download/csv
+e /admin/messages/export/csv e mede tempo, linhas/s e memória do processo
+da API durante o download (RSS amostrado via psutil).
+
+Com a API rodando:
+
+    python scripts/bench_csv_export.py --messages 1000000 --pid $(pgrep -f "uvicorn main:app")
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import text  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+
+PREFIX = 'bench-csv-'
+
+
+def seed(db, conversations, messages):
+    """Conversas de benchmark com as mensagens distribuídas entre elas"""
+    db.execute(text("""
+        INSERT INTO conversations (id, user_number, start_time, last_message_at, business_type, status)
+        SELECT gen_random_uuid(), :prefix || n, now() - interval '1 day', now(), 'delivery', 'closed'
+        FROM generate_series(0, :total - 1) AS n
+    """), {'prefix': PREFIX, 'total': conversations})
+    db.execute(text("""
+        INSERT INTO messages (id, conversation_id, user_number, content, from_user, business_type, timestamp)
+        SELECT gen_random_uuid(), c.id, c.user_number,
+               'Mensagem de teste número ' || n || ', com vírgula e "aspas"',
+               n % 2 = 0, 'delivery', now() - interval '1 day' + (n || ' milliseconds')::interval
+        FROM generate_series(0, :total - 1) AS n
+        JOIN (SELECT id, user_number, row_number() OVER () - 1 AS i
+              FROM conversations WHERE user_number LIKE :like) c
+          ON c.i = n % :conversations
+    """), {'total': messages, 'conversations': conversations, 'like': f'{PREFIX}%'})
+    db.commit()
+    return db.execute(text(
+        "SELECT id FROM conversations WHERE user_number = :first"),
+        {'first': f'{PREFIX}0'}).scalar()
+
+
+def cleanup(db):
+    db.execute(text("""
+        DELETE FROM messages WHERE conversation_id IN
+            (SELECT id FROM conversations WHERE user_number LIKE :like)
+    """), {'like': f'{PREFIX}%'})
+    db.execute(text("DELETE FROM conversations WHERE user_number LIKE :like"),
+               {'like': f'{PREFIX}%'})
+    db.commit()
+
+
+def download(url, params, pid):
+    """Baixa em streaming; retorna (bytes, linhas, segundos, pico de RSS em MB)"""
+    process = psutil.Process(pid) if pid else None
+    peak, done = [process.memory_info().rss if process else 0], threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], process.memory_info().rss)
+            time.sleep(0.05)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    if process:
+        sampler.start()
+
+    size, lines, started = 0, 0, time.perf_counter()
+    with httpx.stream('GET', url, params=params, timeout=None) as response:
+        response.raise_for_status()
+        for chunk in response.iter_bytes():
+            size += len(chunk)
+            lines += chunk.count(b'\n')
+    elapsed = time.perf_counter() - started
+    done.set()
+    return size, lines, elapsed, peak[0] / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--conversations', type=int, default=10)
+    parser.add_argument('--pid', type=int, default=0, help='PID da API para medir memória')
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        conversation_id = seed(db, args.conversations, args.messages)
+        base_rss = psutil.Process(args.pid).memory_info().rss / 1024 / 1024 if args.pid else 0
+        end = datetime.now(timezone.utc)
+
+        runs = [
+            ('conversa única', f'{args.url}/admin/conversations/{conversation_id}/download/csv', {}),
+            ('período', f'{args.url}/admin/messages/export/csv',
+             {'start_date': (end - timedelta(days=2)).isoformat(), 'end_date': end.isoformat()}),
+        ]
+        for label, url, params in runs:
+            size, lines, elapsed, peak = download(url, params, args.pid)
+            memory = f" | RSS {base_rss:.0f}MB -> pico {peak:.0f}MB" if args.pid else ''
+            print(f"📊 {label:15} {lines:>9} linhas, {size / 1024 / 1024:7.1f}MB em {elapsed:6.2f}s "
+                  f"({lines / elapsed:,.0f} linhas/s){memory}")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
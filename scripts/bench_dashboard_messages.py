@@ -0,0 +1,137 @@
+"""
+Benchmark do carregamento de mensagens do dashboard: o caminho antigo
+(lista de conversas + um /admin/messages por conversa) contra o
+/admin/messages/all paginado em formato colunar.
+
+Com a API rodando:
+
+    python scripts/bench_dashboard_messages.py --seed 5000 --messages-per-conversation 10
+    python scripts/bench_dashboard_messages.py --cleanup
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import insert, delete, select  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+from app.db import models  # noqa: E402
+
+BENCH_PREFIX = 'bench-dash-'
+BUSINESS_TYPES = ['delivery', 'mechanic', 'pharmacy', 'unknown']
+
+
+def seed(conversations, messages_per_conversation):
+    now = datetime.now(timezone.utc)
+    conversation_rows, message_rows = [], []
+    for i in range(conversations):
+        conversation_id = uuid.uuid4()
+        started = now - timedelta(minutes=random.randint(0, 7 * 24 * 60))
+        business_type = random.choice(BUSINESS_TYPES)
+        conversation_rows.append({
+            'id': conversation_id, 'user_number': f'{BENCH_PREFIX}{i}',
+            'start_time': started, 'last_message_at': started,
+            'business_type': business_type, 'status': 'closed'
+        })
+        for j in range(messages_per_conversation):
+            message_rows.append({
+                'id': uuid.uuid4(), 'conversation_id': conversation_id,
+                'user_number': f'{BENCH_PREFIX}{i}', 'from_user': j % 2 == 0,
+                'content': 'Quais sabores de pizza vocês têm hoje?',
+                'business_type': business_type,
+                'timestamp': started + timedelta(seconds=30 * j)
+            })
+
+    with SessionLocal() as db:
+        db.execute(insert(models.Conversation), conversation_rows)
+        for i in range(0, len(message_rows), 10000):
+            db.execute(insert(models.Message), message_rows[i:i + 10000])
+        db.commit()
+    print(f"✅ {conversations} conversas e {len(message_rows)} mensagens criadas")
+
+
+def cleanup():
+    with SessionLocal() as db:
+        ids = select(models.Conversation.id).where(
+            models.Conversation.user_number.like(f'{BENCH_PREFIX}%'))
+        db.execute(delete(models.Message).where(models.Message.conversation_id.in_(ids)))
+        result = db.execute(delete(models.Conversation).where(
+            models.Conversation.user_number.like(f'{BENCH_PREFIX}%')))
+        db.commit()
+    print(f"✅ {result.rowcount} conversas de benchmark removidas")
+
+
+def load_per_conversation(client, url):
+    """Caminho antigo do dashboard: N+1 requisições"""
+    conversations, params, pages = [], {'fields': 'id', 'limit': 1000}, 0
+    while True:
+        page = client.get(f'{url}/admin/conversations', params=params).json()
+        pages += 1
+        conversations.extend(page['conversations'])
+        if not page['next_cursor']:
+            break
+        params['cursor'] = page['next_cursor']
+
+    messages = []
+    for conversation in conversations:
+        messages.extend(client.get(
+            f'{url}/admin/messages', params={'conversation_id': conversation['id']}).json())
+    return len(messages), len(conversations) + pages
+
+
+def load_bulk(client, url, params):
+    params = dict(params, format='columns', include_content='false')
+    total, requests_made = 0, 0
+    while True:
+        page = client.get(f'{url}/admin/messages/all', params=params).json()
+        requests_made += 1
+        total += page['count']
+        if not page['next_cursor']:
+            return total, requests_made
+        params['cursor'] = page['next_cursor']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='conversas de benchmark a criar antes de medir')
+    parser.add_argument('--messages-per-conversation', type=int, default=10)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--skip-legacy', action='store_true')
+    parser.add_argument('--cleanup', action='store_true')
+    args = parser.parse_args()
+
+    if args.cleanup:
+        cleanup()
+        return
+    if args.seed:
+        seed(args.seed, args.messages_per_conversation)
+
+    end = datetime.now(timezone.utc)
+    params = {'start_date': (end - timedelta(days=args.days)).isoformat(),
+              'end_date': end.isoformat()}
+
+    with httpx.Client(timeout=300) as client:
+        if not args.skip_legacy:
+            started = time.perf_counter()
+            total, requests_made = load_per_conversation(client, args.url)
+            print(f"📊 Por conversa:      {total} mensagens, {requests_made} requisições, "
+                  f"{time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        total, requests_made = load_bulk(client, args.url, params)
+        print(f"📊 /admin/messages/all: {total} mensagens, {requests_made} requisições, "
+              f"{time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
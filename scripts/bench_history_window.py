@@ -0,0 +1,56 @@
+"""
+Replay de conversas longas no /webhook para acompanhar o tamanho do prompt
+e a latência a cada turno. Com a janela + resumo, ambos ficam estáveis.
+
+Suba a API com o servidor falso da OpenAI (ver scripts/fake_openai_server.py)
+e rode:
+
+    python scripts/bench_history_window.py --turns 200 --every 20
+"""
+
+import argparse
+import time
+import uuid
+import httpx
+
+MESSAGES = [
+    "Quais sabores de pizza vocês têm?",
+    "Quanto custa a pizza de calabresa?",
+    "E a de quatro queijos? Dá para fazer meio a meio?",
+    "Qual a taxa de entrega para o centro?",
+    "Aceitam pix? Quero pedir uma pizza e um guaraná.",
+]
+
+
+def reply_prompt_tokens(client, base_url):
+    snapshot = client.get(f"{base_url}/admin/metrics/llm").json()
+    return snapshot.get('prompt_tokens_by_purpose', {}).get('reply', 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--turns', type=int, default=200)
+    parser.add_argument('--every', type=int, default=20)
+    args = parser.parse_args()
+
+    user_number = f"bench-history-{uuid.uuid4().hex[:8]}"
+    with httpx.Client(timeout=120) as client:
+        previous_tokens = reply_prompt_tokens(client, args.base_url)
+        print(f"{'turno':>6} {'tokens do prompt':>18} {'latência':>10}")
+        for turn in range(1, args.turns + 1):
+            started = time.perf_counter()
+            client.post(f"{args.base_url}/webhook", json={
+                "user_number": user_number,
+                "message": MESSAGES[turn % len(MESSAGES)]
+            }).raise_for_status()
+            elapsed = time.perf_counter() - started
+
+            tokens = reply_prompt_tokens(client, args.base_url)
+            if turn == 1 or turn % args.every == 0:
+                print(f"{turn:>6} {tokens - previous_tokens:>18} {elapsed * 1000:>8.0f}ms")
+            previous_tokens = tokens
+
+
+if __name__ == '__main__':
+    main()
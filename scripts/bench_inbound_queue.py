@@ -0,0 +1,251 @@
+"""
+Fila durável de mensagens recebidas (app/core/inbound_queue.py): vazão por
+número de processos worker, novas tentativas e dead-letter.
+
+Para cada nível de --workers: sobe os workers, enfileira --users x
+--messages mensagens pelo /webhook (API com INBOUND_QUEUE_ENABLED=true) e
+mede o tempo até a fila esvaziar, acompanhando a profundidade em
+/admin/metrics/inbound. As respostas vão para um bridge falso neste
+processo, que recusa a primeira entrega de 1 em cada 10 clientes (nova
+tentativa só da entrega) e todas as de um cliente "envenenado" (vai para
+dead-letter). Um trigger temporário faz falhar a gravação da resposta
+de outro cliente depois que a mensagem dele já foi gravada: as novas
+tentativas não podem gravar a mensagem de novo. Confere que cada cliente
+recebeu uma resposta por mensagem, na ordem, sem processamento repetido.
+Remove os dados ao final.
+
+Suba o servidor falso da OpenAI com latência e a API com a fila:
+
+    FAKE_OPENAI_DELAY=1.0 uvicorn scripts.fake_openai_server:app --port 9001
+    INBOUND_QUEUE_ENABLED=true OPENAI_BASE_URL=http://localhost:9001/v1 uvicorn main:app
+
+    OPENAI_BASE_URL=http://localhost:9001/v1 \\
+        python scripts/bench_inbound_queue.py --workers 1 2 4 --concurrency 5
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import text  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+from app.db import models  # noqa: E402
+
+PREFIX = 'bench-inbound-'
+POISON = f'{PREFIX}poison'
+# Falha depois de gravar a mensagem do cliente (gravação da resposta)
+FAILING = f'{PREFIX}failing'
+
+bridge = FastAPI()
+deliveries = defaultdict(list)
+refused = defaultdict(int)
+
+
+@bridge.post('/send-message')
+def send_message(payload: dict):
+    number = payload['number']
+    flaky = number != POISON and int(number.rsplit('-', 1)[-1]) % 10 == 0
+    if number == POISON or (flaky and refused[number] == 0):
+        refused[number] += 1
+        return JSONResponse(status_code=500, content={'error': 'WhatsApp indisponível'})
+    deliveries[number].append(payload['message'])
+    return {'status': 'ok'}
+
+
+def start_bridge(port):
+    server = uvicorn.Server(uvicorn.Config(bridge, port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    time.sleep(1)
+
+
+async def enqueue(url, users, messages):
+    """Mensagens de cada cliente em ordem; clientes em paralelo"""
+    latencies = []
+    async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+        async def send_user(user_number):
+            for n in range(messages):
+                started = time.perf_counter()
+                response = await client.post('/webhook', json={
+                    'user_number': user_number,
+                    'message': f'Mensagem {n}: quais sabores de pizza?',
+                    'message_id': f'{user_number}-{n}'
+                })
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            # Reenvio do bridge: não pode duplicar
+            response = await client.post('/webhook', json={
+                'user_number': user_number, 'message': 'Mensagem 0: quais sabores de pizza?',
+                'message_id': f'{user_number}-0'})
+            assert response.json()['duplicate'], response.json()
+
+        await asyncio.gather(*(send_user(f'{PREFIX}{n}') for n in range(users)),
+                             send_user(POISON), send_user(FAILING))
+    return sorted(latencies)
+
+
+def backlog(url):
+    return httpx.get(f'{url}/admin/metrics/inbound').json()
+
+
+def start_workers(args):
+    env = {
+        **os.environ,
+        'INBOUND_DELIVERY_URL': f'http://127.0.0.1:{args.bridge_port}/send-message',
+        'INBOUND_QUEUE_RETRY_SECONDS': '0.2',
+        'INBOUND_QUEUE_MAX_ATTEMPTS': '3',
+        'INBOUND_QUEUE_POLL_SECONDS': '0.1',
+        # Uma mensagem por rodada: mede vazão de mensagens, não de rajadas
+        'USER_QUEUE_MAX_BURST': '1',
+        'USER_QUEUE_DEBOUNCE_MS': '0',
+    }
+    return lambda workers: subprocess.Popen(
+        [sys.executable, '-m', 'app.core.inbound_queue',
+         '--workers', str(workers), '--concurrency', str(args.concurrency)],
+        env=env, cwd=os.path.join(os.path.dirname(__file__), '..'),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def fail_replies(enabled):
+    """Trigger que recusa a resposta do bot para FAILING"""
+    with SessionLocal() as db:
+        db.execute(text("DROP TRIGGER IF EXISTS bench_inbound_fail ON messages"))
+        if enabled:
+            db.execute(text("""
+                CREATE OR REPLACE FUNCTION bench_inbound_fail() RETURNS trigger AS $$
+                BEGIN RAISE EXCEPTION 'falha simulada ao gravar a resposta'; END
+                $$ LANGUAGE plpgsql
+            """))
+            db.execute(text(f"""
+                CREATE TRIGGER bench_inbound_fail BEFORE INSERT ON messages FOR EACH ROW
+                WHEN (NEW.user_number = '{FAILING}' AND NOT NEW.from_user)
+                EXECUTE FUNCTION bench_inbound_fail()
+            """))
+        else:
+            db.execute(text("DROP FUNCTION IF EXISTS bench_inbound_fail()"))
+        db.commit()
+
+
+def check(users, messages):
+    """Uma resposta por mensagem, na ordem, e os clientes com falha em dead-letter"""
+    with SessionLocal() as db:
+        dead = db.query(models.InboundMessage).filter(
+            models.InboundMessage.user_number.in_((POISON, FAILING)),
+            models.InboundMessage.status == 'dead').count()
+        # Mensagens do cliente com falha: gravadas uma vez, apesar das tentativas
+        failing_stored = db.query(models.Message).filter(
+            models.Message.user_number == FAILING).count()
+        problems = []
+        for n in range(users):
+            user_number = f'{PREFIX}{n}'
+            stored = [(m.from_user, m.content) for m in db.query(models.Message).filter(
+                models.Message.user_number == user_number).order_by(models.Message.timestamp)]
+            inbound = [content for from_user, content in stored if from_user]
+            expected = [f'Mensagem {i}: quais sabores de pizza?' for i in range(messages)]
+            alternating = [from_user for from_user, _ in stored] == [True, False] * messages
+            if inbound != expected or not alternating or len(deliveries[user_number]) != messages:
+                problems.append(user_number)
+    retried = sum(1 for number in refused if number != POISON)
+    if problems or dead != 2 * messages or failing_stored != messages:
+        print(f"❌ {len(problems)} clientes com respostas faltando/fora de ordem "
+              f"(ex.: {problems[:3]}); dead-letter: {dead}; mensagens gravadas do cliente "
+              f"com falha: {failing_stored} de {messages}")
+        sys.exit(1)
+    print(f"✅ {users} clientes: uma resposta por mensagem, em ordem; {retried} entregas "
+          f"repetidas sem reprocessar; clientes com falha em dead-letter, mensagens "
+          f"gravadas uma vez ({failing_stored})")
+
+
+def cleanup():
+    with SessionLocal() as db:
+        db.execute(text("""
+            DELETE FROM messages WHERE conversation_id IN
+                (SELECT id FROM conversations WHERE user_number LIKE :like)
+        """), {'like': f'{PREFIX}%'})
+        db.execute(text("DELETE FROM conversations WHERE user_number LIKE :like"),
+                   {'like': f'{PREFIX}%'})
+        db.execute(text("DELETE FROM inbound_messages WHERE user_number LIKE :like"),
+                   {'like': f'{PREFIX}%'})
+        db.commit()
+    deliveries.clear()
+    refused.clear()
+
+
+def run_level(args, workers, spawn):
+    cleanup()
+    # Workers já no ar (sem o tempo de importação) antes das mensagens chegarem
+    process = spawn(workers)
+    time.sleep(args.warmup)
+
+    started = time.perf_counter()
+    samples = []
+    try:
+        latencies = asyncio.run(enqueue(args.url, args.users, args.messages))
+        while True:
+            state = backlog(args.url)
+            samples.append(state['depth'])
+            if state['depth'] == 0:
+                break
+            if time.perf_counter() - started > args.timeout:
+                print(f"❌ Fila não esvaziou em {args.timeout}s: {state}")
+                sys.exit(1)
+            time.sleep(0.5)
+        elapsed = time.perf_counter() - started
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait()
+
+    total = args.users * args.messages
+    print(f"📊 /webhook (enfileirar): latência mediana {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms")
+    step = max(len(samples) // 6, 1)
+    print(f"📊 {workers} worker(s) x {args.concurrency}: {total} mensagens em {elapsed:.1f}s "
+          f"({total / elapsed:.1f} mensagens/s); profundidade {samples[::step]}")
+    check(args.users, args.messages)
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--concurrency', type=int, default=5)
+    parser.add_argument('--users', type=int, default=60)
+    parser.add_argument('--messages', type=int, default=3)
+    parser.add_argument('--bridge-port', type=int, default=3999)
+    parser.add_argument('--timeout', type=int, default=300)
+    parser.add_argument('--warmup', type=float, default=8,
+                        help='segundos para os workers subirem')
+    args = parser.parse_args()
+
+    if not backlog(args.url)['enabled']:
+        print("❌ Suba a API com INBOUND_QUEUE_ENABLED=true")
+        sys.exit(1)
+
+    start_bridge(args.bridge_port)
+    spawn = start_workers(args)
+    fail_replies(True)
+    try:
+        rates = {workers: run_level(args, workers, spawn) for workers in args.workers}
+    finally:
+        fail_replies(False)
+        cleanup()
+    base = rates[args.workers[0]]
+    print("📊 Escala: " + ", ".join(
+        f"{workers} → {rate / base:.2f}x" for workers, rate in rates.items()))
+
+
+if __name__ == '__main__':
+    main()
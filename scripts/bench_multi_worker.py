@@ -0,0 +1,288 @@
+"""
+API com vários processos (uvicorn --workers N): vazão, corrida na criação
+de conversas e jobs em um só processo.
+
+Para cada nível de --workers sobe `uvicorn main:app --workers N` em
+--port (com a fila por cliente desligada, para as requisições do mesmo
+cliente correrem em paralelo também dentro do processo) e mede:
+
+- vazão (carga aberta): mensagens chegando a --rate-per-worker x N por
+  segundo durante --duration segundos, cada uma de um cliente novo,
+  sem esperar as respostas anteriores. A carga oferecida cresce com N;
+  a vazão obtida, a latência e o tempo de CPU por mensagem (da API e da
+  máquina inteira) mostram onde a escala para. Use uma taxa acima da
+  capacidade de um worker. Com um núcleo por worker a vazão acompanha N
+  até o limite da OpenAI/Postgres; com menos núcleos que workers, o teto
+  é núcleos / CPU da máquina por mensagem;
+- corrida: --race clientes novos mandando --burst mensagens ao mesmo
+  tempo; confere uma conversa aberta por cliente (índice único parcial +
+  upsert) e todas as mensagens gravadas, sem erro;
+- jobs: cada advisory lock de job (expiração e agregados) com um só dono;
+  derruba a conexão do líder e confere que o job volta a ter um dono.
+
+O pool de cada processo sai de --db-connections dividido pelos processos
+(sem isso, N workers com o pool padrão passam do max_connections do
+Postgres). Remove os dados ao final. Suba o servidor falso da OpenAI:
+
+    FAKE_OPENAI_DELAY=1.0 uvicorn scripts.fake_openai_server:app --port 9001
+
+    OPENAI_BASE_URL=http://localhost:9001/v1 \\
+        python scripts/bench_multi_worker.py --workers 1 2 4 --rate-per-worker 40
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import func, text  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+from app.db import locks, models  # noqa: E402
+
+PREFIX = 'bench-workers-'
+JOB_INTERVAL_SECONDS = 1
+
+
+def pool_env(connections, workers):
+    """
+    Divide o orçamento de conexões entre os processos: cada um abre até
+    2 x (DB_POOL_SIZE + DB_MAX_OVERFLOW) (engine síncrono e assíncrono)
+    """
+    per_engine = max(connections // (workers * 2), 2)
+    return {'DB_POOL_SIZE': str(per_engine // 2),
+            'DB_MAX_OVERFLOW': str(per_engine - per_engine // 2)}
+
+
+def start_api(port, workers, connections):
+    env = {
+        **os.environ,
+        **pool_env(connections, workers),
+        'USER_QUEUE_ENABLED': 'false',
+        'EXPIRY_INTERVAL_SECONDS': str(JOB_INTERVAL_SECONDS),
+        'ROLLUP_INTERVAL_SECONDS': str(JOB_INTERVAL_SECONDS),
+    }
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning'],
+        env=env, cwd=os.path.join(os.path.dirname(__file__), '..'),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def wait_ready(url, workers, warmup, timeout=60):
+    """API respondendo e os líderes dos jobs eleitos; depois espera os outros processos"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            httpx.get(f'{url}/admin/metrics/queue', timeout=2).raise_for_status()
+            if len(job_holders()) == 2:
+                # Processos no ar (importação e treino do classificador) antes da carga
+                time.sleep(warmup)
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    print(f"❌ API com {workers} worker(s) não subiu em {timeout}s")
+    sys.exit(1)
+
+
+def job_holders():
+    """objid do lock -> pids do Postgres que o detêm"""
+    with SessionLocal() as db:
+        rows = db.execute(text("""
+            SELECT objid, pid FROM pg_locks
+            WHERE locktype = 'advisory' AND classid = :lock_class AND granted
+        """), {'lock_class': locks.JOB_LOCK_CLASS}).all()
+    holders = {}
+    for objid, pid in rows:
+        holders.setdefault(objid, set()).add(pid)
+    return holders
+
+
+def cpu_seconds(group):
+    """Tempo de CPU (usuário + sistema) dos processos do grupo (Linux, /proc)"""
+    total = 0
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/stat') as stat:
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        # Depois do nome: estado, ppid, pgrp, ...; utime e stime são os campos 14 e 15
+        if int(fields[2]) == group:
+            total += int(fields[11]) + int(fields[12])
+    return total / os.sysconf('SC_CLK_TCK')
+
+
+def machine_cpu_seconds():
+    """CPU ocupada da máquina inteira (API, Postgres, OpenAI falsa e este cliente)"""
+    with open('/proc/stat') as stat:
+        user, nice, system, _, _, irq, softirq, steal = map(int, stat.readline().split()[1:9])
+    return (user + nice + system + irq + softirq + steal) / os.sysconf('SC_CLK_TCK')
+
+
+async def throughput(url, rate, duration):
+    """Carga aberta: uma mensagem a cada 1/rate segundos, sem esperar as respostas"""
+    latencies, errors = [], []
+    async with httpx.AsyncClient(base_url=url, timeout=120,
+                                 limits=httpx.Limits(max_connections=None)) as client:
+        async def send(n):
+            started = time.perf_counter()
+            try:
+                response = await client.post('/webhook', json={
+                    'user_number': f'{PREFIX}{uuid.uuid4().hex[:12]}',
+                    'message': f'Mensagem {n}: quais sabores de pizza?'
+                })
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            except httpx.HTTPError as e:
+                errors.append(e)
+
+        started = time.perf_counter()
+        tasks = []
+        for n in range(int(rate * duration)):
+            await asyncio.sleep(max(started + n / rate - time.perf_counter(), 0))
+            tasks.append(asyncio.create_task(send(n)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return elapsed, sorted(latencies), errors
+
+
+async def race(url, users, burst):
+    """Rajadas simultâneas do mesmo cliente; devolve as respostas com erro"""
+    errors = []
+    async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+        async def send(user_number, n):
+            response = await client.post('/webhook', json={
+                'user_number': user_number, 'message': f'Oi {n}'})
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+        await asyncio.gather(*(send(f'{PREFIX}race-{user}', n)
+                               for user in range(users) for n in range(burst)))
+    return errors
+
+
+def check_race(users, burst, errors):
+    with SessionLocal() as db:
+        conversations = dict(db.query(
+            models.Conversation.user_number, func.count(models.Conversation.id)
+        ).filter(models.Conversation.user_number.like(f'{PREFIX}race-%'),
+                 models.Conversation.status == 'open'
+                 ).group_by(models.Conversation.user_number).all())
+        stored = db.query(models.Message).filter(
+            models.Message.user_number.like(f'{PREFIX}race-%'),
+            models.Message.from_user.is_(True)).count()
+    duplicated = sum(1 for count in conversations.values() if count > 1)
+    if errors or duplicated or len(conversations) != users or stored != users * burst:
+        print(f"❌ Corrida: {len(errors)} erros, {duplicated} clientes com conversas abertas "
+              f"duplicadas, {stored} de {users * burst} mensagens gravadas")
+        return False
+    print(f"✅ Corrida: {users} clientes x {burst} mensagens simultâneas, uma conversa "
+          f"aberta por cliente e todas as mensagens gravadas")
+    return True
+
+
+def check_jobs():
+    """Um dono por job; sem a conexão do líder, o job volta a ter dono"""
+    holders = job_holders()
+    if len(holders) != 2 or any(len(pids) != 1 for pids in holders.values()):
+        print(f"❌ Jobs: esperado um dono para cada um dos 2 jobs, encontrado {holders}")
+        return False
+
+    objid, pids = next(iter(holders.items()))
+    leader = next(iter(pids))
+    with SessionLocal() as db:
+        db.execute(text("SELECT pg_terminate_backend(:pid)"), {'pid': leader})
+        db.commit()
+    started = time.perf_counter()
+    while time.perf_counter() - started < JOB_INTERVAL_SECONDS * 10:
+        time.sleep(0.2)
+        successor = job_holders().get(objid, set())
+        if successor and leader not in successor:
+            print(f"✅ Jobs: um processo por job; conexão do líder derrubada, job retomado em "
+                  f"{time.perf_counter() - started:.1f}s")
+            return True
+    print("❌ Jobs: nenhum processo assumiu o job depois da queda do líder")
+    return False
+
+
+def cleanup():
+    with SessionLocal() as db:
+        db.execute(text("""
+            DELETE FROM messages WHERE conversation_id IN
+                (SELECT id FROM conversations WHERE user_number LIKE :like)
+        """), {'like': f'{PREFIX}%'})
+        db.execute(text("DELETE FROM conversations WHERE user_number LIKE :like"),
+                   {'like': f'{PREFIX}%'})
+        db.commit()
+
+
+def run_level(args, workers):
+    url = f'http://127.0.0.1:{args.port}'
+    cleanup()
+    process = start_api(args.port, workers, args.db_connections)
+    rate = args.rate_per_worker * workers
+    try:
+        wait_ready(url, workers, args.warmup)
+        cpu_before, machine_before = cpu_seconds(process.pid), machine_cpu_seconds()
+        elapsed, latencies, failures = asyncio.run(throughput(url, rate, args.duration))
+        cpu = cpu_seconds(process.pid) - cpu_before
+        machine = machine_cpu_seconds() - machine_before
+        errors = asyncio.run(race(url, args.race, args.burst))
+        ok = check_race(args.race, args.burst, errors) & check_jobs()
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait()
+
+    done = len(latencies)
+    cpu_per_message = cpu / max(done, 1)
+    print(f"📊 {workers} worker(s), {rate:.0f} mensagens/s oferecidas: {done} respondidas em "
+          f"{elapsed:.1f}s ({done / elapsed:.1f} mensagens/s), {len(failures)} erros, "
+          f"latência mediana {latencies[len(latencies) // 2] * 1000:.0f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.0f}ms")
+    machine_per_message = machine / max(done, 1)
+    print(f"📊 {workers} worker(s): CPU por mensagem {cpu_per_message * 1000:.1f}ms na API, "
+          f"{machine_per_message * 1000:.1f}ms na máquina (teto da máquina "
+          f"{os.cpu_count() / machine_per_message:.0f} mensagens/s em {os.cpu_count()} núcleo(s); "
+          f"por worker com núcleo próprio {1 / cpu_per_message:.0f} mensagens/s)")
+    return done / elapsed, ok and not failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--rate-per-worker', type=float, default=40,
+                        help='mensagens/s oferecidas por worker')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--race', type=int, default=20)
+    parser.add_argument('--burst', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--db-connections', type=int, default=40,
+                        help='conexões ao Postgres somando todos os processos')
+    parser.add_argument('--warmup', type=float, default=8,
+                        help='segundos para os workers subirem')
+    args = parser.parse_args()
+
+    results = {}
+    try:
+        for workers in args.workers:
+            results[workers] = run_level(args, workers)
+    finally:
+        cleanup()
+    base = results[args.workers[0]][0]
+    print(f"📊 Escala ({os.cpu_count()} núcleo(s)): " + ", ".join(
+        f"{workers} → {rate / base:.2f}x" for workers, (rate, _) in results.items()))
+    if not all(ok for _, ok in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark do PDF de uma conversa longa gerado pelos jobs em pool de processos.
+
+Cria uma conversa com --messages mensagens e mede:
+- o tempo de renderização no próprio processo (quanto o event loop ficava
+  bloqueado quando o PDF era gerado dentro do handler);
+- submit -> polling -> download do primeiro PDF, com a latência de uma
+  rota leve da API medida em paralelo durante a renderização;
+- o segundo pedido da mesma versão, servido do cache.
+
+Com a API rodando:
+
+    python scripts/bench_pdf_jobs.py --messages 2000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import text  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+from app.db import crud, models  # noqa: E402
+from app.core import pdf_reports, report_format  # noqa: E402
+
+PREFIX = 'bench-pdf-'
+
+
+def seed(db, messages):
+    conversation_id = db.execute(text("""
+        INSERT INTO conversations (id, user_number, start_time, last_message_at, business_type, status)
+        VALUES (gen_random_uuid(), :user, now() - interval '1 day', now(), 'delivery', 'closed')
+        RETURNING id
+    """), {'user': f'{PREFIX}0'}).scalar()
+    db.execute(text("""
+        INSERT INTO messages (id, conversation_id, user_number, content, from_user, business_type, timestamp)
+        SELECT gen_random_uuid(), :conversation, :user,
+               'Mensagem ' || n || ': gostaria de saber o horário de funcionamento e as opções '
+               || 'de entrega para o meu bairro, e se aceitam cartão & pix <hoje>.',
+               n % 2 = 0, 'delivery', now() - interval '1 day' + (n || ' seconds')::interval
+        FROM generate_series(1, :total) AS n
+    """), {'conversation': conversation_id, 'user': f'{PREFIX}0', 'total': messages})
+    db.commit()
+    return str(conversation_id)
+
+
+def cleanup(db):
+    db.execute(text("""
+        DELETE FROM messages WHERE conversation_id IN
+            (SELECT id FROM conversations WHERE user_number LIKE :like)
+    """), {'like': f'{PREFIX}%'})
+    db.execute(text("DELETE FROM conversations WHERE user_number LIKE :like"),
+               {'like': f'{PREFIX}%'})
+    db.commit()
+
+
+def render_in_process(db, conversation_id):
+    conversation = crud.get_conversation_by_id(db, conversation_id)
+    messages = [tuple(row) for row in db.query(
+        models.Message.from_user, models.Message.content, models.Message.timestamp
+    ).filter(models.Message.conversation_id == conversation.id).order_by(models.Message.timestamp)]
+    started = time.perf_counter()
+    size = len(pdf_reports.build_pdf(report_format.conversation_snapshot(conversation), messages))
+    return time.perf_counter() - started, size
+
+
+async def probe(client, stop, latencies):
+    """Latência de uma rota leve enquanto o PDF é gerado"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get('/admin/metrics/db')
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.02)
+
+
+async def fetch_via_job(client, conversation_id):
+    started = time.perf_counter()
+    job = (await client.post(f'/admin/conversations/{conversation_id}/pdf-jobs')).json()
+    submitted = job['status']
+    while job['status'] == 'running':
+        await asyncio.sleep(0.1)
+        job = (await client.get(f"/admin/pdf-jobs/{job['job_id']}")).json()
+    if job['status'] != 'done':
+        raise RuntimeError(f"Job falhou: {job}")
+    response = await client.get(f"/admin/pdf-jobs/{job['job_id']}/download")
+    response.raise_for_status()
+    return time.perf_counter() - started, len(response.content), submitted
+
+
+async def run(url, conversation_id):
+    async with httpx.AsyncClient(base_url=url, timeout=300) as client:
+        stop, latencies = asyncio.Event(), []
+        probe_task = asyncio.create_task(probe(client, stop, latencies))
+        first = await fetch_via_job(client, conversation_id)
+        stop.set()
+        await probe_task
+        cached = await fetch_via_job(client, conversation_id)
+    return first, cached, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--messages', type=int, default=2000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        conversation_id = seed(db, args.messages)
+        elapsed, size = render_in_process(db, conversation_id)
+        print(f"📊 Renderização no processo: {elapsed:.2f}s ({size / 1024:.0f}KB) "
+              f"— tempo que o event loop ficava bloqueado")
+
+        first, cached, latencies = asyncio.run(run(args.url, conversation_id))
+        print(f"📊 1º pedido (job {first[2]}): {first[0]:.2f}s até o download ({first[1] / 1024:.0f}KB)")
+        if latencies:
+            print(f"📊 Rota leve durante a renderização: {len(latencies)} chamadas, "
+                  f"máx. {max(latencies):.0f}ms, mediana {sorted(latencies)[len(latencies) // 2]:.0f}ms")
+        print(f"📊 2º pedido (job {cached[2]}): {cached[0] * 1000:.0f}ms")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Micro-benchmark da montagem do system prompt por mensagem:
+renderização completa (comportamento anterior) vs. prompt pré-compilado.
+
+    python scripts/bench_prompt_assembly.py --iterations 20000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core import prompts  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    for business_type in ['delivery', 'mechanic', 'pharmacy', 'unknown']:
+        assert prompts.render_system_prompt(business_type) == \
+            prompts.get_system_prompt(business_type)
+
+        rendered = timeit.timeit(
+            lambda: prompts.render_system_prompt(business_type),
+            number=args.iterations)
+        cached = timeit.timeit(
+            lambda: prompts.get_system_prompt(business_type),
+            number=args.iterations)
+
+        print(f"{business_type:<10} renderizado={rendered / args.iterations * 1e6:8.2f}µs "
+              f"compilado={cached / args.iterations * 1e6:6.3f}µs "
+              f"({rendered / cached:,.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
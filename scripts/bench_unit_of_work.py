@@ -0,0 +1,150 @@
+"""
+Idas ao banco, commits e WAL por mensagem do webhook, com e sem a unidade
+de trabalho (WEBHOOK_UNIT_OF_WORK).
+
+Processa --users clientes com --messages mensagens cada, no próprio
+processo (mesmo caminho do /webhook), uma vez em cada modo, e mede por
+mensagem: comandos SQL, commits, registros/bytes de WAL e sincronizações
+do WAL (pg_stat_wal) e transações confirmadas (pg_stat_database). Depois
+confere que os dois modos gravaram as mesmas mensagens e contadores.
+Remove os dados ao final.
+
+Com o servidor falso da OpenAI rodando (scripts/fake_openai_server.py):
+
+    OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=x \\
+        python scripts/bench_unit_of_work.py --users 50 --messages 10
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import event, text  # noqa: E402
+from app.db.session import AsyncSessionLocal, SessionLocal, async_engine  # noqa: E402
+from app.db import models  # noqa: E402
+from app.core import conversation_cache, history, message_handler  # noqa: E402
+
+PREFIX = 'bench-uow-'
+COUNTERS = ('user_message_count', 'bot_message_count', 'response_count')
+
+statements = Counter()
+
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    verb = statement.lstrip().split(None, 1)[0].upper()
+    statements[verb] += 1
+
+
+def count_commit(conn):
+    statements['COMMIT'] += 1
+
+
+def database_stats():
+    """WAL e commits do banco inteiro até agora"""
+    with SessionLocal() as db:
+        wal = db.execute(text(
+            "SELECT wal_records, wal_bytes, wal_sync FROM pg_stat_wal")).one()
+        commits = db.execute(text(
+            "SELECT xact_commit FROM pg_stat_database WHERE datname = current_database()")).scalar()
+    return {'wal_records': wal.wal_records, 'wal_bytes': int(wal.wal_bytes),
+            'wal_sync': wal.wal_sync, 'xact_commit': commits}
+
+
+async def handle(user_number, content):
+    """Mesmo caminho do POST /webhook"""
+    async with AsyncSessionLocal() as db:
+        await message_handler.process_message(db, user_number, content)
+
+
+async def run(users, messages, label):
+    conversation_cache.clear()
+    statements.clear()
+    before = database_stats()
+    started = time.perf_counter()
+    for turn in range(messages):
+        for n in range(users):
+            await handle(f'{PREFIX}{label}-{n}', f'Mensagem {turn}: quais sabores de pizza?')
+    elapsed = time.perf_counter() - started
+
+    # Conexões fechadas publicam as estatísticas pendentes de WAL
+    await async_engine.dispose()
+    await asyncio.sleep(1)
+    after = database_stats()
+
+    total = users * messages
+    wal = {key: (after[key] - before[key]) / total for key in after}
+    print(f"📊 {label}: {statements['SELECT'] / total:.2f} SELECT, "
+          f"{(statements['UPDATE'] + statements['INSERT']) / total:.2f} UPDATE/INSERT, "
+          f"{statements['COMMIT'] / total:.2f} commits por mensagem")
+    print(f"📊 {label}: WAL {wal['wal_records']:.1f} registros, {wal['wal_bytes']:,.0f} bytes, "
+          f"{wal['wal_sync']:.2f} fsync e {wal['xact_commit']:.2f} transações por mensagem")
+    print(f"📊 {label}: {total} mensagens em {elapsed:.1f}s ({total / elapsed:.1f} mensagens/s)")
+
+
+def recorded(label):
+    """Mensagens e contadores gravados por cliente"""
+    with SessionLocal() as db:
+        conversations = db.query(models.Conversation).filter(
+            models.Conversation.user_number.like(f'{PREFIX}{label}-%')).all()
+        result = {}
+        for conversation in conversations:
+            contents = [(m.from_user, m.content) for m in db.query(models.Message).filter(
+                models.Message.conversation_id == conversation.id
+            ).order_by(models.Message.timestamp)]
+            result[conversation.user_number.split('-')[-1]] = (
+                contents, [getattr(conversation, c) for c in COUNTERS],
+                conversation.business_type, conversation.llm_calls)
+    return result
+
+
+def check(users):
+    legacy, unit = recorded('padrao'), recorded('unidade')
+    different = [n for n in legacy if legacy[n] != unit.get(n)]
+    if len(legacy) != users or len(unit) != users or different:
+        n = different[0] if different else None
+        print(f"❌ Modos gravaram dados diferentes ({len(different)} clientes). Ex.: {n}\n"
+              f"   padrão  {legacy.get(n)}\n   unidade {unit.get(n)}")
+        sys.exit(1)
+    print(f"✅ Mesmas mensagens, contadores, tipo de negócio e consumo nos dois modos "
+          f"({users} clientes)")
+
+
+def cleanup():
+    with SessionLocal() as db:
+        db.execute(text("""
+            DELETE FROM messages WHERE conversation_id IN
+                (SELECT id FROM conversations WHERE user_number LIKE :like)
+        """), {'like': f'{PREFIX}%'})
+        db.execute(text("DELETE FROM conversations WHERE user_number LIKE :like"),
+                   {'like': f'{PREFIX}%'})
+        db.commit()
+
+
+async def main(args):
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', count_statement)
+    event.listen(async_engine.sync_engine, 'commit', count_commit)
+    # Sem resumos em segundo plano durante a medição
+    history.HISTORY_SUMMARY_BATCH = 10 ** 6
+
+    message_handler.WEBHOOK_UNIT_OF_WORK = False
+    await run(args.users, args.messages, 'padrao')
+    message_handler.WEBHOOK_UNIT_OF_WORK = True
+    await run(args.users, args.messages, 'unidade')
+    await async_engine.dispose()
+
+    check(args.users)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=10)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    finally:
+        cleanup()
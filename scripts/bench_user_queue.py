@@ -0,0 +1,124 @@
+"""
+Rajadas de mensagens do mesmo cliente no /webhook (fila por cliente).
+
+Cada um dos --users clientes (novos) manda --burst mensagens seguidas, com
+--gap-ms entre elas, como o WhatsApp entrega mensagens curtas em sequência;
+todos os clientes ao mesmo tempo. Mede as chamadas à OpenAI por rajada
+(GET /admin/metrics/llm), as conversas abertas por cliente (mais de uma =
+corrida em get_or_create_conversation), as mensagens gravadas e as
+respostas enviadas. Remove os dados ao final.
+
+Suba a API apontando para o servidor falso com latência
+(FAKE_OPENAI_DELAY=1.0 uvicorn scripts.fake_openai_server:app --port 9000)
+e compare as configurações da fila:
+
+    USER_QUEUE_ENABLED=false uvicorn main:app
+    uvicorn main:app                               # só ordenação
+    USER_QUEUE_DEBOUNCE_MS=800 uvicorn main:app    # rajada em uma resposta
+
+    python scripts/bench_user_queue.py --users 20 --burst 4 --gap-ms 300
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import func, text  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+from app.db import models  # noqa: E402
+
+PREFIX = 'bench-queue-'
+BURST = ['Oi', 'Quero uma pizza', 'De calabresa', 'Pode entregar?', 'Aceita cartão?']
+
+
+async def send_burst(client, user_number, burst, gap, replies, latencies):
+    async def send(n):
+        await asyncio.sleep(gap * n)
+        started = time.perf_counter()
+        response = await client.post('/webhook', json={
+            'user_number': user_number,
+            'message': BURST[n % len(BURST)]
+        })
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+        if response.json().get('reply'):
+            replies.append(user_number)
+
+    await asyncio.gather(*(send(n) for n in range(burst)))
+
+
+def recorded():
+    with SessionLocal() as db:
+        conversations = dict(db.query(
+            models.Conversation.user_number, func.count(models.Conversation.id)
+        ).filter(models.Conversation.user_number.like(f'{PREFIX}%'),
+                 models.Conversation.status == 'open'
+                 ).group_by(models.Conversation.user_number).all())
+        messages = dict(db.query(
+            models.Message.from_user, func.count(models.Message.id)
+        ).filter(models.Message.user_number.like(f'{PREFIX}%')
+                 ).group_by(models.Message.from_user).all())
+    return conversations, messages
+
+
+def cleanup():
+    with SessionLocal() as db:
+        db.execute(text("""
+            DELETE FROM messages WHERE conversation_id IN
+                (SELECT id FROM conversations WHERE user_number LIKE :like)
+        """), {'like': f'{PREFIX}%'})
+        db.execute(text("DELETE FROM conversations WHERE user_number LIKE :like"),
+                   {'like': f'{PREFIX}%'})
+        db.commit()
+
+
+async def run(args):
+    replies, latencies = [], []
+    users = [f'{PREFIX}{uuid.uuid4().hex[:12]}' for _ in range(args.users)]
+    async with httpx.AsyncClient(base_url=args.url, timeout=120) as client:
+        queue = (await client.get('/admin/metrics/queue')).json()
+        before = (await client.get('/admin/metrics/llm')).json()['llm_calls']
+        started = time.perf_counter()
+        await asyncio.gather(*(send_burst(client, user, args.burst, args.gap_ms / 1000,
+                                          replies, latencies) for user in users))
+        elapsed = time.perf_counter() - started
+        llm_calls = (await client.get('/admin/metrics/llm')).json()['llm_calls'] - before
+
+    conversations, messages = recorded()
+    duplicated = sum(1 for count in conversations.values() if count > 1)
+    print(f"📊 Fila: habilitada={queue['enabled']} debounce={queue['debounce_ms']}ms")
+    print(f"📊 {args.users} rajadas de {args.burst} mensagens em {elapsed:.1f}s: "
+          f"{llm_calls / args.users:.2f} chamadas à OpenAI e {len(replies) / args.users:.2f} "
+          f"respostas por rajada, latência mediana {statistics.median(latencies):.2f}s")
+    print(f"📊 Mensagens gravadas: {messages.get(True, 0)} do cliente, "
+          f"{messages.get(False, 0)} do bot")
+    if duplicated or messages.get(True, 0) != args.users * args.burst:
+        print(f"❌ {duplicated} clientes com conversas abertas duplicadas; "
+              f"{messages.get(True, 0)} de {args.users * args.burst} mensagens do cliente gravadas")
+    else:
+        print("✅ Uma conversa aberta por cliente e todas as mensagens gravadas")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--burst', type=int, default=4)
+    parser.add_argument('--gap-ms', type=int, default=300)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    finally:
+        cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Verifica que o polling do dashboard não gera escrita no banco.
+
+Cria conversas abertas já inativas (que a listagem antiga encerrava a cada
+GET), dispara requisições concorrentes aos endpoints de leitura do
+dashboard e compara os contadores de linhas inseridas/atualizadas/removidas
+do Postgres (pg_stat_user_tables) em conversations e messages antes e
+depois. Também confere que essas conversas aparecem como 'closed' na
+listagem mesmo sem o UPDATE. Sai com código 1 se houver escrita.
+
+Suba a API sem o job de expiração rodando durante o teste:
+
+    EXPIRY_INTERVAL_SECONDS=3600 uvicorn main:app
+    python scripts/check_admin_reads_no_writes.py --clients 20 --requests 10
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import text  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+from app.db import crud, models  # noqa: E402
+
+PREFIX = 'check-reads-'
+TABLES = ('conversations', 'messages')
+
+READ_PATHS = [
+    '/admin/conversations?fields=id,user_number,status,business_type&limit=50',
+    '/admin/conversations?status=open&count=estimate',
+    '/admin/messages/all?format=columns&include_content=false&limit=1000',
+    '/admin/reports/messages?granularity=hour_of_day',
+]
+
+
+def write_counters(db):
+    # Estatísticas pendentes da própria sessão não contam; força leitura nova
+    db.execute(text("SELECT pg_stat_clear_snapshot()"))
+    row = db.execute(text("""
+        SELECT coalesce(sum(n_tup_ins + n_tup_upd + n_tup_del), 0)
+        FROM pg_stat_user_tables WHERE relname = ANY(:tables)
+    """), {'tables': list(TABLES)}).scalar()
+    db.commit()
+    return int(row)
+
+
+def seed_inactive(db, total):
+    stale = datetime.now(timezone.utc) - \
+        timedelta(minutes=crud.INACTIVITY_MINUTES + 30)
+    db.bulk_insert_mappings(models.Conversation, [
+        {'user_number': f'{PREFIX}{i}', 'status': 'open', 'business_type': 'unknown',
+         'start_time': stale, 'last_message_at': stale}
+        for i in range(total)
+    ])
+    db.commit()
+
+
+def cleanup(db):
+    db.query(models.Conversation).filter(
+        models.Conversation.user_number.like(f'{PREFIX}%')
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+async def poll(url, clients, requests_per_client):
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+
+        async def worker(offset):
+            for i in range(requests_per_client):
+                path = READ_PATHS[(offset + i) % len(READ_PATHS)]
+                (await client.get(path)).raise_for_status()
+
+        await asyncio.gather(*(worker(i) for i in range(clients)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=10)
+    parser.add_argument('--inactive', type=int, default=50)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        seed_inactive(db, args.inactive)
+        time.sleep(1.5)
+        before = write_counters(db)
+
+        started = time.perf_counter()
+        asyncio.run(poll(args.url, args.clients, args.requests))
+        elapsed = time.perf_counter() - started
+
+        # O Postgres publica as estatísticas das outras sessões com atraso
+        time.sleep(1.5)
+        writes = write_counters(db)
+        writes -= before
+
+        listed = httpx.get(f'{args.url}/admin/conversations', params={
+            'user_number': f'{PREFIX}0', 'fields': 'status'}).json()['conversations']
+        still_open = db.query(models.Conversation).filter(
+            models.Conversation.user_number.like(f'{PREFIX}%'),
+            models.Conversation.status == 'open').count()
+
+        print(f"📊 {args.clients * args.requests} leituras em {elapsed:.2f}s")
+        print(f"📊 Linhas escritas em {', '.join(TABLES)}: {writes}")
+        print(f"📊 Conversas inativas ainda 'open' no banco: {still_open}/{args.inactive}; "
+              f"status na listagem: {listed[0]['status'] if listed else None}")
+    finally:
+        cleanup(db)
+        db.close()
+
+    if writes or not listed or listed[0]['status'] != 'closed':
+        print("❌ Leituras do dashboard geraram escrita ou status incorreto")
+        sys.exit(1)
+    print("✅ Leituras do dashboard sem escrita no banco")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Avaliação offline do classificador local contra os rótulos da OpenAI.
+
+Separa as conversas já classificadas em treino/teste, treina o classificador
+local no treino e, para cada mensagem de cliente do teste, compara a
+previsão (com o histórico até ali) ao business_type gravado na conversa.
+
+    python scripts/evaluate_business_classifier.py --threshold 0.9
+"""
+
+import argparse
+import os
+import sys
+import zlib
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.db.session import SessionLocal  # noqa: E402
+from app.db import models  # noqa: E402
+from app.core.business_classifier import NaiveBayesBusinessClassifier  # noqa: E402
+
+
+def load_conversations(db):
+    rows = db.query(
+        models.Message.conversation_id,
+        models.Message.content,
+        models.Conversation.business_type
+    ).join(
+        models.Conversation, models.Message.conversation_id == models.Conversation.id
+    ).filter(
+        models.Message.from_user == True,  # noqa: E712
+        (models.Conversation.business_type != 'unknown') |
+        (models.Conversation.status == 'closed')
+    ).order_by(models.Message.conversation_id, models.Message.timestamp).all()
+
+    conversations = defaultdict(lambda: {'label': None, 'texts': []})
+    for conversation_id, content, business_type in rows:
+        conversations[conversation_id]['label'] = business_type
+        conversations[conversation_id]['texts'].append(content)
+    return conversations
+
+
+def in_test_split(conversation_id, test_ratio):
+    return zlib.crc32(str(conversation_id).encode()) % 100 < test_ratio * 100
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threshold', type=float, default=0.9)
+    parser.add_argument('--test-ratio', type=float, default=0.2)
+    parser.add_argument('--profiles-only', action='store_true',
+                        help='avalia só o vocabulário dos perfis, sem histórico')
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        conversations = load_conversations(db)
+    finally:
+        db.close()
+
+    model = NaiveBayesBusinessClassifier().seed_from_profiles()
+    test_set = []
+    for conversation_id, data in conversations.items():
+        if in_test_split(conversation_id, args.test_ratio):
+            test_set.append(data)
+        elif not args.profiles_only:
+            for text in data['texts']:
+                model.fit_text(text, data['label'])
+
+    total = confident = confident_correct = argmax_correct = 0
+    for data in test_set:
+        for i in range(len(data['texts'])):
+            predicted, confidence = model.predict(data['texts'][:i + 1])
+            total += 1
+            argmax_correct += predicted == data['label']
+            if predicted != 'unknown' and confidence >= args.threshold:
+                confident += 1
+                confident_correct += predicted == data['label']
+
+    if not total:
+        print("⚠️ Nenhuma mensagem rotulada encontrada")
+        return
+
+    print(f"📊 Conversas de teste: {len(test_set)} | mensagens: {total}")
+    print(f"Acurácia (argmax):            {argmax_correct / total:.3f}")
+    print(f"Acurácia quando confiante:    "
+          f"{(confident_correct / confident) if confident else 0:.3f}")
+    print(f"Chamadas evitadas (>= {args.threshold}): {confident / total:.3f}")
+
+
+if __name__ == '__main__':
+    main()
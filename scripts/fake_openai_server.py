@@ -0,0 +1,97 @@
+"""
+Servidor local que imita o endpoint de chat completions da OpenAI, com
+latência configurável, para testes de carga sem custo.
+
+    FAKE_OPENAI_DELAY=1.0 uvicorn scripts.fake_openai_server:app --port 9000
+    OPENAI_BASE_URL=http://localhost:9000/v1 uvicorn main:app
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+DELAY_SECONDS = float(os.getenv('FAKE_OPENAI_DELAY', '1.0'))
+
+app = FastAPI()
+
+
+def fake_content(messages):
+    system_prompt = messages[0].get('content', '') if messages else ''
+    if 'classificador' in system_prompt:
+        return 'delivery'
+    if 'resumo de um atendimento' in system_prompt:
+        return 'Cliente pediu informações sobre pizzas e sabores disponíveis.'
+    reply = {
+        "reply": "Olá! Temos pizzas de vários sabores 🍕. Calabresa, marguerita e portuguesa saem por R$35,00. Quer fazer o pedido?",
+        "sentiment": "NEUTRO",
+        "score": 0.0
+    }
+    if '"business_type"' in system_prompt:
+        reply["business_type"] = "delivery"
+    return json.dumps(reply, ensure_ascii=False)
+
+
+def fake_usage(messages, content):
+    # ~4 caracteres por token, para acompanhar o tamanho do prompt
+    prompt_tokens = sum(len(m.get('content') or '') for m in messages) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(content) // 4,
+        "total_tokens": prompt_tokens + len(content) // 4,
+        "prompt_tokens_details": {
+            "cached_tokens": 1024 if prompt_tokens >= 1024 else 0
+        }
+    }
+
+
+async def stream_chunks(completion_id, model, messages, content):
+    """Entrega o conteúdo em pedaços, como o stream da OpenAI"""
+    await asyncio.sleep(DELAY_SECONDS / 4)
+    piece_delay = DELAY_SECONDS * 0.75 / max(len(content) / 8, 1)
+    for i in range(0, len(content), 8):
+        chunk = {
+            "id": completion_id, "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {"content": content[i:i + 8]},
+                         "finish_reason": None}]
+        }
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        await asyncio.sleep(piece_delay)
+    final = {
+        "id": completion_id, "object": "chat.completion.chunk",
+        "created": int(time.time()), "model": model,
+        "choices": [], "usage": fake_usage(messages, content)
+    }
+    yield f"data: {json.dumps(final)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post('/v1/chat/completions')
+async def chat_completions(payload: dict):
+    messages = payload.get('messages', [])
+    content = fake_content(messages)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = payload.get('model', 'gpt-4o')
+
+    if payload.get('stream'):
+        return StreamingResponse(
+            stream_chunks(completion_id, model, messages, content),
+            media_type='text/event-stream')
+
+    await asyncio.sleep(DELAY_SECONDS)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": fake_usage(messages, content)
+    }
@@ -0,0 +1,112 @@
+"""
+Verifica o parser tolerante de respostas contra o corpus de saídas malformadas
+(scripts/data/malformed_replies.jsonl) e contra variações geradas a partir de
+respostas válidas: cercas de código, texto extra e truncamento em cada
+posição. Sai com código 1 se algum caso falhar.
+
+    python scripts/fuzz_response_parser.py --seed 42 --samples 500
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.response_parser import parse_reply  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'malformed_replies.jsonl')
+
+VALID_REPLIES = [
+    "Olá! Temos pizzas de vários sabores 🍕. Quer fazer o pedido?",
+    "A troca de óleo sai por R$120,00 e leva cerca de 40 minutos.",
+    "Temos dipirona \"genérica\" em gotas e comprimidos.",
+    "Seu pedido foi anotado:\n- 1 calabresa\n- 1 refrigerante",
+    "Use o cupom {PIZZA10} até domingo!",
+]
+
+PREFIXES = ['', 'Claro! ', 'Aqui está:\n', '```json\n', '```\n']
+SUFFIXES = ['', '\n```', '\n\nEspero ter ajudado!', ' }', '\n{"reply": "outra"}']
+
+
+def check_corpus():
+    failures = []
+    with open(CORPUS_PATH, encoding='utf-8') as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    for case in cases:
+        try:
+            data, outcome = parse_reply(case['raw'])
+        except Exception as e:
+            failures.append((case['name'], f'exceção {e!r}'))
+            continue
+        reply = data.get('reply') if data else None
+        sentiment = data.get('sentiment') if data else None
+        if reply != case['reply']:
+            failures.append((case['name'], f'reply {reply!r} != {case["reply"]!r}'))
+        elif sentiment != case['sentiment']:
+            failures.append((case['name'], f'sentiment {sentiment!r} != {case["sentiment"]!r}'))
+        elif data is not None and not -1.0 <= data['score'] <= 1.0:
+            failures.append((case['name'], f'score fora do intervalo: {data["score"]}'))
+
+    return len(cases), failures
+
+
+def check_generated(samples, rng):
+    """Nenhuma variação pode lançar exceção ou devolver reply vazio"""
+    failures = []
+    for _ in range(samples):
+        reply = rng.choice(VALID_REPLIES)
+        payload = json.dumps({
+            "reply": reply,
+            "sentiment": rng.choice(['POSITIVO', 'NEUTRO', 'NEGATIVO']),
+            "score": round(rng.uniform(-1, 1), 2)
+        }, ensure_ascii=rng.random() < 0.5)
+        if rng.random() < 0.3:
+            payload = payload.replace('"', "'")
+
+        raw = rng.choice(PREFIXES) + payload + rng.choice(SUFFIXES)
+        cut = rng.randint(len(raw) // 2, len(raw))
+        if rng.random() < 0.5:
+            raw = raw[:cut]
+
+        try:
+            data, _ = parse_reply(raw)
+        except Exception as e:
+            failures.append((repr(raw), f'exceção {e!r}'))
+            continue
+        if not data or not data.get('reply'):
+            failures.append((repr(raw), 'reply vazio'))
+        elif '"' not in reply and "'" in payload and data['reply'] not in (reply, raw.strip()):
+            # Aspas simples em texto sem aspas internas devem ser recuperadas
+            if not reply.startswith(data['reply']):
+                failures.append((repr(raw), f'reply {data["reply"]!r}'))
+
+    return samples, failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--samples', type=int, default=500)
+    args = parser.parse_args()
+
+    total_corpus, corpus_failures = check_corpus()
+    total_generated, generated_failures = check_generated(
+        args.samples, random.Random(args.seed))
+
+    print(f"📊 Corpus: {total_corpus - len(corpus_failures)}/{total_corpus} ok")
+    print(f"📊 Variações geradas: {total_generated - len(generated_failures)}/{total_generated} ok")
+
+    for name, reason in corpus_failures + generated_failures:
+        print(f"❌ {name}: {reason}")
+
+    if corpus_failures or generated_failures:
+        sys.exit(1)
+    print("✅ Parser tolerante aprovado")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Teste de carga do /webhook com níveis crescentes de concorrência.
+
+Suba a API apontando para o servidor falso (scripts/fake_openai_server.py)
+e rode:
+
+    python scripts/load_test_webhook.py --url http://localhost:8000/webhook --levels 1 10 50 200
+
+Com --pool-url, mostra após cada nível o pico de conexões em uso e a espera
+por conexão do pool async (GET /admin/metrics/db).
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+import httpx
+
+
+async def send(client, url, latencies):
+    payload = {
+        "user_number": f"load-{uuid.uuid4().hex[:12]}",
+        "message": "Quais sabores de pizza vocês têm?"
+    }
+    started = time.perf_counter()
+    response = await client.post(url, json=payload)
+    response.raise_for_status()
+    latencies.append(time.perf_counter() - started)
+
+
+async def run_level(url, concurrency, requests_per_worker):
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+
+        async def worker():
+            for _ in range(requests_per_worker):
+                await send(client, url, latencies)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    throughput = len(latencies) / elapsed
+    print(f"concorrência={concurrency:<5} requisições={len(latencies):<6} "
+          f"throughput={throughput:8.2f} req/s "
+          f"latência média={statistics.mean(latencies):6.2f}s")
+
+
+def print_pool(pool_url):
+    pool = httpx.get(pool_url).json()['async']
+    print(f"    pool async: pico em uso={pool['max_checked_out']} "
+          f"overflow={pool['overflow']} espera média={pool['wait_ms_avg']}ms "
+          f"máx={pool['wait_ms_max']}ms timeouts={pool['timeouts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000/webhook')
+    parser.add_argument('--levels', type=int, nargs='+',
+                        default=[1, 10, 50, 200])
+    parser.add_argument('--requests-per-worker', type=int, default=3)
+    parser.add_argument('--pool-url', default=None,
+                        help='ex.: http://localhost:8000/admin/metrics/db')
+    args = parser.parse_args()
+
+    for level in args.levels:
+        asyncio.run(run_level(args.url, level, args.requests_per_worker))
+        if args.pool_url:
+            print_pool(args.pool_url)
+
+
+if __name__ == '__main__':
+    main()